@@ -0,0 +1,140 @@
+"""
+对比同步RedisSaver与异步redis checkpointer的每步checkpoint延迟，以及astream期间事件循环被阻塞的时间
+
+用法(在backend目录下执行，需要可用的redis)：
+    python -m benchmark.checkpoint_latency_benchmark --steps 8 --runs 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Annotated
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.redis import RedisSaver
+from langgraph.constants import START, END
+from langgraph.graph import StateGraph, add_messages
+
+from config import Config
+from service.checkpoint.async_redis_checkpointer import create_async_redis_checkpointer
+
+
+@dataclass
+class BenchmarkState:
+    messages: Annotated[list, add_messages] = field(default_factory=list)
+    step: int = 0
+
+
+class TimedSaver(BaseCheckpointSaver):
+    """
+    记录每次put/aput耗时的代理
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.put_seconds = []
+
+    def get_tuple(self, config):
+        return self.inner.get_tuple(config)
+
+    async def aget_tuple(self, config):
+        return await self.inner.aget_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        try:
+            return self.inner.put(config, checkpoint, metadata, new_versions)
+        finally:
+            self.put_seconds.append(time.perf_counter() - start)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        try:
+            return await self.inner.aput(config, checkpoint, metadata, new_versions)
+        finally:
+            self.put_seconds.append(time.perf_counter() - start)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self.inner.put_writes(config, writes, task_id, task_path)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+
+def create_graph(steps: int, checkpointer: BaseCheckpointSaver):
+    builder = StateGraph(BenchmarkState)
+
+    def make_node(i):
+        async def node(state: BenchmarkState):
+            return {"messages": [AIMessage(content=f"第{i}步的输出" * 50)], "step": state.step + 1}
+        return node
+
+    previous = START
+    for i in range(steps):
+        builder.add_node(f"step_{i}", make_node(i))
+        builder.add_edge(previous, f"step_{i}")
+        previous = f"step_{i}"
+    builder.add_edge(previous, END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list):
+    # 每1ms唤醒一次，实际唤醒延迟即事件循环被阻塞的时间
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def run_case(name: str, saver: BaseCheckpointSaver, steps: int, runs: int):
+    timed = TimedSaver(saver)
+    graph = create_graph(steps, timed)
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+
+    run_seconds = []
+    for _ in range(runs):
+        config = {"configurable": {"thread_id": f"benchmark-{uuid.uuid4()}"}}
+        start = time.perf_counter()
+        async for _ in graph.astream({"messages": [("user", "benchmark")]}, config, stream_mode="updates"):
+            pass
+        run_seconds.append(time.perf_counter() - start)
+
+    stop.set()
+    await lag_task
+
+    puts = sorted(timed.put_seconds)
+    print(f"[{name}] puts={len(puts)} "
+          f"avg={statistics.mean(puts) * 1000:.2f}ms "
+          f"p50={puts[len(puts) // 2] * 1000:.2f}ms "
+          f"p95={puts[int(len(puts) * 0.95)] * 1000:.2f}ms "
+          f"run_avg={statistics.mean(run_seconds) * 1000:.1f}ms "
+          f"loop_lag_max={max(lags) * 1000:.2f}ms "
+          f"loop_lag_total={sum(lags) * 1000:.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default=Config.REDIS_URL)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    sync_saver = RedisSaver(args.redis_url)
+    sync_saver.setup()
+    await run_case("sync RedisSaver", sync_saver, args.steps, args.runs)
+
+    async_saver = create_async_redis_checkpointer(args.redis_url)
+    await run_case("async redis checkpointer", async_saver, args.steps, args.runs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+对比checkpoint序列化方式的每个checkpoint字节数与编解码耗时
+
+用法(在backend目录下执行)：
+    # 使用mock目录下真实的工具返回数据构造的多轮会话
+    python -m benchmark.checkpoint_serde_benchmark --turns 10
+    # 使用redis中已有会话的最新checkpoint
+    python -m benchmark.checkpoint_serde_benchmark --thread-ids session1,session2
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from config import Config
+from model.query_data_task_detail import DEFAULT_TASK_TEMPLATE
+from service.checkpoint.compact_serializer import CompactCheckpointSerializer
+
+MOCK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mock")
+
+
+def load_tool_payloads() -> dict[str, str]:
+    payloads = {}
+    for file_name in sorted(os.listdir(MOCK_DIR)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(MOCK_DIR, file_name), encoding="utf-8") as f:
+                payloads[file_name[:-5]] = f.read()
+    return payloads
+
+
+def build_conversation_checkpoints(turns: int) -> list[dict]:
+    """
+    按轮次构造会话的channel值，每轮包含提问、工具调用、工具返回和回答
+    :return: 每轮结束时的channel值
+    """
+    payloads = load_tool_payloads()
+    messages = []
+    checkpoints = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"执行任务：查询昨天各组员工的效率，第{turn}次", id=str(uuid.uuid4())))
+        tool_calls = [{"name": name, "args": {"workDate": "2025-12-10"}, "id": f"call_{turn}_{name}"}
+                      for name in payloads.keys()]
+        messages.append(AIMessage(content="", tool_calls=tool_calls, id=str(uuid.uuid4())))
+        for name, payload in payloads.items():
+            messages.append(ToolMessage(content=payload, tool_call_id=f"call_{turn}_{name}", name=name, id=str(uuid.uuid4())))
+        messages.append(AIMessage(content="| 组别 | 员工 | 效率 |\n|---|---|---|\n" + "| A组 | 张三 | 98% |\n" * 20,
+                                  id=str(uuid.uuid4())))
+        checkpoints.append({
+            "messages": list(messages),
+            "task_detail": DEFAULT_TASK_TEMPLATE,
+            "rag_docs": [Document(page_content="员工效率=产出工时/出勤工时" * 20, metadata={"source": "efficiency.md"})],
+            "intent_type": "execute",
+            "task_name": "昨日员工效率",
+        })
+    return checkpoints
+
+
+def load_redis_checkpoints(thread_ids: list[str]) -> list[dict]:
+    from service.checkpoint.async_redis_checkpointer import create_async_redis_checkpointer
+    checkpointer = create_async_redis_checkpointer(Config.REDIS_URL)
+    checkpoints = []
+    for thread_id in thread_ids:
+        checkpoint_tuple = checkpointer.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+        if checkpoint_tuple is not None:
+            checkpoints.append(checkpoint_tuple.checkpoint["channel_values"])
+    return checkpoints
+
+
+def benchmark(name, serde, checkpoints: list[dict], repeat: int):
+    sizes = []
+    encode_seconds = []
+    decode_seconds = []
+    for channel_values in checkpoints:
+        for _ in range(repeat):
+            size = 0
+            encoded = []
+            start = time.perf_counter()
+            for value in channel_values.values():
+                typed = serde.dumps_typed(value)
+                size += len(typed[1])
+                encoded.append(typed)
+            encode_seconds.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for typed in encoded:
+                serde.loads_typed(typed)
+            decode_seconds.append(time.perf_counter() - start)
+        sizes.append(size)
+
+    print(f"[{name}] bytes/checkpoint avg={statistics.mean(sizes):.0f} max={max(sizes)} "
+          f"encode avg={statistics.mean(encode_seconds) * 1000:.3f}ms "
+          f"decode avg={statistics.mean(decode_seconds) * 1000:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--thread-ids", default=None)
+    args = parser.parse_args()
+
+    if args.thread_ids:
+        checkpoints = load_redis_checkpoints(args.thread_ids.split(","))
+    else:
+        checkpoints = build_conversation_checkpoints(args.turns)
+    print(f"checkpoints={len(checkpoints)}")
+
+    benchmark("json(redis)", JsonPlusRedisSerializer(), checkpoints, args.repeat)
+    benchmark("msgpack", JsonPlusSerializer(), checkpoints, args.repeat)
+    benchmark(f"msgpack+zstd(>={Config.CHECKPOINT_COMPRESS_THRESHOLD_BYTES}B)",
+              CompactCheckpointSerializer(Config.CHECKPOINT_COMPRESS_THRESHOLD_BYTES, Config.CHECKPOINT_COMPRESS_LEVEL),
+              checkpoints, args.repeat)
+    benchmark("msgpack+zstd(all)", CompactCheckpointSerializer(0, Config.CHECKPOINT_COMPRESS_LEVEL), checkpoints, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+用语料校验中文日期表达解析的结果，并统计解析耗时(对比一次llm调用的秒级延迟)
+
+用法(在backend目录下执行)：
+    python -m benchmark.date_expression_benchmark --iterations 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+from util.date_expression_util import resolve_date_expression
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "date_expression_corpus.json")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+    today = date.fromisoformat(corpus["today"])
+    cases = corpus["cases"]
+
+    failures = 0
+    for case in cases:
+        resolved = resolve_date_expression(case["text"], today)
+        actual = (None, None, None) if resolved is None else \
+            (resolved.start.isoformat(), resolved.end.isoformat(), resolved.has_other_conditions())
+        expected = (case["start"], case["end"], case["other_conditions"])
+        if actual != expected:
+            failures += 1
+            print(f"FAIL {case['text']!r}: expected={expected} actual={actual}")
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for case in cases:
+            resolve_date_expression(case["text"], today)
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / (args.iterations * len(cases)) * 1e6
+
+    print(f"cases={len(cases)} passed={len(cases) - failures} failed={failures}")
+    print(f"resolve avg={per_call_us:.1f}us per expression")
+    sys.exit(1 if failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+对比多轮多工具任务执行过程中，省略已使用过的工具返回前后每次调用llm的提示词token数，
+最近一次工具调用的返回不省略
+
+用法(在backend目录下执行)：
+    python -m benchmark.tool_elision_benchmark --turns 3 --steps 4 --node execute_task
+"""
+import argparse
+import uuid
+from dataclasses import replace
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from benchmark.checkpoint_serde_benchmark import load_tool_payloads
+from service.agent.model.state import DataClerkState
+from service.context.prompt_assembler import PromptAssembler
+from util import token_util
+
+
+def build_turn(turn: int, steps: int, payloads: dict[str, str]) -> list[list]:
+    """
+    构造一轮多工具任务：每一步llm调用一个工具并拿到返回
+    :return: 每次调用llm之前本轮的消息
+    """
+    names = list(payloads.keys())
+    messages = [HumanMessage(content=f"执行任务：查询昨天各组员工的效率，第{turn}次", id=str(uuid.uuid4()))]
+    prompts = [list(messages)]
+    for step in range(steps):
+        name = names[step % len(names)]
+        call_id = f"call_{turn}_{step}"
+        messages.append(AIMessage(content="", tool_calls=[{"name": name, "args": {"workDate": "2025-12-10"}, "id": call_id}],
+                                  id=str(uuid.uuid4())))
+        messages.append(ToolMessage(content=payloads[name], tool_call_id=call_id, name=name, id=str(uuid.uuid4())))
+        prompts.append(list(messages))
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--graph", default="data_clerk")
+    parser.add_argument("--node", default="execute_task")
+    args = parser.parse_args()
+
+    payloads = load_tool_payloads()
+    assembler = PromptAssembler(args.graph)
+    policy = assembler.policy_of(args.node)
+    print(f"graph={args.graph} node={args.node} policy={policy}")
+
+    history = []
+    total_before = 0
+    total_after = 0
+    for turn in range(args.turns):
+        for step, turn_messages in enumerate(build_turn(turn, args.steps, payloads)):
+            state = DataClerkState(messages=[*history, *turn_messages])
+            before = token_util.count_message_tokens(assembler.history_with_policy(replace(policy, elide_tool_messages=False), state))
+            after = token_util.count_message_tokens(assembler.history_with_policy(policy, state))
+            total_before += before
+            total_after += after
+            print(f"turn={turn} step={step} prompt_tokens before={before} after={after} saved={before - after}")
+        history.extend(turn_messages)
+        history.append(AIMessage(content="| 组别 | 员工 | 效率 |\n|---|---|---|\n" + "| A组 | 张三 | 98% |\n" * 20,
+                                 id=str(uuid.uuid4())))
+
+    saved_ratio = (total_before - total_after) / total_before if total_before > 0 else 0
+    print(f"total prompt_tokens before={total_before} after={total_after} saved={saved_ratio:.1%}")
+
+
+if __name__ == "__main__":
+    main()
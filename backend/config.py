@@ -7,6 +7,62 @@ class Config:
     EMBEDDING_MODEL_DIMS = 512
     USE_VECTOR_STORE = False
     MESSAGE_MEMORY_USE = "local"
+    # local模式下每个会话保留的最近checkpoint数量
+    MESSAGE_MEMORY_MAX_CHECKPOINTS_PER_THREAD = 10
+    # local模式下会话空闲多久(秒)后从内存淘汰
+    MESSAGE_MEMORY_THREAD_TTL = 6 * 3600
+    # local模式下所有会话checkpoint占用内存的上限(字节)，超过后按LRU淘汰会话
+    MESSAGE_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+    # redis模式下checkpointer连接池的最大连接数
+    MESSAGE_MEMORY_REDIS_MAX_CONNECTIONS = 32
+    # checkpoint序列化后超过该字节数才使用zstd压缩
+    CHECKPOINT_COMPRESS_THRESHOLD_BYTES = 4096
+    # checkpoint的zstd压缩级别
+    CHECKPOINT_COMPRESS_LEVEL = 3
+    # 各graph的checkpoint写入时机：step(每个super-step都写入)/exit(只在中断、出错和运行结束时写入)
+    CHECKPOINT_DURABILITY = {"data_clerk": "exit", "assistant": "step"}
+    # 按节点覆盖写入时机，节点执行完的那一步按该配置决定是否写入
+    CHECKPOINT_NODE_DURABILITY = {
+        "assistant": {"get_all_tasks": "exit", "get_doc_content_from_vector": "exit", "get_memories": "exit"},
+    }
+    # 对话历史(摘要+未摘要的消息)超过该token数时，把较早的轮次压缩进滚动摘要
+    HISTORY_COMPACT_THRESHOLD_TOKENS = 8000
+    # 压缩时保留的最近原始消息的token数
+    HISTORY_COMPACT_KEEP_RECENT_TOKENS = 3000
+    # 节点未单独配置时的上下文策略
+    CONTEXT_DEFAULT_POLICY = {"summary": True}
+    # 各graph节点的上下文策略：summary(滚动摘要+之后的消息)/last_turns(最近K轮)/max_tokens(历史token预算)/elide_tool_messages(已使用过的工具返回替换为摘要，最近一次工具调用的返回不替换)
+    CONTEXT_POLICIES = {
+        "data_clerk": {
+            "intent_classifier": {"last_turns": 6, "elide_tool_messages": True},
+            "query_data_node": {"max_tokens": 6000, "elide_tool_messages": True},
+            "execute_task": {"summary": False, "last_turns": 1, "elide_tool_messages": True},
+            "test_run_task": {"summary": False, "last_turns": 1, "elide_tool_messages": True},
+            "create_task": {"last_turns": 6, "elide_tool_messages": True},
+            "edit_task": {"last_turns": 6, "elide_tool_messages": True},
+            "delete_task": {"last_turns": 3, "elide_tool_messages": True},
+            "how_to_improve_task": {"last_turns": 6, "elide_tool_messages": True},
+        },
+        "assistant": {
+            "intent_classifier": {"last_turns": 6, "elide_tool_messages": True},
+            "executor": {"summary": False, "last_turns": 1, "elide_tool_messages": True},
+            "chat": {"summary": False, "last_turns": 1, "elide_tool_messages": True},
+            "default": {"max_tokens": 6000, "elide_tool_messages": True},
+            "reason": {"max_tokens": 6000, "elide_tool_messages": True},
+        },
+    }
+    # 工具返回内容超过该字符数，且已被后续的llm调用使用过时，才在后续提示词中替换为摘要
+    TOOL_MESSAGE_ELIDE_MIN_CHARS = 1000
+    # 系统提示词中知识库/记忆/任务内容的token预算：模型 -> 节点 -> token数
+    CONTEXT_BLOCK_TOKEN_BUDGETS = {
+        "deepseek-chat": {"executor": 8000, "default": 6000},
+        "deepseek-reasoner": {"default": 12000, "reason": 16000},
+    }
+    CONTEXT_BLOCK_DEFAULT_TOKEN_BUDGET = 6000
+    # 各内容块分配预算的权重，某块用不完的预算按权重分给其他块
+    CONTEXT_BLOCK_WEIGHTS = {"rag": 0.4, "memory": 0.2, "task": 0.4}
+    # 助手提示词中按问题相关度挑选的任务数(另外固定加上最常/最近执行的任务)
+    TASK_SELECTOR_TOP_N = 10
     LLM_MODEL = "deepseek-chat"
     REASONER_LLM_MODEL = "deepseek-reasoner"
     ASSISTANT_MEMORY_TOP_K = 5
@@ -16,4 +72,70 @@ class Config:
     MD_DOC_VECTOR_CHUNK_SIZE = 1500
     MD_DOC_VECTOR_CHUNK_OVERLAP = 300
     MD_DOC_VECTOR_SEPARATORS = ["\n## ", "\n# "]
+    # 任务执行统计的缓冲：local(进程内存)/redis(多worker共享，进程崩溃不丢失)
+    TASK_STATS_USE = "local"
+    # 任务执行统计批量写入数据库的周期(秒)，local模式下进程崩溃最多丢失这段时间的统计
+    TASK_STATS_FLUSH_INTERVAL = 10
+    # local模式下累积的执行记录数达到该值时提前写入
+    TASK_STATS_FLUSH_MAX_PENDING = 200
+    # 最常执行/最近执行的任务排行各取前N个
+    TASK_RANKING_FREQUENT_N = 3
+    TASK_RANKING_RECENT_N = 3
+    # 最常执行按该时间窗口(天)内本进程观察到的执行次数排序，次数相同再按累计次数，为None时只按累计次数
+    TASK_RANKING_FREQUENT_WINDOW_DAYS = None
+    # 最近执行只算该时间窗口(天)内执行过的任务，为None时不限制
+    TASK_RANKING_RECENT_WINDOW_DAYS = None
+    # 任务排行从数据库重新加载的周期(秒)，用于合并其他worker的执行
+    TASK_RANKING_RELOAD_SECONDS = 300
+    # 助手调用数据员执行任务时直接执行任务，不经过数据员的意图识别和任务查找，False时按对话方式提问(用于对比耗时)
+    ASSISTANT_DIRECT_TASK_EXECUTION = True
+    # 助手直接执行任务时使用临时运行：一次性的thread，不写checkpoint
+    ASSISTANT_NESTED_RUN_EPHEMERAL = True
+    # 推理得到的步骤中互不依赖的执行任务步骤提前并行执行，False时由llm逐个调用(用于对比耗时)
+    ASSISTANT_PARALLEL_TASKS = True
+    # 并行执行任务步骤的最大并发数
+    ASSISTANT_PARALLEL_TASKS_MAX_CONCURRENCY = 4
+    # 批量执行任务时所有批次合计同时执行的作业数上限
+    BATCH_EXECUTION_MAX_CONCURRENCY = 4
+    # 单个批次的作业数上限(任务数×查询条件数)
+    BATCH_EXECUTION_MAX_JOBS = 500
+    # 内存中保留的批次数上限，超过后淘汰最早提交的已完成批次
+    BATCH_EXECUTION_MAX_BATCHES = 100
+    # 任务结果缓存：local(进程内存，只适合单worker)/redis(多worker共享结果，预取在每个时间点只由一个worker执行)
+    TASK_RESULT_CACHE_USE = "local"
+    # 任务结果缓存的有效期(秒)
+    TASK_RESULT_CACHE_TTL_SECONDS = 12 * 3600
+    # 任务结果缓存的条数上限
+    TASK_RESULT_CACHE_MAX_ENTRIES = 1000
+    # 每天预取热门任务结果的时间(HH:MM)，为空时不启动预取
+    TASK_PREFETCH_TIMES = []
+    # 需要预取的业务键 -> 任务名称列表，任务名称列表为None时自动选取最常执行/最近执行的任务
+    TASK_PREFETCH_TASKS = {}
+    # 预取时同时执行的任务数
+    TASK_PREFETCH_MAX_CONCURRENCY = 2
+    # 同一会话的多轮运行串行执行：local(单worker进程内串行)/redis(多worker之间也串行)
+    SESSION_RUN_QUEUE_USE = "local"
+    # 同一会话排队等待上一轮运行结束的最长时间(秒)
+    SESSION_RUN_WAIT_TIMEOUT = 600
+    # redis会话锁的过期时间(秒)，防止worker异常退出后锁无法释放
+    SESSION_RUN_LOCK_TIMEOUT = 900
+    # LLM网关：全局同时进行中的LLM调用上限
+    LLM_GATEWAY_MAX_CONCURRENCY = 8
+    # LLM网关：每个business_key每分钟允许消耗的token数(输入+输出)
+    LLM_GATEWAY_TOKENS_PER_MINUTE = 300000
+    # LLM网关：令牌桶容量，允许的瞬时突发token数
+    LLM_GATEWAY_BURST_TOKENS = 60000
+    # LLM网关：各优先级最长排队时间(秒)，超过后快速失败
+    LLM_GATEWAY_MAX_WAIT = {"interactive": 30, "nested_tool": 120, "background": 300}
+    LLM_GATEWAY_DEFAULT_MAX_WAIT = 60
 
+    # 过载保护：同时进行中的智能体运行数上限
+    OVERLOAD_MAX_IN_FLIGHT_RUNS = 64
+    # 过载保护：LLM网关+会话队列中排队的数量上限
+    OVERLOAD_MAX_QUEUE_DEPTH = 32
+    # 过载保护：最近首token延迟(中位数，秒)上限
+    OVERLOAD_MAX_RECENT_LATENCY = 20
+    # 过载保护：统计最近首token延迟的时间窗口(秒)
+    OVERLOAD_LATENCY_WINDOW = 60
+    # 过载保护：拒绝时建议的重试间隔(秒)
+    OVERLOAD_RETRY_AFTER_SECONDS = 5
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import select, update
+from sqlalchemy import bindparam, func, select, update
 from dao.base_dao import BaseDAO
 from entity.query_data_task_entity import QueryDataTaskEntity
 
@@ -91,68 +91,33 @@ class QueryDataTaskDAO(BaseDAO):
 
         self.execute_in_session(query)
 
-    def update_execute_times_once(self, id, business_key):
+    def record_executions(self, rows):
         """
-        更新任务执行次数+1
+        批量记录任务执行统计：在一个事务中按任务批量UPDATE，执行次数累加，并更新最近执行时间、耗时和结果，
+        耗时和结果为空时(只命中了缓存)保留原来的值
 
         Args:
-            id (int): 任务ID
-            business_key (str): 业务键
+            rows (list): 每个任务一条，包含id、business_key、count、execute_time、duration_ms、outcome
         """
+        table = QueryDataTaskEntity.__table__
+
         def query(session):
             stmt = (
-                update(QueryDataTaskEntity)
+                update(table)
                 .where(
-                    QueryDataTaskEntity.id == id,
-                    QueryDataTaskEntity.business_key == business_key
+                    table.c.id == bindparam("b_id"),
+                    table.c.business_key == bindparam("b_business_key")
                 )
-                .values(invoke_times=QueryDataTaskEntity.invoke_times + 1)
+                .values(invoke_times=table.c.invoke_times + bindparam("b_count"),
+                        execute_time=bindparam("b_execute_time"),
+                        last_duration_ms=func.coalesce(bindparam("b_duration_ms"), table.c.last_duration_ms),
+                        last_outcome=func.coalesce(bindparam("b_outcome"), table.c.last_outcome))
             )
-            session.execute(stmt)
+            session.connection().execute(stmt, [{f"b_{k}": v for k, v in row.items()} for row in rows])
             session.commit()
 
         self.execute_in_session(query)
 
-    def get_frequently_execute_top3_tasks(self, business_key, not_in_ids):
-        """
-        获取执行次数最多的前3个任务
-
-        Args:
-            business_key (str): 业务键
-            not_in_ids (list): 排除的任务ID列表
-
-        Returns:
-            list: QueryDataTaskEntity对象列表
-        """
-        def query(session):
-            query = select(QueryDataTaskEntity).where(
-                QueryDataTaskEntity.id.not_in(not_in_ids),
-                QueryDataTaskEntity.business_key == business_key,
-                QueryDataTaskEntity.is_deleted == 0
-            ).order_by(QueryDataTaskEntity.invoke_times.desc()).limit(3)
-            return session.execute(query).scalars().all()
-
-        return self.execute_in_session(query)
-
-    def get_usually_execute_top3_tasks(self, business_key):
-        """
-        获取最近执行时间最靠前的前3个任务
-
-        Args:
-            business_key (str): 业务键
-
-        Returns:
-            list: QueryDataTaskEntity对象列表
-        """
-        def query(session):
-            query = select(QueryDataTaskEntity).where(
-                QueryDataTaskEntity.business_key == business_key,
-                QueryDataTaskEntity.is_deleted == 0
-            ).order_by(QueryDataTaskEntity.execute_time.desc()).limit(3)
-            return session.execute(query).scalars().all()
-
-        return self.execute_in_session(query)
-
     def get_all_tasks(self, business_key):
         """
         获取所有任务
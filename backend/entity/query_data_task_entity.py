@@ -15,4 +15,6 @@ class QueryDataTaskEntity(Base):
     invoke_times = Column(Integer, default=0)
     is_deleted = Column(Integer, default=0)
     execute_time = Column(String)
+    last_duration_ms = Column(Integer)
+    last_outcome = Column(String)
 
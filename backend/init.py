@@ -27,4 +27,8 @@ def create_app(Config=None):
     from web.llm_tool_controller import llm_tool_api
     app.register_blueprint(llm_tool_api, url_prefix='/agentApi/v1/llmTool')
 
+    # 按配置的时间预取热门任务的结果
+    from service.task.prefetch_scheduler import get_prefetch_scheduler
+    get_prefetch_scheduler().start()
+
     return app
\ No newline at end of file
@@ -0,0 +1,45 @@
+from pydantic import BaseModel, ConfigDict
+from pydantic.alias_generators import to_camel
+
+
+class BatchJob(BaseModel):
+    index: int # 作业在批次中的序号
+    task_id: int | None = None # 任务id
+    task_name: str | None = None # 任务名称
+    params: str | None = None # 执行时的查询条件
+    status: str # 作业状态：pending/running/finished
+    outcome: str | None = None # 执行结果：success/tool_error/failed/not_found
+    content: str | None = None # 任务执行结果
+    wait_seconds: float | None = None # 排队等待耗时(秒)
+    latency_seconds: float | None = None # 执行耗时(秒)
+
+    model_config = ConfigDict(
+        # 设置别名生成器为驼峰命名
+        alias_generator=to_camel,
+        # 允许使用字段名和别名进行赋值
+        populate_by_name=True,
+    )
+
+
+class BatchExecution(BaseModel):
+    batch_id: str # 批次id
+    business_key: str # 业务键
+    status: str # 批次状态：pending/running/finished
+    concurrency: int # 并发执行的作业数
+    total: int # 作业总数
+    finished: int = 0 # 已完成的作业数
+    succeeded: int = 0 # 执行成功的作业数
+    created_at: str # 提交时间
+    duration_seconds: float | None = None # 批次总耗时(秒)
+    throughput_per_minute: float | None = None # 吞吐量(每分钟完成的作业数)
+    jobs: list[BatchJob] # 作业明细
+
+    def to_dict(self):
+        return self.model_dump(by_alias=True)
+
+    model_config = ConfigDict(
+        # 设置别名生成器为驼峰命名
+        alias_generator=to_camel,
+        # 允许使用字段名和别名进行赋值
+        populate_by_name=True,
+    )
@@ -10,6 +10,8 @@ class QueryDataTaskDetail(BaseModel):
     query_param: str | None # 查询参数
     data_operation:str | None # 数据二次加工
     data_format: str | None # 数据格式
+    tool_names: list[str] | None = None # 执行任务需要的工具，为空时使用全部工具
+    execution_plan: list[list[dict]] | None = None # 执行计划，成功执行时记录的按轮次排列的工具调用，日期已参数化
 
     class Config:
         alias_generator = to_camel
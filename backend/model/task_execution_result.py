@@ -0,0 +1,21 @@
+from pydantic import BaseModel, ConfigDict
+from pydantic.alias_generators import to_camel
+
+
+class TaskExecutionResult(BaseModel):
+    task_id: int | None = None # 任务id
+    task_name: str | None = None # 任务名称
+    params: str | None = None # 执行时的查询条件
+    content: str | None = None # 任务执行结果
+    outcome: str # 执行结果：success/tool_error/failed/not_found
+    duration_seconds: float # 执行耗时(秒)
+
+    def to_dict(self):
+        return self.model_dump(by_alias=True)
+
+    model_config = ConfigDict(
+        # 设置别名生成器为驼峰命名
+        alias_generator=to_camel,
+        # 允许使用字段名和别名进行赋值
+        populate_by_name=True,
+    )
@@ -1,8 +1,11 @@
 # Initialize memory
+import asyncio
 import json
 import logging
 import os
 import tempfile
+import time
+import uuid
 from datetime import datetime
 from typing import Optional, cast, Literal
 
@@ -18,8 +21,6 @@ from langchain_deepseek import ChatDeepSeek
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_redis import RedisVectorStore, RedisConfig
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.checkpoint.redis import RedisSaver
 from langgraph.constants import START, END
 from langgraph.graph.state import CompiledStateGraph, StateGraph
 from langgraph.prebuilt import ToolNode
@@ -42,7 +43,18 @@ from service.agent.model.state import AssistantState, AssistantInputState
 from service.agent.model.state import InputState
 from service.agent.prompt import prompts
 from service.agent.prompt.prompts import ASSISTANT_EXTRACT_QUERYING_DATA_PROMPT
-from util import datetime_util
+from service.checkpoint.checkpointer_factory import create_checkpointer
+from service.checkpoint.instrumented_checkpointer import checkpoint_turn_stats
+from service.context.context_budget import ContextBlock, ContextBudgetAllocator, ContextItem, lexical_relevance
+from service.context.history_compactor import HistoryCompactor
+from service.context.prompt_assembler import PromptAssembler
+from service.context.task_selector import TaskSelector
+from service.llm.gateway_chat_model import wrap_with_gateway
+from service.llm.llm_gateway import LLMPriority, llm_priority
+from service.runtime.session_run_queue import get_session_run_queue
+from service.task.plan_steps import independent_task_steps, parse_task_steps
+from service.task.task_ranking import get_task_ranking
+from util import datetime_util, metrics_util
 from util.config_util import read_private_config
 
 service_map = {}
@@ -50,6 +62,16 @@ service_map = {}
 AI_CHAT_NODES = ["chat", "default", "executor"]
 AI_REASONER_NODES = ["reason"]
 
+# 系统提示词中各内容块的标题
+TASK_CONTENT_HEADER = "你能使用的所有任务信息如下(任务的'获取到结果之后的数据加工逻辑'字段只是让你了解这个任务最终返回的结果都包含哪些内容，便于你进行下一步推理):\n"
+RAG_CONTENT_HEADER = "查询知识库搜索到相关信息如下:\n"
+RAG_CONTENT_EMPTY = "未查询到相关信息"
+MEMORY_CONTENT_HEADER = "从历史对话中获取到的相关信息如下:\n"
+MEMORY_CONTENT_EMPTY = "没有从记忆中获取到相关信息"
+TASK_CONTENT_PARTIAL = "(共有{total}个任务，以下只列出与问题相关的任务和常用任务，如需查看全部任务，请调用工具list_all_tasks，业务键(businessKey)={business_key})\n"
+# 提前并行执行的任务的工具调用id前缀
+PARALLEL_TOOL_CALL_PREFIX = "parallel_"
+
 
 class AssistantService:
     # 工作流服务的业务唯一键，同一个business_key下的取数任务名称唯一
@@ -88,28 +110,41 @@ class AssistantService:
 
         # 初始化llm
         api_key: Optional[str] = read_private_config("deepseek", "API_KEY")
-        self.__llm = ChatDeepSeek(
+        # 所有llm调用都经过LLM网关排队限流
+        self.__llm = wrap_with_gateway(ChatDeepSeek(
             model=Config.LLM_MODEL,
             temperature=0,
             max_tokens=8192,
             timeout=60000,
             max_retries=2,
             api_key=api_key
-        )
+        ), business_key)
 
-        self.__reasoner_llm = ChatDeepSeek(
+        self.__reasoner_llm = wrap_with_gateway(ChatDeepSeek(
             model=Config.REASONER_LLM_MODEL,
             max_tokens=8192,
             timeout=60000,
             max_retries=2,
             api_key=api_key,
             stream_usage = True,
-        )
+        ), business_key)
 
         # 初始化记忆(mem0)
         self.__memory = self.__create_memory()
-        # 创建数据员子图调用工具
-        self.__data_clerk_tool = [ask_data_clerk]
+        # 对话历史压缩
+        self.__history_compactor = HistoryCompactor(self.__llm, "assistant",
+                                                    threshold_tokens=Config.HISTORY_COMPACT_THRESHOLD_TOKENS,
+                                                    keep_recent_tokens=Config.HISTORY_COMPACT_KEEP_RECENT_TOKENS)
+        # 按节点的上下文策略拼装提示词
+        self.__prompt_assembler = PromptAssembler("assistant")
+        # 知识库、记忆、任务内容的token预算
+        self.__context_budget = ContextBudgetAllocator("assistant")
+        # 向量模型
+        self.__embeddings = self.__create_embeddings()
+        # 按问题挑选相关任务
+        self.__task_selector = TaskSelector(self.__embeddings, Config.TASK_SELECTOR_TOP_N)
+        # 创建数据员子图调用工具，提示词中只有部分任务时可以查看全部任务
+        self.__data_clerk_tool = [ask_data_clerk, list_all_tasks]
         # 初始化langGraph
         self.__data_clerk_graph = get_or_create_data_clerk_service(business_key).graph
         self.__graph = self.__create_graph(agent_def.name)
@@ -130,60 +165,62 @@ class AssistantService:
         @stream_with_context
         async def async_event_stream():
             try:
-
-                stream = self.stream_question(input, session_id, use_thinking)
-
-                # 直接异步迭代处理流数据
-                async for stream_mode, detail in stream:
-                    # print(stream_mode, detail)
-                    if stream_mode == "messages":
-                        chunk, metadata = detail
-                        if metadata['langgraph_node'] in AI_CHAT_NODES:
-                            content = chunk.content
-                            yield f"data: {json.dumps({'msgId': chunk.id, 'token': content})}\n\n"
-                        elif metadata['langgraph_node'] in AI_REASONER_NODES:
-                            if "reasoning_content" in chunk.additional_kwargs:
-                                reasoning_content = chunk.additional_kwargs['reasoning_content']
-                                yield f"data: {json.dumps({"reasoningContent": reasoning_content})}\n\n"
-                    elif stream_mode == "tasks":
-                        if detail["name"] == "get_all_tasks" and "result" in detail:
-                            # 获取任务内容
-                            for tuple in detail["result"]:
-                                result_dict = {tuple[0]:tuple[1]}
-                                if "task_names" in result_dict:
-                                    task_names = result_dict["task_names"]
-                                    yield f"data: {json.dumps({'taskSize': len(task_names), 'taskNames':",".join(task_names)})}\n\n"
-                        elif detail["name"] == "get_doc_content_from_vector" and "result" in detail:
-                            # 获取rag内容
-                            for tuple in detail["result"]:
-                                result_dict = {tuple[0]: tuple[1]}
-                                if "rag_docs" in result_dict:
-                                    rag_docs = result_dict["rag_docs"]
-                                    yield f"data: {json.dumps({'ragDocSize': len(rag_docs)})}\n\n"
-                                elif "rag_content" in result_dict:
-                                    rag_content = result_dict["rag_content"]
-                                    yield f"data: {json.dumps({'ragContent': rag_content})}\n\n"
-                        elif detail["name"] == "get_memories" and "result" in detail:
-                            # 获取查询到的记忆内容
-                            for tuple in detail["result"]:
-                                result_dict = {tuple[0]: tuple[1]}
-                                if "memories" in result_dict:
-                                    memories = result_dict["memories"]
-                                    yield f"data: {json.dumps({'memorySize': len(memories)})}\n\n"
-                                if "memory_content" in result_dict:
-                                    memory_content = result_dict["memory_content"]
-                                    yield f"data: {json.dumps({'memoryContent': memory_content})}\n\n"
-                        elif (detail["name"] == "default" or detail["name"] == "chat") and "result" in detail:
-                            # 获取生成的记忆内容
-                            for tuple in detail["result"]:
-                                result_dict = {tuple[0]: tuple[1]}
-                                if "saved_memory_content" in result_dict:
-                                    saved_memory_content = result_dict["saved_memory_content"]
-                                    if saved_memory_content != "":
-                                        yield f"data: {json.dumps({'savedMemoryContent': saved_memory_content})}\n\n"
-                                if "msg_id_saved_memories" in result_dict:
-                                    msg_id_saved_memories = result_dict["msg_id_saved_memories"]
-                                    yield f"data: {json.dumps({'msgIdSavedMemories': msg_id_saved_memories})}\n\n"
+                # 同一会话的多轮运行串行执行，避免并发写同一个thread的checkpoint
+                async with get_session_run_queue().run(self.get_session_key(session_id)), checkpoint_turn_stats("assistant"):
+
+                    stream = self.stream_question(input, session_id, use_thinking)
+
+                    # 直接异步迭代处理流数据
+                    async for stream_mode, detail in stream:
+                        # print(stream_mode, detail)
+                        if stream_mode == "messages":
+                            chunk, metadata = detail
+                            if metadata['langgraph_node'] in AI_CHAT_NODES:
+                                content = chunk.content
+                                yield f"data: {json.dumps({'msgId': chunk.id, 'token': content})}\n\n"
+                            elif metadata['langgraph_node'] in AI_REASONER_NODES:
+                                if "reasoning_content" in chunk.additional_kwargs:
+                                    reasoning_content = chunk.additional_kwargs['reasoning_content']
+                                    yield f"data: {json.dumps({"reasoningContent": reasoning_content})}\n\n"
+                        elif stream_mode == "tasks":
+                            if detail["name"] == "get_all_tasks" and "result" in detail:
+                                # 获取任务内容
+                                for tuple in detail["result"]:
+                                    result_dict = {tuple[0]:tuple[1]}
+                                    if "task_names" in result_dict:
+                                        task_names = result_dict["task_names"]
+                                        yield f"data: {json.dumps({'taskSize': len(task_names), 'taskNames':",".join(task_names)})}\n\n"
+                            elif detail["name"] == "get_doc_content_from_vector" and "result" in detail:
+                                # 获取rag内容
+                                for tuple in detail["result"]:
+                                    result_dict = {tuple[0]: tuple[1]}
+                                    if "rag_docs" in result_dict:
+                                        rag_docs = result_dict["rag_docs"]
+                                        yield f"data: {json.dumps({'ragDocSize': len(rag_docs)})}\n\n"
+                                    elif "rag_content" in result_dict:
+                                        rag_content = result_dict["rag_content"]
+                                        yield f"data: {json.dumps({'ragContent': rag_content})}\n\n"
+                            elif detail["name"] == "get_memories" and "result" in detail:
+                                # 获取查询到的记忆内容
+                                for tuple in detail["result"]:
+                                    result_dict = {tuple[0]: tuple[1]}
+                                    if "memories" in result_dict:
+                                        memories = result_dict["memories"]
+                                        yield f"data: {json.dumps({'memorySize': len(memories)})}\n\n"
+                                    if "memory_content" in result_dict:
+                                        memory_content = result_dict["memory_content"]
+                                        yield f"data: {json.dumps({'memoryContent': memory_content})}\n\n"
+                            elif (detail["name"] == "default" or detail["name"] == "chat") and "result" in detail:
+                                # 获取生成的记忆内容
+                                for tuple in detail["result"]:
+                                    result_dict = {tuple[0]: tuple[1]}
+                                    if "saved_memory_content" in result_dict:
+                                        saved_memory_content = result_dict["saved_memory_content"]
+                                        if saved_memory_content != "":
+                                            yield f"data: {json.dumps({'savedMemoryContent': saved_memory_content})}\n\n"
+                                    if "msg_id_saved_memories" in result_dict:
+                                        msg_id_saved_memories = result_dict["msg_id_saved_memories"]
+                                        yield f"data: {json.dumps({'msgIdSavedMemories': msg_id_saved_memories})}\n\n"
                 yield "event: done\ndata: \n\n"
 
             except Exception as e:
@@ -214,26 +251,43 @@ class AssistantService:
 
         return stream
 
+    def get_session_key(self, session_id) -> str:
+        """
+        会话串行执行队列使用的键，同一个会话的多轮运行串行执行
+        :param session_id:
+        :return: 会话键
+        """
+        return f"assistant:{self.__business_key}:{session_id}"
+
     def __get_all_tasks(self, state: AssistantState):
         """
         获取所有的任务
         :return:state
         """
-        tasks = self.__query_data_task_dao.get_all_tasks(self.__business_key)
+        all_tasks = self.__query_data_task_dao.get_all_tasks(self.__business_key)
+        # 只保留与当前问题相关的任务和常用任务，任务目录变大时提示词大小基本不变
+        _, human_msg = self.__find_last_human_message(state.messages)
+        pinned_names = get_task_ranking().get_frequently_and_usually_execute_tasks(self.__business_key)
+        tasks = self.__task_selector.select(self.__business_key, human_msg.content if human_msg is not None else "",
+                                            all_tasks, pinned_names)
 
         task_details = []
         task_names = []
-        task_content = "你能使用的所有任务信息如下(任务的'获取到结果之后的数据加工逻辑'字段只是让你了解这个任务最终返回的结果都包含哪些内容，便于你进行下一步推理):\n"
+        task_catalog_note = ""
+        if len(tasks) < len(all_tasks):
+            task_catalog_note = TASK_CONTENT_PARTIAL.format(total=len(all_tasks), business_key=self.__business_key)
+        task_content = TASK_CONTENT_HEADER + task_catalog_note
         for task in tasks:
             task_names.append(task.name)
             task_detail = QueryDataTaskDetail.model_validate(json.loads(task.task_detail))
-            task_content += f"任务名：{task.name}\n {task_detail.to_desc_for_llm()}\n"
+            task_content += self.__format_task(task.name, task_detail)
             task_details.append(task_detail)
 
         return {
             "task_details": task_details,
             "task_names": task_names,
             "task_content": task_content,
+            "task_catalog_note": task_catalog_note,
         }
 
     def __get_doc_content_from_vector(self, state:AssistantState):
@@ -248,16 +302,12 @@ class AssistantService:
             retriever=self.__vector_store.as_retriever(search_kwargs=search_kwargs), llm=self.__llm
         )
         docs = retriever_from_llm.invoke(human_msg.content)
-        rag_content = "查询知识库搜索到相关信息如下:\n"
+        rag_content = RAG_CONTENT_HEADER
         if len(docs) > 0:
             for index, doc in enumerate(docs):
-                file_name = doc.metadata["source"]
-                upload_time = doc.metadata["upload_time"]
-                content = doc.page_content
-
-                rag_content += f"第{index}条结果:\n{content} \n内容来源于:{file_name},上传时间:{upload_time}\n"
+                rag_content += self.__format_rag_doc(index, doc)
         else:
-            rag_content += "未查询到相关信息"
+            rag_content += RAG_CONTENT_EMPTY
 
         return {
             "rag_docs": docs,
@@ -304,7 +354,7 @@ class AssistantService:
             return state
 
         # 展示所有任务信息
-        intent_prompt = ChatPromptTemplate.from_messages([
+        intent_prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("intent_classifier", state, [
             # 系统提示词
             ("system", f"""{self.__basic_system_template}
             
@@ -331,9 +381,7 @@ class AssistantService:
                        """),
             # 明确标识示例区
             MessagesPlaceholder("examples", optional=True),
-            # 包含所有历史对话
-            *state.messages
-        ])
+        ]))
 
         examples = [
             # 使用few-shot示例（强调AI必须返回JsonOutputParser的格式，不加AI会尝试返回自然语言的KV）：
@@ -370,29 +418,25 @@ class AssistantService:
         # 2.执行专用提示词
         executor_prompt_content = prompts.get_assistant_executor_system_prompt()
 
+        # 知识库、记忆、任务信息在节点的token预算内按相关度裁剪
+        context = self.__budgeted_context(state, "executor", Config.LLM_MODEL)
+
         # 3.知识库提示词
-        knowledge_prompt_content = state.rag_content
+        knowledge_prompt_content = context["rag"]
 
         # 4.记忆提示词
-        memory_content = state.memory_content
+        memory_content = context["memory"]
 
         # 5.所有任务信息
-        task_content = state.task_content
-
-        all_messages = state.messages
+        task_content = context["task"]
 
         sys_msg = SystemMessage(content="\n".join(
             [basic_system_prompt, executor_prompt_content, knowledge_prompt_content, memory_content, task_content]))
 
-        if isinstance(all_messages[-1], ToolMessage):
-            prompt = ChatPromptTemplate.from_messages([
-                sys_msg,
-                *all_messages
-            ])
-        else:
-            prompt = ChatPromptTemplate.from_messages([
-                sys_msg, all_messages[-1]
-            ])
+        # 初次调用只有用户最后一条消息，工具返回后的再次调用包含本轮的工具调用，由节点的上下文策略决定
+        prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("executor", state, [
+            sys_msg,
+        ]))
 
         chain = prompt | self.__llm.bind_tools(self.__data_clerk_tool)
 
@@ -414,22 +458,24 @@ class AssistantService:
                         当前日期:{datetime_util.get_current_date()}             
         """
 
+        # 知识库、记忆、任务信息在节点的token预算内按相关度裁剪
+        context = self.__budgeted_context(state, "default", Config.REASONER_LLM_MODEL if state.use_thinking else Config.LLM_MODEL)
+
         # 2.知识库提示词
-        rag_content = state.rag_content
+        rag_content = context["rag"]
 
         # 3.记忆提示词
-        memory_content = state.memory_content
+        memory_content = context["memory"]
 
         # 4.所有任务信息
-        task_content = state.task_content
+        task_content = context["task"]
 
         all_messages = state.messages
 
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("default", state, [
             SystemMessage(content="\n".join(
                 [basic_system_prompt, rag_content, memory_content, task_content])),
-            *all_messages,
-        ])
+        ]))
         llm = self.__reasoner_llm if state.use_thinking else self.__llm
         chain = prompt | llm
         config = RunnableConfig(
@@ -457,16 +503,55 @@ class AssistantService:
 
 
     def __get_memory_content(self, memories:list[dict]):
-        memory_content = "从历史对话中获取到的相关信息如下:\n"
+        memory_content = MEMORY_CONTENT_HEADER
         if len(memories) > 0:
             for memory in memories:
-                formatted_time = datetime_util.format_iso_2_datetime_at_zone(memory["created_at"])
-                memory_content += f"{memory["memory"]}(记忆产生于{formatted_time})\n"
+                memory_content += self.__format_memory(memory)
         else:
-            memory_content += "没有从记忆中获取到相关信息"
+            memory_content += MEMORY_CONTENT_EMPTY
 
         return memory_content
 
+    @staticmethod
+    def __format_task(task_name: str, task_detail: QueryDataTaskDetail) -> str:
+        return f"任务名：{task_name}\n {task_detail.to_desc_for_llm()}\n"
+
+    @staticmethod
+    def __format_rag_doc(index: int, doc) -> str:
+        file_name = doc.metadata["source"]
+        upload_time = doc.metadata["upload_time"]
+        return f"第{index}条结果:\n{doc.page_content} \n内容来源于:{file_name},上传时间:{upload_time}\n"
+
+    @staticmethod
+    def __format_memory(memory: dict) -> str:
+        formatted_time = datetime_util.format_iso_2_datetime_at_zone(memory["created_at"])
+        return f"{memory["memory"]}(记忆产生于{formatted_time})\n"
+
+    def __budgeted_context(self, state: AssistantState, node: str, model: str) -> dict[str, str]:
+        """
+        在节点+模型的token预算内拼装知识库、记忆、任务内容，按相关度保留
+        :param state:
+        :param node: 节点名称
+        :param model: 节点使用的模型
+        :return: rag/memory/task -> 内容
+        """
+        _, human_msg = self.__find_last_human_message(state.messages)
+        question = human_msg.content if human_msg is not None else ""
+        blocks = [
+            # 检索结果已按相关度排序
+            ContextBlock("rag", RAG_CONTENT_HEADER,
+                         [ContextItem(self.__format_rag_doc(index, doc), score=-index) for index, doc in enumerate(state.rag_docs)],
+                         RAG_CONTENT_EMPTY),
+            # mem0的score是距离，越小越相关
+            ContextBlock("memory", MEMORY_CONTENT_HEADER,
+                         [ContextItem(self.__format_memory(memory), score=-float(memory.get("score", 0))) for memory in state.memories],
+                         MEMORY_CONTENT_EMPTY),
+            ContextBlock("task", TASK_CONTENT_HEADER + state.task_catalog_note,
+                         [ContextItem(self.__format_task(name, detail), score=lexical_relevance(question, f"{name}{detail.target}"))
+                          for name, detail in zip(state.task_names, state.task_details)]),
+        ]
+        return self.__context_budget.allocate(node, model, blocks)
+
 
     async def __reason(self, state: AssistantState):
         """
@@ -483,20 +568,21 @@ class AssistantService:
         # 2.推理专用提示词
         reason_prompt_content = prompts.get_assistant_reasoner_system_prompt()
 
+        # 知识库、记忆、任务信息在节点的token预算内按相关度裁剪
+        context = self.__budgeted_context(state, "reason", Config.REASONER_LLM_MODEL)
+
         # 3.知识库提示词
-        knowledge_prompt_content = state.rag_content
+        knowledge_prompt_content = context["rag"]
 
         # 4.记忆提示词
-        memory_content = state.memory_content
+        memory_content = context["memory"]
 
         # 5.所有任务信息
-        task_content = state.task_content
+        task_content = context["task"]
 
-        all_messages = state.messages
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("reason", state, [
             SystemMessage(content="\n".join([basic_system_prompt, reason_prompt_content, knowledge_prompt_content, memory_content, task_content])),
-            *all_messages,
-        ])
+        ]))
         chain = prompt | self.__reasoner_llm
         config = RunnableConfig(
             configurable={"timeout": 600000}
@@ -509,6 +595,74 @@ class AssistantService:
             "reasoning_context": response.content,
         }
 
+    async def __parallel_tasks(self, state: AssistantState):
+        """
+        推理步骤中互不依赖的执行任务步骤一起并行执行，结果按步骤顺序作为工具调用结果交给chat节点，
+        依赖前面步骤结果的任务仍由llm逐个调用
+        :param state:
+        :return:state
+        """
+        if not Config.ASSISTANT_PARALLEL_TASKS:
+            return {}
+        steps = independent_task_steps(parse_task_steps(state.reasoning_context, state.task_names))
+        if len(steps) < 2:
+            # 只有一个任务时并行没有收益，仍由llm调用
+            return {}
+
+        tool_calls = [{"name": ask_data_clerk.name, "id": f"{PARALLEL_TOOL_CALL_PREFIX}{uuid.uuid4().hex}",
+                       "args": {"business_key": self.__business_key, "session_id": state.session_id,
+                                "task_name": step.task_name, "params": step.params}}
+                      for step in steps]
+        semaphore = asyncio.Semaphore(Config.ASSISTANT_PARALLEL_TASKS_MAX_CONCURRENCY)
+
+        async def run(tool_call) -> (ToolMessage, float):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    content = await ask_data_clerk.ainvoke(tool_call["args"])
+                    status = "success"
+                except Exception as e:
+                    logging.warning(f"并行执行任务失败，任务:{tool_call['args']['task_name']}, 错误:{e}")
+                    content, status = f"执行任务失败:{e}", "error"
+                message = ToolMessage(content=content, name=ask_data_clerk.name, tool_call_id=tool_call["id"],
+                                      status=status)
+                return message, time.perf_counter() - start
+
+        start = time.perf_counter()
+        # gather按传入顺序返回，结果与步骤顺序一致
+        results = await asyncio.gather(*(run(tool_call) for tool_call in tool_calls))
+        seconds = time.perf_counter() - start
+        # 逐个执行时至少需要各任务耗时之和(还不算每次调用前llm规划的耗时)
+        sequential_seconds = sum(task_seconds for _, task_seconds in results)
+        metrics_util.inc_counter("assistant_parallel_tasks_total", value=len(steps))
+        metrics_util.observe("assistant_parallel_tasks_seconds", seconds)
+        metrics_util.observe("assistant_parallel_tasks_sequential_seconds", sequential_seconds)
+        logging.info(f"并行执行任务步骤，任务数:{len(steps)}, 耗时:{seconds:.3f}s, 逐个执行耗时:{sequential_seconds:.3f}s")
+
+        return {
+            "messages": [AIMessage(content="", id=str(uuid.uuid4()), tool_calls=tool_calls),
+                         *[message for message, _ in results]],
+        }
+
+    @staticmethod
+    def __parallel_results_hint(messages) -> str:
+        """
+        本轮提前并行执行成功的任务不需要再调用，执行失败的任务仍需要llm重新调用
+        """
+        start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1) + 1
+        task_names = {tool_call["id"]: tool_call["args"].get("task_name")
+                      for m in messages[start:] if isinstance(m, AIMessage) for tool_call in m.tool_calls
+                      if tool_call["id"].startswith(PARALLEL_TOOL_CALL_PREFIX)}
+        results = [m for m in messages[start:] if isinstance(m, ToolMessage) and m.tool_call_id in task_names]
+        succeeded = [task_names[m.tool_call_id] for m in results if m.status != "error"]
+        failed = [task_names[m.tool_call_id] for m in results if m.status == "error"]
+        hint = ""
+        if len(succeeded) > 0:
+            hint += f"以下任务已经得到结果，不要重复调用:{'、'.join(succeeded)}。"
+        if len(failed) > 0:
+            hint += f"以下任务执行失败，需要重新调用:{'、'.join(failed)}。"
+        return hint
+
     def __find_last_human_message(self, messages, before_msg_id:str | None = None) -> (int, HumanMessage):
         """
         从消息列表中查找指定消息ID之前最后一条人类用户发送的消息
@@ -582,7 +736,7 @@ class AssistantService:
 
         # 如果是工具返回后的再次调用
         if isinstance(all_messages[-1], ToolMessage):
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("chat", state, [
                 SystemMessage(content=f"""
                 {self.__basic_system_template}
     
@@ -594,12 +748,12 @@ class AssistantService:
                 {state.reasoning_context}
                 
                 先向用户复述你要执行的具体操作（严格按照操作执行的步骤），当需要调用工具执行任务得到数据结果时，概括每次调用的数据结果，最后给出你的答案。
+                {self.__parallel_results_hint(all_messages)}
                 """),
-                *all_messages,
-            ])
+            ]))
             chain = prompt | self.__llm.bind_tools(self.__data_clerk_tool)
         else:
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.__prompt_assembler.assemble("chat", state, [
                 SystemMessage(content=f"""
                             {self.__basic_system_template}
 
@@ -612,8 +766,7 @@ class AssistantService:
                             
                             先向用户复述你要执行的具体操作（严格按照操作执行的步骤），当需要调用工具执行任务得到数据结果时，概括每次调用的数据结果，最后给出你的答案。
                             """),
-                all_messages[-1], # 取最后一条直接执行命令
-            ])
+            ]))
             chain = prompt | self.__llm.bind_tools(self.__data_clerk_tool)
         response = await chain.ainvoke({})
 
@@ -691,7 +844,8 @@ class AssistantService:
             "llm": {
                 "provider": "langchain",
                 "config": {
-                    "model": self.__llm,
+                    # 记忆提取在后台进行，优先级低于用户提问
+                    "model": self.__llm.with_priority(LLMPriority.BACKGROUND),
                 }
             },
             "embedder": {
@@ -708,22 +862,34 @@ class AssistantService:
 
         return memory
 
-    def __create_vector_store(self) -> RedisVectorStore:
+    def __create_embeddings(self) -> HuggingFaceEmbeddings | None:
         """
-        创建RAG专用向量存储
-        :return: vector_store
+        创建向量模型，rag向量存储和任务挑选共用
+        :return: embeddings
         """
         model_location :Optional[str] = read_private_config("embedding_models", "LOCATION")
         if model_location is None:
             model_location = Config.EMBEDDING_LOCAL_MODEL
 
         try:
-            model_name = model_location
             model_kwargs = {"device": "cpu"}
             encode_kwargs = {"normalize_embeddings": True}
-            embeddings = HuggingFaceEmbeddings(
-                model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+            return HuggingFaceEmbeddings(
+                model_name=model_location, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
             )
+        except Exception as e:
+            logging.error("创建向量模型失败:%s", e)
+            return None
+
+    def __create_vector_store(self) -> RedisVectorStore:
+        """
+        创建RAG专用向量存储
+        :return: vector_store
+        """
+        try:
+            embeddings = self.__embeddings
+            if embeddings is None:
+                return None
 
             config = RedisConfig(
                 index_name="assistant_" + self.__business_key,
@@ -743,34 +909,33 @@ class AssistantService:
 
     def __create_graph(self, graph_name):
         builder = StateGraph(AssistantState, input_schema=AssistantInputState)
+        builder.add_node("compact_history", self.__history_compactor.compact)
         builder.add_node("intent_classifier", self.__intent_classifier)
         builder.add_node("get_all_tasks", self.__get_all_tasks)
         builder.add_node("get_doc_content_from_vector", self.__get_doc_content_from_vector)
         builder.add_node("get_memories", self.__get_memories)
         builder.add_node("reason", self.__reason)
+        builder.add_node("parallel_tasks", self.__parallel_tasks)
         builder.add_node("default", self.__default)
         builder.add_node("chat", self.__chat)
         builder.add_node("executor", self.__executor)
         builder.add_node("data_clerk_tool", ToolNode(self.__data_clerk_tool))
 
-        builder.add_edge(START, "get_all_tasks")
+        builder.add_edge(START, "compact_history")
+        builder.add_edge("compact_history", "get_all_tasks")
         builder.add_edge("get_all_tasks", "get_doc_content_from_vector")
         builder.add_edge("get_doc_content_from_vector", "get_memories")
         builder.add_edge("get_memories", "intent_classifier")
         builder.add_conditional_edges("intent_classifier", self.__need_reason)
-        builder.add_edge("reason", "chat")
+        builder.add_edge("reason", "parallel_tasks")
+        builder.add_edge("parallel_tasks", "chat")
         builder.add_edge("default", END)
         builder.add_conditional_edges("executor", self.__need_invoke_tool)
         builder.add_conditional_edges("chat", self.__need_invoke_tool)
         builder.add_conditional_edges("data_clerk_tool", self.__after_invoke_tool)
 
         # 记忆功能
-        if Config.MESSAGE_MEMORY_USE == "local":
-            memory = InMemorySaver()
-        else:
-            memory = RedisSaver(Config.REDIS_URL)
-            # 第一次执行时初始化redis
-            # memory.setup()
+        memory = create_checkpointer(AssistantState, "assistant")
         graph = builder.compile(name=graph_name, checkpointer=memory)
         # # 生成PNG流程图
         # try:
@@ -884,10 +1049,11 @@ class AssistantService:
             configurable={"thread_id": session_id},
         )
 
-        res = self.__graph.invoke(
-            input=AssistantState(messages=[("user", question)]),
-            config=config,
-        )
+        with get_session_run_queue().run_sync(self.get_session_key(session_id)), checkpoint_turn_stats("assistant"):
+            res = self.__graph.invoke(
+                input=AssistantState(messages=[("user", question)]),
+                config=config,
+            )
 
         result = res["messages"][-1]
         content = str(result.content)
@@ -938,23 +1104,6 @@ class AssistantService:
                                    prompt=ASSISTANT_EXTRACT_QUERYING_DATA_PROMPT)
         return result
 
-    @tool
-    def __show_all_tasks(self, business_key: str) -> str:
-        """
-        根据业务键，查找所有任务信息
-
-        输入参数：
-        business_key: 业务键
-        """
-        tasks = self.__query_data_task_dao.get_all_tasks(business_key)
-
-        desc = "当前所有任务信息如下:\n"
-        for task in tasks:
-            detail = QueryDataTaskDetail.model_validate(json.loads(task.task_detail))
-            desc += f"任务名称：{task.task_name}\n{detail.to_desc()}\n\n"
-
-        return desc
-
 
 
 
@@ -970,14 +1119,45 @@ async def ask_data_clerk(business_key:str, session_id:str, task_name:str, params
     params: 执行任务时的查询条件（可以不传任何查询条件）
     """
     data_clerk_service = get_or_create_data_clerk_service(business_key)
-    query = f"执行任务:{task_name}" if params == "" else f"执行任务:{task_name}，查询条件:{params}"
-    content = await data_clerk_service.question(query, session_id)
+    start = time.perf_counter()
+    # 嵌套调用的优先级低于用户直接发起的提问
+    with llm_priority(LLMPriority.NESTED_TOOL):
+        if Config.ASSISTANT_DIRECT_TASK_EXECUTION:
+            # 任务名称已知，直接执行任务，省去意图识别和任务查找
+            # 嵌套调用只需要结果，临时运行不写数据员会话的checkpoint，并行调用之间也不会冲突
+            result = await data_clerk_service.execute_task_directly(session_id, task_name=task_name, params=params,
+                                                                    ephemeral=Config.ASSISTANT_NESTED_RUN_EPHEMERAL)
+            content = result.content
+            mode = "direct"
+        else:
+            query = f"执行任务:{task_name}" if params == "" else f"执行任务:{task_name}，查询条件:{params}"
+            content = await data_clerk_service.question(query, session_id)
+            mode = "graph"
+    metrics_util.observe("ask_data_clerk_seconds", time.perf_counter() - start, {"mode": mode})
 
     return content
 
 
 
 
+@tool
+def list_all_tasks(business_key: str) -> str:
+    """
+    根据业务键，查看所有任务信息
+
+    输入参数：
+    business_key: 业务键
+    """
+    tasks = dao_container.query_data_task_dao().get_all_tasks(business_key)
+
+    desc = "当前所有任务信息如下:\n"
+    for task in tasks:
+        detail = QueryDataTaskDetail.model_validate(json.loads(task.task_detail))
+        desc += f"任务名称：{task.name}\n{detail.to_desc_for_llm()}\n"
+
+    return desc
+
+
 def get_or_create_assistant_service(business_key) -> AssistantService:
     service = get_assistant_service(business_key)
     if service is None:
@@ -5,6 +5,8 @@ import os
 import queue
 import threading
 import time
+import uuid
+from datetime import date, datetime, timedelta
 from enum import StrEnum
 
 import redis
@@ -18,7 +20,7 @@ from langchain.output_parsers import OutputFixingParser
 from langchain_community.vectorstores import Redis
 from langchain_core.callbacks import BaseCallbackHandler, CallbackManager
 from langchain_core.documents import Document
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage, SystemMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnableConfig
@@ -27,9 +29,10 @@ from langchain_core.tools import tool
 from langchain_deepseek import ChatDeepSeek
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import OpenAIEmbeddings
-from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.constants import START, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.constants import START, END, TAG_NOSTREAM
 from langgraph.graph import StateGraph
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import ToolNode
 from langgraph.prebuilt.interrupt import HumanInterruptConfig, HumanInterrupt
@@ -48,16 +51,34 @@ from entity.llm_tool_entity import LLMToolType, LLMToolEntity
 from entity.query_data_task_entity import QueryDataTaskEntity
 from model.llm_http_tool_content import LLMHTTPToolContent
 from model.query_data_task_detail import QueryDataTaskDetail, DEFAULT_TASK_TEMPLATE
+from model.batch_execution import BatchExecution
+from model.task_execution_result import TaskExecutionResult
 from service.agent.model.interrupt import WorkflowInterrupt
 from service.agent.model.data_clerk_output_schema import QUERY_DATA, EXECUTE, CREATE, EDIT, DELETE, OTHERS, IntentSchema, \
     TaskSchema, DEFAULT, TableSchema, TEST_RUN, SAVE, LineChartSchema
 from service.agent.model.resume import WorkflowResume
 from service.agent.model.state import DataClerkState, InputState
+from service.cache.task_result_cache import SOURCE_PREFETCH, get_task_result_cache
+from service.cache.welcome_cache import get_welcome_cache, version_of
+from service.checkpoint.checkpointer_factory import create_checkpointer
+from service.checkpoint.instrumented_checkpointer import checkpoint_turn_stats
+from service.context.history_compactor import HistoryCompactor
+from service.context.prompt_assembler import PromptAssembler
+from service.context.tool_binding import observe_tool_schema_tokens, tool_schema_tokens, tools_for_task, \
+    used_tool_names
+from service.llm.gateway_chat_model import wrap_with_gateway
+from service.runtime.session_run_queue import get_session_run_queue
+from service.task.batch_execution import get_batch_execution_manager
+from service.task.execution_plan import compile_plan, plan_round_message, plan_tool_names, round_failed
+from service.task.execution_stats import TASK_OUTCOME_CACHED, TASK_OUTCOME_FAILED, TASK_OUTCOME_NOT_FOUND, \
+    TASK_OUTCOME_SKIPPED, TASK_OUTCOME_SUCCESS, task_outcome
+from service.task.execution_stats_writer import get_execution_stats_writer
+from service.task.task_ranking import get_task_ranking
 from service.tool.llm_http_tool import create_llm_http_tool
 from service.tool.mcp_client_tool import create_mcp_client_tools
-from util import datetime_util
+from util import datetime_util, metrics_util, token_util
 from util.config_util import read_private_config
-from langgraph.checkpoint.redis import RedisSaver
+from util.date_expression_util import DateRange, default_date_range, has_date_wording, resolve_date_expression
 from pydantic import BaseModel, Field, create_model
 
 from util.http_util import http_get, http_post
@@ -91,6 +112,7 @@ class GraphNode(StrEnum):
     TEST_RUN_TASK = "test_run_task" # 试跑任务
     DEFAULT_NODE = "default_node"
     CONVERT_TO_STANDARD_FORMAT = "convert_to_standard_format" # 把试跑或执行任务的结果转化成标准格式
+    COMPACT_HISTORY = "compact_history" # 对话历史过长时压缩成滚动摘要
     START = "__start__"
     END = "__end__"
 
@@ -99,6 +121,10 @@ class GraphNode(StrEnum):
 AI_CHAT_NODES = [GraphNode.EXECUTE_TASK, GraphNode.QUERY_DATA_NODE, GraphNode.HOW_TO_IMPROVE_TASK, GraphNode.DELETE_TASK, GraphNode.TEST_RUN_TASK, GraphNode.DEFAULT_NODE]
 # 记录人工构造AI MSG
 AI_MSG_NODES = [GraphNode.SAME_NAME_WHEN_CREATE, GraphNode.SAVE_TASK]
+# 直接执行任务时使用的thread后缀，与会话的对话thread区分
+DIRECT_EXECUTION_THREAD_SUFFIX = "direct_execution"
+# 临时运行使用的一次性thread前缀
+EPHEMERAL_THREAD_PREFIX = "ephemeral:"
 
 
 # 默认中断配置
@@ -142,14 +168,15 @@ class DataClerkService:
 
         # 初始化llm
         api_key: Optional[str] = read_private_config("deepseek", "API_KEY")
-        self.llm = ChatDeepSeek(
+        # 所有llm调用都经过LLM网关排队限流
+        self.llm = wrap_with_gateway(ChatDeepSeek(
             model=Config.LLM_MODEL,
             temperature=0,
             max_tokens=None,
             timeout=None,
             max_retries=2,
             api_key=api_key
-        )
+        ), business_key)
 
         agent_def = self.get_agent_def(business_key)
         if agent_def is None:
@@ -160,14 +187,24 @@ class DataClerkService:
         # 设置业务用所有工具方法
         self.business_tool_list = self.get_business_tool_list(agent_def)
 
-        # 设置业务用所有工具方法
-        self.execute_with_business_tool_list = [*self.business_tool_list, self.execute_once]
-
         # 删除任务的工具
         self.delete_task_tool_list = [add_human_in_the_loop(self.logical_delete_task, [WorkflowResume(resume_type="accept", resume_desc="删除", resume_mode="invoke")], lambda tool_input: f"是否确定要删除任务：{tool_input["task_name"]}?")]
 
+        # 对话历史压缩
+        self.history_compactor = HistoryCompactor(self.llm, "data_clerk",
+                                                  threshold_tokens=Config.HISTORY_COMPACT_THRESHOLD_TOKENS,
+                                                  keep_recent_tokens=Config.HISTORY_COMPACT_KEEP_RECENT_TOKENS)
+
+        # 按节点的上下文策略拼装提示词
+        self.prompt_assembler = PromptAssembler("data_clerk")
+
         # 初始化langGraph
         self.graph = self.create_graph(service_name)
+        # 直接执行已知任务的graph，不经过意图识别和任务查找
+        self.execution_graph = self.create_execution_graph(f"{service_name}_execution",
+                                                           create_checkpointer(DataClerkState, "data_clerk"))
+        # 临时运行的graph：不写checkpoint，每次使用一次性的thread，嵌套调用之间互不影响、可以并行
+        self.ephemeral_execution_graph = self.create_execution_graph(f"{service_name}_ephemeral_execution", None)
 
         # 初始化向量存储链接
         if Config.USE_VECTOR_STORE:
@@ -181,6 +218,7 @@ class DataClerkService:
         """
         builder = StateGraph(DataClerkState, input_schema=InputState)
         # 新Graph
+        builder.add_node(GraphNode.COMPACT_HISTORY, self.history_compactor.compact)
         builder.add_node(GraphNode.INTENT_CLASSIFIER, self.intent_classifier)
         builder.add_node(GraphNode.QUERY_DATA_NODE, self.query_data)
         builder.add_node(GraphNode.FIND_TASK_IN_DB, self.find_task_in_db)
@@ -199,8 +237,9 @@ class DataClerkService:
         builder.add_node(GraphNode.DEFAULT_NODE, self.default_node)
         builder.add_node(GraphNode.CONVERT_TO_STANDARD_FORMAT, self.convert_to_standard_format)
 
-        # 起始节点，判断意图
-        builder.add_edge(START, GraphNode.INTENT_CLASSIFIER)
+        # 起始节点，先压缩过长的对话历史，再判断意图
+        builder.add_edge(START, GraphNode.COMPACT_HISTORY)
+        builder.add_edge(GraphNode.COMPACT_HISTORY, GraphNode.INTENT_CLASSIFIER)
         builder.add_conditional_edges(GraphNode.INTENT_CLASSIFIER, self.after_intent_classifier)
         builder.add_conditional_edges(GraphNode.FIND_TASK_IN_DB, self.check_exist_and_next_node)
         builder.add_conditional_edges(GraphNode.FIND_TASK_IN_STORE, self.check_exist_in_store_and_next_node)
@@ -219,12 +258,7 @@ class DataClerkService:
         builder.add_edge(GraphNode.DEFAULT_NODE, END)
 
         # 记忆功能
-        if Config.MESSAGE_MEMORY_USE == "local":
-            memory = InMemorySaver()
-        else:
-            memory = RedisSaver(Config.REDIS_URL)
-            # 第一次执行时初始化redis
-            # memory.setup()
+        memory = create_checkpointer(DataClerkState, "data_clerk")
         graph = builder.compile(name=graph_name, checkpointer=memory)
         # 生成PNG流程图
         try:
@@ -237,6 +271,24 @@ class DataClerkService:
             logging.exception("Failed to generate PNG workflow diagram", e)
 
         return graph
+
+    def create_execution_graph(self, graph_name, checkpointer: BaseCheckpointSaver | None):
+        """
+        创建直接执行任务的Graph：只包含执行任务和调用工具两个节点
+        :param graph_name:
+        :param checkpointer: 为空时不保存checkpoint
+        :return: graph
+        """
+        builder = StateGraph(DataClerkState)
+        builder.add_node(GraphNode.EXECUTE_TASK, self.execute_task)
+        builder.add_node(GraphNode.TOOLS_FOR_TASK, ToolNode(self.business_tool_list))
+
+        builder.add_edge(START, GraphNode.EXECUTE_TASK)
+        builder.add_conditional_edges(GraphNode.EXECUTE_TASK, self.need_invoke_tool_when_execute)
+        builder.add_edge(GraphNode.TOOLS_FOR_TASK, GraphNode.EXECUTE_TASK)
+
+        return builder.compile(name=graph_name, checkpointer=checkpointer)
+
     def create_vector_store(self) -> RedisVectorStore:
         """
         创建向量存储
@@ -326,10 +378,11 @@ class DataClerkService:
             configurable={"thread_id": session_id},
         )
 
-        res = await self.graph.ainvoke(
-            input=InputState(messages=[("user", query)]),
-            config=config,
-        )
+        async with get_session_run_queue().run(self.get_session_key(session_id)), checkpoint_turn_stats("data_clerk"):
+            res = await self.graph.ainvoke(
+                input=InputState(messages=[("user", query)]),
+                config=config,
+            )
 
         result = res["messages"][-1]
         content = str(result.content)
@@ -339,6 +392,86 @@ class DataClerkService:
 
         return content
 
+    async def execute_task_directly(self, session_id: str | None, task_id: int | None = None, task_name: str | None = None,
+                                    params: str | None = None, ephemeral: bool = False,
+                                    prefetch: bool = False) -> TaskExecutionResult:
+        """
+        按任务id或名称直接执行任务，不经过意图识别和任务查找
+        :param session_id: 会话id，执行记录保存在该会话单独的thread中(只保留最近一次执行)，临时运行时可以为空
+        :param task_id: 任务id
+        :param task_name: 任务名称，没有任务id时按名称查找
+        :param params: 执行任务时的查询条件
+        :param ephemeral: 临时运行，使用一次性的thread且不写checkpoint，结果只返回给调用方
+        :param prefetch: 预取运行，不读取结果缓存，成功的结果写入结果缓存，不计入任务执行统计
+        :return: 执行结果
+        """
+        if not ephemeral and session_id is None:
+            raise ValueError("非临时运行必须指定session_id")
+        start = time.perf_counter()
+        params = params or None
+        entity = self.find_task_by_id_or_name(task_id, task_name, self.business_key)
+        if entity is None:
+            return self.__direct_execution_result(start, TASK_OUTCOME_NOT_FOUND, task_id, task_name, params,
+                                                  f"未找到任务:{task_name if task_name is not None else task_id}")
+
+        query = f"执行任务:{entity.name}" if params is None else f"执行任务:{entity.name}，查询条件:{params}"
+        messages = [HumanMessage(content=query)]
+        if not ephemeral:
+            # 同一会话的直接执行共用一个thread，只保留本次执行的消息，避免checkpoint和重放的历史无限增长
+            messages = [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]
+        input_state = DataClerkState(
+            messages=messages,
+            intent_type=EXECUTE,
+            task_id=entity.id,
+            task_name=entity.name,
+            task_detail=QueryDataTaskDetail.model_validate(json.loads(entity.task_detail)),
+            params=params,
+            prefetch=prefetch,
+        )
+        if prefetch and self.result_date_key(input_state) is None:
+            # 查询日期包含今天(例如本月)或无法确定时结果不会写入缓存，预取没有意义
+            return self.__direct_execution_result(start, TASK_OUTCOME_SKIPPED, entity.id, entity.name, params,
+                                                  "查询日期包含今天或无法确定，不预取")
+        try:
+            if ephemeral:
+                # 一次性的thread，不需要会话串行，也没有checkpoint读写
+                config = RunnableConfig(configurable={"thread_id": f"{EPHEMERAL_THREAD_PREFIX}{uuid.uuid4()}"})
+                metrics_util.inc_counter("data_clerk_ephemeral_runs_total", {"business_key": self.business_key})
+                res = await self.ephemeral_execution_graph.ainvoke(input=input_state, config=config)
+            else:
+                # 与对话使用不同的thread，执行记录不会混入会话上下文
+                thread_id = f"{session_id}:{DIRECT_EXECUTION_THREAD_SUFFIX}"
+                config = RunnableConfig(configurable={"thread_id": thread_id})
+                async with get_session_run_queue().run(self.get_session_key(thread_id)), checkpoint_turn_stats("data_clerk"):
+                    res = await self.execution_graph.ainvoke(input=input_state, config=config)
+        except Exception as e:
+            logging.exception("直接执行任务失败，任务:%s", entity.name)
+            return self.__direct_execution_result(start, TASK_OUTCOME_FAILED, entity.id, entity.name, params,
+                                                  f"执行任务失败:{e}")
+
+        return self.__direct_execution_result(start, task_outcome(res["messages"]), entity.id, entity.name, params,
+                                              str(res["messages"][-1].content))
+
+    def __direct_execution_result(self, start: float, outcome: str, task_id: int | None, task_name: str | None,
+                                  params: str | None, content: str) -> TaskExecutionResult:
+        duration = time.perf_counter() - start
+        metrics_util.observe("task_direct_execution_seconds", duration,
+                             {"business_key": self.business_key, "outcome": outcome})
+        return TaskExecutionResult(task_id=task_id, task_name=task_name, params=params, content=content,
+                                   outcome=outcome, duration_seconds=round(duration, 3))
+
+    def submit_batch_execution(self, task_ids: list[int] | None = None, task_names: list[str] | None = None,
+                               params_list: list[str] | None = None, concurrency: int | None = None) -> BatchExecution:
+        """
+        批量执行任务：每个任务按每个查询条件各临时运行一次，在后台由有界的工作池执行
+        :param task_ids: 任务id列表
+        :param task_names: 任务名称列表
+        :param params_list: 查询条件列表，为空时每个任务按默认条件执行一次
+        :param concurrency: 并发执行的作业数
+        :return: 批次，可以按批次id查询作业状态和结果
+        """
+        return get_batch_execution_manager().submit(self, task_ids, task_names, params_list, concurrency)
+
     def resume(self, resume_type, session_id) -> (str, WorkflowInterrupt):
         """
         同步回复中断
@@ -349,10 +482,11 @@ class DataClerkService:
         # 上下文配置
         config = {"configurable": {"thread_id": session_id}}
 
-        res = self.graph.invoke(
-            Command(resume=[{"resumeType": resume_type}]),
-            config=config,
-        )
+        with get_session_run_queue().run_sync(self.get_session_key(session_id)), checkpoint_turn_stats("data_clerk"):
+            res = self.graph.invoke(
+                Command(resume=[{"resumeType": resume_type}]),
+                config=config,
+            )
 
         # 如果是中断
         if "__interrupt__" in res:
@@ -373,12 +507,20 @@ class DataClerkService:
             configurable={"thread_id": session_id},
         )
 
-        stream = self.graph.stream(input=Command(resume=[{"resumeType": resume_type}]),
-                                   config=config,
-                                   stream_mode=["messages", "tasks"])
+        stream = self.graph.astream(input=Command(resume=[{"resumeType": resume_type}]),
+                                    config=config,
+                                    stream_mode=["messages", "tasks"])
 
         return stream
 
+    def get_session_key(self, session_id) -> str:
+        """
+        会话串行执行队列使用的键，同一个会话的多轮运行串行执行
+        :param session_id:
+        :return: 会话键
+        """
+        return f"data_clerk:{self.business_key}:{session_id}"
+
 
     # NODES
     async def intent_classifier(self, state: DataClerkState):
@@ -393,7 +535,7 @@ class DataClerkService:
             state.intent_type = DEFAULT
             return state
 
-        intent_prompt = ChatPromptTemplate.from_messages([
+        intent_prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.INTENT_CLASSIFIER, state, [
             # 系统提示词
             ("system", f"""{self.basic_system_template}
             
@@ -416,9 +558,7 @@ class DataClerkService:
             # 明确标识示例区
             MessagesPlaceholder("examples", optional=True),
             ("system", "以下才是真实对话："),
-            # 包含所有历史对话
-            *state.messages
-        ])
+        ]))
 
         examples = [
             # 使用few-shot示例（强调AI必须返回JsonOutputParser的格式，不加AI会尝试返回自然语言的KV）：
@@ -484,21 +624,33 @@ class DataClerkService:
         return state
 
     async def default_node(self, state:DataClerkState):
-        # 初次调用，使用原始用户查询
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=f"""
-                        {self.basic_system_template}
+        # 自我介绍只依赖智能体的系统提示词和当前日期，按版本缓存，定义或日期变化后才重新生成
+        agent_def = await asyncio.to_thread(self.get_agent_def, self.business_key)
+        system_prompt = (agent_def.system_prompt + f"\n当前日期:{datetime_util.get_current_date()}"
+                         if agent_def is not None else self.basic_system_template)
+
+        async def generate() -> str:
+            prompt = ChatPromptTemplate.from_messages([
+                SystemMessage(content=f"""
+                            {system_prompt}
 
-                        请介绍一下自己，然后询问：有什么可以帮您？
-                          """),
-            HumanMessage(content="{user_input}")  # 用户最后一条消息
-        ])
+                            请介绍一下自己，然后询问：有什么可以帮您？
+                              """),
+                HumanMessage(content="{user_input}")  # 用户最后一条消息
+            ])
 
-        chain = prompt | self.llm
-        response = await chain.ainvoke({"user_input":"请介绍一下自己"})
+            # 生成时不流式输出token，由节点返回的完整消息统一输出，避免与缓存消息重复
+            chain = prompt | self.llm.with_config(tags=[TAG_NOSTREAM])
+            response = await chain.ainvoke({"user_input":"请介绍一下自己"})
+            return response.content
 
+        content = await get_welcome_cache().get_or_generate(self.business_key,
+                                                            version_of(system_prompt, Config.LLM_MODEL),
+                                                            generate)
+
+        # 每次使用新的消息id，避免同一会话中多次介绍时被当成同一条消息覆盖
         return {
-            "messages": [response],
+            "messages": [AIMessage(content=content, id=str(uuid.uuid4()))],
         }
 
 
@@ -555,30 +707,74 @@ class DataClerkService:
         all_messages = state.messages
         # 如果是工具返回后的再次调用
         if isinstance(all_messages[-1], ToolMessage):
-            # 使用完整的对话历史作为上下文
-            prompt = ChatPromptTemplate.from_messages([
+            plan = state.task_detail.execution_plan
+            if state.plan_round is not None and plan is not None:
+                if round_failed(all_messages):
+                    # 按计划调用工具失败，剩下的交给llm规划
+                    metrics_util.inc_counter("task_plan_fallback_total", {"business_key": self.business_key})
+                    logging.info("执行计划回放失败，改由llm规划，任务:%s", state.task_name)
+                    state.plan_round = None
+                elif state.plan_round < len(plan):
+                    return self.replay_plan_round(state, state.plan_round)
+
+            # 上下文范围由节点的上下文策略决定
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.EXECUTE_TASK, state, [
                 SystemMessage(content=f"""
                 {self.basic_system_template}
 
                 任务ID:{state.task_id}                
                 任务详情:
-                {state.task_detail}
+                {state.task_detail.to_desc()}
                 
                 {f"执行任务的查询条件为：{state.params}" if state.params is not None else ""}       
+                {self.task_date_prompt(state)}
                 
                 """),
-                *all_messages  # 包含所有历史消息
-            ])
-            chain = prompt | self.llm.bind_tools(self.execute_with_business_tool_list)
-            response = await chain.ainvoke({})
+            ]))
+            started_at = state.task_started_at or time.time()
+            try:
+                response, full_tools = await self.invoke_with_task_tools(GraphNode.EXECUTE_TASK, state, prompt)
+            except Exception:
+                self.record_task_execution(state, started_at, TASK_OUTCOME_FAILED)
+                raise
+            if not response.tool_calls:
+                # 任务执行完成，记录执行统计，以及本次用到的工具和执行计划，之后执行时只绑定这些工具并直接按计划调用
+                outcome = task_outcome(all_messages)
+                self.record_task_execution(state, started_at, outcome)
+                self.store_prefetched_result(state, outcome, response.content)
+                return {
+                    "messages": [response],
+                    "task_started_at": None,
+                    "plan_round": None,
+                    "full_tools": False,
+                    **self.learn_task_execution(state, persist=True, compile_execution_plan=outcome == TASK_OUTCOME_SUCCESS),
+                }
             return {
                 "messages": [response],
+                "plan_round": None,
+                "full_tools": full_tools,
             }
         else:
-            last_human_message = state.messages[-1].content
+            # 每次执行先按任务记录的工具绑定
+            state.full_tools = False
+            cached = self.cached_task_result(state)
+            if cached is not None:
+                # 预取过的结果直接返回，不需要调用llm和工具
+                self.record_task_execution(state, time.time(), TASK_OUTCOME_CACHED)
+                return {
+                    "messages": [AIMessage(content=cached)],
+                    "task_started_at": None,
+                    "plan_round": None,
+                    "full_tools": False,
+                }
+
+            plan = state.task_detail.execution_plan
+            if self.can_replay_plan(state, plan):
+                # 任务已有执行计划，直接按计划调用工具，不需要llm规划
+                return {**self.replay_plan_round(state, 0), "task_started_at": time.time(), "full_tools": False}
 
             # 初次调用，使用原始用户查询
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.EXECUTE_TASK, state, [
                 SystemMessage(content=f"""
                 {self.basic_system_template}
                 
@@ -590,17 +786,32 @@ class DataClerkService:
                 {state.task_detail.to_desc()}
                 
                 {f"执行任务的查询条件为：{state.params}" if state.params is not None else ""}
-                
-                注意：每次执行完任务的最后，一定要调用工具，传入任务id，把任务的执行次数加1
+                {self.task_date_prompt(state)}
                 """
                               ),
-                HumanMessage(content="{user_input}")  # 用户最后一条消息
-            ])
+            ]))
 
-            chain = prompt | self.llm.bind_tools(self.execute_with_business_tool_list)
-            response = await chain.ainvoke({"user_input": last_human_message})
+            started_at = time.time()
+            try:
+                response, full_tools = await self.invoke_with_task_tools(GraphNode.EXECUTE_TASK, state, prompt)
+            except Exception:
+                self.record_task_execution(state, started_at, TASK_OUTCOME_FAILED)
+                raise
+            if not response.tool_calls:
+                # 不需要调用工具，任务直接执行完成
+                self.record_task_execution(state, started_at, TASK_OUTCOME_SUCCESS)
+                self.store_prefetched_result(state, TASK_OUTCOME_SUCCESS, response.content)
+                return {
+                    "messages": [response],
+                    "task_started_at": None,
+                    "plan_round": None,
+                    "full_tools": False,
+                }
             return {
                 "messages": [response],
+                "task_started_at": started_at,
+                "plan_round": None,
+                "full_tools": full_tools,
             }
 
     async def query_data(self, state: DataClerkState):
@@ -609,13 +820,11 @@ class DataClerkService:
         :param state:
         :return:state
         """
-        all_messages = state.messages
-
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.QUERY_DATA_NODE, state, [
             SystemMessage(content=f"{self.basic_system_template}"),
-            *all_messages  # 包含所有历史消息
-        ])
-        chain = prompt | self.llm.bind_tools(self.business_tool_list)
+        ]))
+        # 数据查询没有对应的任务，绑定全部工具
+        chain = prompt | self.bind_tools_for_task(GraphNode.QUERY_DATA_NODE, None)
         response = await chain.ainvoke({})
 
         return {
@@ -636,7 +845,7 @@ class DataClerkService:
     async def edit_task(self, state: DataClerkState):
         parser = JsonOutputParser(pydantic_object=TaskSchema)
 
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.EDIT_TASK, state, [
             ("system", f"""
                        {self.basic_system_template}
 
@@ -655,9 +864,7 @@ class DataClerkService:
                        """),
             # 明确标识示例区
             MessagesPlaceholder("examples", optional=True),
-            # 包含历史所有对话
-            *state.messages
-        ])
+        ]))
 
         examples = [
             ("human", "任务目标和具体内容：每日工作效率统计。查询条件为：查询昨天的数据。获取到结果之后的数据加工逻辑：单加一列，工作量除以工作时长为工作效率。数据格式：表格"),
@@ -683,7 +890,7 @@ class DataClerkService:
         :param state:
         :return:state
         """
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.DELETE_TASK, state, [
             SystemMessage(content=f"""
                                    {self.basic_system_template}
                                    你现在要做的事情是删除取数任务
@@ -702,7 +909,7 @@ class DataClerkService:
                                    
                                    注意:任务id不要透露给用户
                                    """),
-            *state.messages])
+        ]))
 
         chain = prompt | self.llm.bind_tools(self.delete_task_tool_list)
 
@@ -727,7 +934,7 @@ class DataClerkService:
             # 后续根据用户提示信息更新模板
             parser = JsonOutputParser(pydantic_object=TaskSchema)
 
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.CREATE_TASK, state, [
                 ("system", f"""
                 {self.basic_system_template}
                 
@@ -742,9 +949,7 @@ class DataClerkService:
                 """),
                 # 明确标识示例区
                 MessagesPlaceholder("examples", optional=True),
-                # 包含历史所有对话
-                *state.messages
-            ])
+            ]))
 
             examples = [
                 ("human", "任务目标和具体内容：每日工作效率统计。查询参数：查询昨天的数据，数据加工逻辑：单加一列：工作量除以工作时长为工作效率，数据格式：表格"),
@@ -783,6 +988,8 @@ class DataClerkService:
             id = self.query_data_task_dao.save(entity)
         else:
             id = self.query_data_task_dao.save(entity)
+        get_task_ranking().invalidate(self.business_key)
+        get_task_result_cache().invalidate(self.business_key, id)
 
         # 如果没有使用向量存储，则返回
         if Config.USE_VECTOR_STORE:
@@ -811,7 +1018,7 @@ class DataClerkService:
 
         # 如果是工具返回后的再次调用
         if isinstance(all_messages[-1], ToolMessage):
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.TEST_RUN_TASK, state, [
                 SystemMessage(content=f"""
                 {self.basic_system_template}
                 你的职责是调用工具执行以下任务：
@@ -820,19 +1027,19 @@ class DataClerkService:
                 {state.task_detail.to_desc()}
                 
                 {f"试运行的查询条件为：{state.params}" if state.params is not None else ""}              
-                如果你所用到的工具的参数涉及到日期，默认查询当前时间的前一天
+                {self.task_date_prompt(state)}
                 
                 只用返回按用户要求进行数据加工之后的结果
                 
                 """),
-                *all_messages  # 包含所有历史消息
-            ])
+            ]))
 
-            chain = prompt | self.llm.bind_tools(self.business_tool_list)
-            response = await chain.ainvoke({})
+            response, full_tools = await self.invoke_with_task_tools(GraphNode.TEST_RUN_TASK, state, prompt)
         else:
-            # 与工具返回后的调用区别在于，这里不传所有历史信息
-            prompt = ChatPromptTemplate.from_messages([
+            # 每次试运行先按任务记录的工具绑定
+            state.full_tools = False
+            # 与工具返回后的调用区别在于系统提示词，上下文范围同样由节点的上下文策略决定
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.TEST_RUN_TASK, state, [
                 SystemMessage(content=f"""
                            {self.basic_system_template}
                            你的职责是调用工具执行以下任务：
@@ -841,17 +1048,24 @@ class DataClerkService:
                            {state.task_detail.to_desc()}
                            
                            {f"试运行的查询条件为：{state.params}" if state.params is not None else ""}
-                           如果你所用到的工具的参数涉及到日期，默认查询当前时间的前一天
+                           {self.task_date_prompt(state)}
 
                            只用返回按用户要求进行数据加工之后的结果。
 
                            """),
-            ])
-            chain = prompt | self.llm.bind_tools(self.business_tool_list)
-            response = await chain.ainvoke({})
+            ]))
+            response, full_tools = await self.invoke_with_task_tools(GraphNode.TEST_RUN_TASK, state, prompt)
 
+        if not response.tool_calls and isinstance(state.messages[-1], ToolMessage):
+            # 试跑完成，记录用到的工具，保存任务时一起保存
+            return {
+                "messages": [response],
+                "full_tools": False,
+                **self.learn_task_execution(state, persist=False),
+            }
         return {
             "messages": [response],
+            "full_tools": full_tools,
             }
 
 
@@ -944,7 +1158,7 @@ class DataClerkService:
         :return: state
         """
         if state.task_detail is None or not state.task_detail.is_integrated():
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.HOW_TO_IMPROVE_TASK, state, [
                 SystemMessage(content=f"""
                             {self.basic_system_template}
                             你的职责是对比：
@@ -956,11 +1170,11 @@ class DataClerkService:
                             这两者之间的差别。
                             提示用户模板里还有哪些内容是需要填写的，如果确认用户已经全部填写完成，请询问用户是否进行任务的试算或保存。
                             """),
-                *state.messages])
+            ]))
 
             chain = prompt | self.llm
         else:
-            prompt = ChatPromptTemplate.from_messages([
+            prompt = ChatPromptTemplate.from_messages(self.prompt_assembler.assemble(GraphNode.HOW_TO_IMPROVE_TASK, state, [
                 SystemMessage(content=f"""
                                         {self.basic_system_template}
                                         
@@ -970,7 +1184,7 @@ class DataClerkService:
 
                                         你的职责是向用户简单、准确的展示任务的名称及任务的详情（而不是真正执行任务）。之后询问用户是否需要补充，或者进行任务的试算或保存
                                         """),
-                *state.messages])
+            ]))
 
             chain = prompt | self.llm
 
@@ -1066,6 +1280,14 @@ class DataClerkService:
         else:
             return END
 
+    def need_invoke_tool_when_execute(self, state: DataClerkState) -> Literal[GraphNode.TOOLS_FOR_TASK, GraphNode.END]:
+        """
+        直接执行任务时，需要调用工具则调用，否则结束(不需要转换标准格式)
+        """
+        if state.messages[-1].tool_calls:
+            return GraphNode.TOOLS_FOR_TASK
+        return END
+
     def after_invoke_tool(self, state: DataClerkState) -> Literal[GraphNode.EXECUTE_TASK, GraphNode.TEST_RUN_TASK, GraphNode.END]:
         if state.intent_type == EXECUTE:
             return GraphNode.EXECUTE_TASK
@@ -1098,6 +1320,8 @@ class DataClerkService:
            business_key：业务键
        """
         self.query_data_task_dao.delete(id, business_key)
+        get_task_ranking().invalidate(business_key)
+        get_task_result_cache().invalidate(business_key, id)
 
         # 如果没有使用向量存储，则返回
         if Config.USE_VECTOR_STORE:
@@ -1106,26 +1330,6 @@ class DataClerkService:
         return True
 
 
-    def get_frequently_and_usually_execute_tasks(self) -> set[str]:
-        """
-        获取最频繁/最近执行过的任务名称
-        :return:任务名称列表
-        """
-        usually_execute_tasks = self.query_data_task_dao.get_usually_execute_top3_tasks(self.business_key)
-
-        names = set()
-        not_in_ids = []
-        for t in usually_execute_tasks:
-            names.add(t.name)
-            not_in_ids.append(t.id)
-
-        frequently_execute_tasks = self.query_data_task_dao.get_frequently_execute_top3_tasks(self.business_key, not_in_ids)
-
-        for t in frequently_execute_tasks:
-            names.add(t.name)
-
-        return names
-
     def get_event_stream_function(self, input: str | None, session_id, stream_type: Literal["question", "resume"]):
         """
         获取流式方法，这个方法直接返回给前端使用
@@ -1138,29 +1342,31 @@ class DataClerkService:
         @stream_with_context
         async def async_event_stream():
             try:
-                # 根据不同的流类型获取对应的流
-                if stream_type == "question":
-                    stream = self.stream_question(input, session_id)
-                elif stream_type == "resume":
-                    stream = self.stream_resume(input, session_id)
-                else:
-                    stream = self.default(session_id)
-
-                # 直接异步迭代处理流数据
-                async for stream_mode, detail in stream:
-                    # print(stream_mode, detail)
-                    if stream_mode == "messages":
-                        chunk, metadata = detail
-                        if metadata['langgraph_node'] in AI_CHAT_NODES:
-                            content = chunk.content
-                            yield f"data: {json.dumps({'msgId': chunk.id, 'token': content})}\n\n"
-                    elif stream_mode == "tasks":
-                        if "interrupts" in detail and len(detail["interrupts"]) > 0:
-                            yield f"data: {json.dumps({'interrupt': convert_2_interrupt(detail['interrupts'][0]).to_json()})}\n\n"
-                        elif detail["name"] in AI_MSG_NODES:
-                            content = get_tasks_mode_ai_msg_content(detail)
-                            if content is not None:
-                                yield f"data: {json.dumps({'msgId': detail['id'], 'token': content})}\n\n"
+                # 同一会话的多轮运行串行执行，避免并发写同一个thread的checkpoint
+                async with get_session_run_queue().run(self.get_session_key(session_id)), checkpoint_turn_stats("data_clerk"):
+                    # 根据不同的流类型获取对应的流
+                    if stream_type == "question":
+                        stream = self.stream_question(input, session_id)
+                    elif stream_type == "resume":
+                        stream = self.stream_resume(input, session_id)
+                    else:
+                        stream = self.default(session_id)
+
+                    # 直接异步迭代处理流数据
+                    async for stream_mode, detail in stream:
+                        # print(stream_mode, detail)
+                        if stream_mode == "messages":
+                            chunk, metadata = detail
+                            if metadata['langgraph_node'] in AI_CHAT_NODES:
+                                content = chunk.content
+                                yield f"data: {json.dumps({'msgId': chunk.id, 'token': content})}\n\n"
+                        elif stream_mode == "tasks":
+                            if "interrupts" in detail and len(detail["interrupts"]) > 0:
+                                yield f"data: {json.dumps({'interrupt': convert_2_interrupt(detail['interrupts'][0]).to_json()})}\n\n"
+                            elif detail["name"] in AI_MSG_NODES:
+                                content = get_tasks_mode_ai_msg_content(detail)
+                                if content is not None:
+                                    yield f"data: {json.dumps({'msgId': detail['id'], 'token': content})}\n\n"
                 # print("ready to done")
                 yield "event: done\ndata: \n\n"
 
@@ -1221,20 +1427,221 @@ class DataClerkService:
 
         return entity
 
-    @tool
-    def execute_once(self, id: int, business_key: str):
+    def record_task_execution(self, state: DataClerkState, started_at: float, outcome: str):
         """
-              当执行任务时，把执行任务的次数+1
-
-              输入参数：
-              id：任务唯一id
-              business_key：业务键
-          """
-        self.query_data_task_dao.update_execute_times_once(id, business_key)
+        任务执行结束时记录执行统计：执行次数、最近执行时间、耗时和结果，由统计写入器缓冲后批量写库，统计失败不影响任务结果。
+        命中缓存时只累加执行次数，不计入耗时，也不覆盖最近一次实际执行的耗时和结果
+        :param state:
+        :param started_at: 执行开始时间
+        :param outcome: 执行结果
+        """
+        if state.task_id is None:
+            return
+        cached = outcome == TASK_OUTCOME_CACHED
+        duration = time.time() - started_at
+        labels = {"business_key": self.business_key, "outcome": outcome}
+        metrics_util.inc_counter("task_executions_total", labels)
+        if not cached:
+            metrics_util.observe("task_execution_seconds", duration, labels)
+        if state.prefetch:
+            # 预取不是用户发起的执行，计入排行会让预取的任务一直保持热门
+            return
+        get_task_ranking().on_execution(self.business_key, state.task_id, state.task_name, started_at)
+        try:
+            get_execution_stats_writer().record(state.task_id, self.business_key,
+                                                datetime_util.format_datatime(datetime.fromtimestamp(started_at)),
+                                                None if cached else int(duration * 1000),
+                                                None if cached else outcome)
+        except Exception as e:
+            logging.warning("记录任务执行统计失败，任务:%s, %s", state.task_name, e)
 
     def get_agent_def(self, business_key) -> AgentDefEntity | None:
         return self.agent_def_dao.find_by_business_key_and_type(business_key, AgentDefType.DATA_CLERK)
 
+    def bind_tools_for_task(self, node: str, task_detail: QueryDataTaskDetail | None, full_tools: bool = False):
+        """
+        按任务记录的工具绑定llm，任务没有记录或记录的工具已不存在时绑定全部业务工具
+        :param node: 节点名称，用于统计工具定义的token数
+        :param task_detail: 任务详情
+        :param full_tools: 是否直接绑定全部业务工具
+        :return: 绑定了工具的llm
+        """
+        tool_names = task_detail.tool_names if task_detail is not None and not full_tools else None
+        tools, subset = tools_for_task(self.business_tool_list, tool_names)
+        observe_tool_schema_tokens("data_clerk", node, tools, subset)
+        return self.llm.bind_tools(tools)
+
+    async def invoke_with_task_tools(self, node: str, state: DataClerkState, prompt) -> tuple[AIMessage, bool]:
+        """
+        按任务记录的工具调用llm。只绑定了工具子集，且本轮有工具调用失败或没有得到结果时，
+        可能是这次的查询条件需要其他工具，改为绑定全部业务工具重新调用，之后的调用也绑定全部工具，
+        执行完成后再从这次实际用到的工具中学习
+        :param node: 节点名称
+        :param state:
+        :param prompt: 提示词模板
+        :return: llm的返回，本次执行是否已改为绑定全部工具
+        """
+        response = await (prompt | self.bind_tools_for_task(node, state.task_detail, state.full_tools)).ainvoke({})
+        if response.tool_calls or state.full_tools or state.task_detail is None:
+            return response, state.full_tools
+        _, subset = tools_for_task(self.business_tool_list, state.task_detail.tool_names)
+        if not subset or (task_outcome(state.messages) == TASK_OUTCOME_SUCCESS and str(response.content).strip() != ""):
+            return response, False
+        metrics_util.inc_counter("task_tool_subset_fallback_total", {"business_key": self.business_key, "node": node})
+        logging.info("按任务记录的工具执行失败或没有得到结果，改为绑定全部工具，任务:%s", state.task_name)
+        response = await (prompt | self.bind_tools_for_task(node, state.task_detail, True)).ainvoke({})
+        return response, True
+
+    def learn_task_execution(self, state: DataClerkState, persist: bool, compile_execution_plan: bool = False) -> dict:
+        """
+        把本轮成功调用过的业务工具合并到任务记录的工具中，并按需要把本轮的工具调用编译成执行计划
+        :param state:
+        :param persist: 是否直接更新已保存的任务
+        :param compile_execution_plan: 是否记录执行计划
+        :return: 需要更新的state
+        """
+        if state.task_detail is None:
+            return {}
+        business_tool_names = {t.name for t in self.business_tool_list}
+        recorded = state.task_detail.tool_names or []
+        learned = recorded + [name for name in used_tool_names(state.messages)
+                              if name in business_tool_names and name not in recorded]
+        update = {}
+        if len(learned) > 0 and learned != recorded:
+            update["tool_names"] = learned
+        reference_day = self.plan_reference_day(state)
+        if compile_execution_plan and reference_day is not None:
+            plan = compile_plan(state.messages, reference_day)
+            if plan is not None and plan != state.task_detail.execution_plan and plan_tool_names(plan) <= business_tool_names:
+                update["execution_plan"] = plan
+        if len(update) == 0:
+            return {}
+
+        task_detail = state.task_detail.model_copy(update=update)
+        if persist and state.task_id is not None:
+            self.query_data_task_dao.save(QueryDataTaskEntity(
+                id=state.task_id,
+                business_key=self.business_key,
+                name=state.task_name,
+                task_detail=json.dumps(task_detail.to_dict(), ensure_ascii=False),
+            ))
+        logging.info("记录任务的执行方式，任务:%s, %s", state.task_name, update)
+        return {"task_detail": task_detail}
+
+    @staticmethod
+    def resolve_task_date(state: DataClerkState) -> DateRange | None:
+        """
+        在调用llm之前解析查询日期：优先使用执行时的查询条件，其次是任务的查询条件，都没有日期时默认查询前一天
+        :return: 日期范围，查询条件中的日期说法无法完全解析(例如上周三)时返回None，交给llm理解
+        """
+        for text in (state.params, state.task_detail.query_param if state.task_detail is not None else None):
+            resolved = resolve_date_expression(text)
+            if resolved is not None:
+                return resolved
+            if has_date_wording(text):
+                return None
+        return default_date_range()
+
+    @staticmethod
+    def task_date_prompt(state: DataClerkState) -> str:
+        """
+        提示词中关于查询日期的说明
+        """
+        resolved = DataClerkService.resolve_task_date(state)
+        if resolved is None:
+            return f"如果你所用到的工具的参数涉及到日期，请根据查询条件和当前日期{datetime_util.get_current_date()}确定具体日期"
+        return f"如果你所用到的工具的参数涉及到日期，{resolved.describe()}"
+
+    @staticmethod
+    def plan_reference_day(state: DataClerkState) -> date | None:
+        """
+        执行计划中相对日期的基准日：计划中的"昨天"对应要查询的那一天
+        :return: 基准日，查询的不是单个日期或者执行时的查询条件还有日期以外的内容(需要llm理解)时返回None
+        """
+        if state.params is not None:
+            resolved = resolve_date_expression(state.params)
+            if resolved is None or resolved.has_other_conditions():
+                return None
+        else:
+            resolved = DataClerkService.resolve_task_date(state)
+        if resolved is None or not resolved.is_single_day():
+            return None
+        return resolved.start + timedelta(days=1)
+
+    @staticmethod
+    def result_date_key(state: DataClerkState) -> str | None:
+        """
+        任务结果缓存中的日期键，只缓存已经结束的日期(今天之前)，包含今天的数据还会变化
+        :return: 查询日期范围的键，执行时的查询条件还有日期以外的内容，或者日期范围包含今天时返回None(不使用缓存)
+        """
+        if state.params is not None:
+            resolved = resolve_date_expression(state.params)
+            if resolved is None or resolved.has_other_conditions():
+                return None
+        else:
+            resolved = DataClerkService.resolve_task_date(state)
+        if resolved is None or resolved.end >= date.today():
+            return None
+        return resolved.key()
+
+    def cached_task_result(self, state: DataClerkState) -> str | None:
+        """
+        获取缓存的任务结果，预取运行本身不读取缓存
+        """
+        if state.prefetch or state.task_id is None:
+            return None
+        date_key = self.result_date_key(state)
+        if date_key is None:
+            return None
+        return get_task_result_cache().get(self.business_key, state.task_id, date_key)
+
+    def store_prefetched_result(self, state: DataClerkState, outcome: str, content):
+        """
+        预取运行成功时把结果写入结果缓存
+        """
+        if not state.prefetch or outcome != TASK_OUTCOME_SUCCESS or state.task_id is None:
+            return
+        date_key = self.result_date_key(state)
+        if date_key is not None:
+            get_task_result_cache().put(self.business_key, state.task_id, date_key, str(content), SOURCE_PREFETCH)
+
+    def can_replay_plan(self, state: DataClerkState, plan: list[list[dict]] | None) -> bool:
+        """
+        是否可以直接按执行计划调用工具：有执行计划、计划中的工具都还存在，并且查询条件只有可以直接解析的单个日期
+        """
+        if plan is None or len(plan) == 0:
+            return False
+        if self.plan_reference_day(state) is None:
+            metrics_util.inc_counter("task_plan_skipped_total", {"business_key": self.business_key, "reason": "params"})
+            return False
+        if not plan_tool_names(plan) <= {t.name for t in self.business_tool_list}:
+            metrics_util.inc_counter("task_plan_skipped_total", {"business_key": self.business_key, "reason": "tool_missing"})
+            return False
+        return True
+
+    def replay_plan_round(self, state: DataClerkState, round_index: int) -> dict:
+        """
+        回放执行计划的一轮工具调用，并统计省下的llm调用和提示词token数
+        :param state:
+        :param round_index: 轮次
+        :return: 需要更新的state
+        """
+        # 省下的提示词：这一轮由llm规划时需要发送的系统提示词、对话历史和工具定义
+        policy = self.prompt_assembler.policy_of(GraphNode.EXECUTE_TASK)
+        tools, _ = tools_for_task(self.business_tool_list, state.task_detail.tool_names)
+        saved_tokens = (token_util.count_tokens(self.basic_system_template + state.task_detail.to_desc())
+                        + token_util.count_message_tokens(self.prompt_assembler.history_with_policy(policy, state))
+                        + tool_schema_tokens(tools))
+        labels = {"business_key": self.business_key}
+        metrics_util.inc_counter("task_plan_replayed_rounds_total", labels)
+        metrics_util.inc_counter("task_plan_llm_calls_saved_total", labels)
+        metrics_util.observe("task_plan_prompt_tokens_saved", saved_tokens, labels)
+        logging.info("按执行计划调用工具，任务:%s, 轮次:%s, 省下的提示词token:%s", state.task_name, round_index, saved_tokens)
+        return {
+            "messages": [plan_round_message(state.task_detail.execution_plan, round_index, self.plan_reference_day(state))],
+            "plan_round": round_index + 1,
+        }
+
     def get_business_tool_list(self, agent_def: AgentDefEntity):
         llm_tool_list: list[LLMToolEntity] = self.llm_tool_dao.get_llm_tools_by_agent_id(agent_def.id)
 
@@ -1,12 +1,28 @@
-from dataclasses import dataclass, field
-from typing import Sequence, Dict
+from dataclasses import dataclass, field, fields
+from typing import Sequence, Dict, get_type_hints
 
 from langchain_core.messages import AnyMessage
+from langgraph.channels.untracked_value import UntrackedValue
 from langgraph.graph import add_messages
 from typing_extensions import Annotated
 
 from model.query_data_task_detail import QueryDataTaskDetail
 
+# 每次运行的临时数据：在节点之间正常传递，但不写入checkpoint，每轮重新计算
+EphemeralList = Annotated[list, UntrackedValue(list, guard=False)]
+EphemeralStr = Annotated[str, UntrackedValue(str, guard=False)]
+
+
+def ephemeral_fields(state_cls) -> frozenset[str]:
+    """
+    获取state中的临时字段名称
+    :param state_cls: state类型
+    :return: 字段名称
+    """
+    hints = get_type_hints(state_cls, include_extras=True)
+    return frozenset(f.name for f in fields(state_cls)
+                     if any(isinstance(m, UntrackedValue) for m in getattr(hints.get(f.name), "__metadata__", ())))
+
 
 @dataclass()
 class InputState:
@@ -37,6 +53,18 @@ class DataClerkState(InputState):
     # 如果有确定格式的输出，则保存msgId和标准输出格式
     last_run_msg_id: str | None = None
     last_standard_data: str | None = None
+    # 本次执行任务的开始时间(时间戳)，用于统计执行耗时
+    task_started_at: float | None = None
+    # 按执行计划回放时下一轮的序号，为空表示由llm规划
+    plan_round: int | None = None
+    # 本次执行改为绑定全部业务工具：只绑定任务记录的工具时执行失败或没有得到结果
+    full_tools: bool = False
+    # 预取运行：不读取结果缓存，不计入任务执行统计
+    prefetch: bool = False
+    # 滚动摘要：较早的对话压缩后的摘要，原始消息仍保留在messages中
+    history_summary: str = ""
+    # 已并入摘要的最后一条消息id
+    history_summary_until: str | None = None
 
     def clear_state(self):
         # 清空上下文
@@ -49,6 +77,10 @@ class DataClerkState(InputState):
         self.task_id = None
         self.task_name = None
         self.params = None
+        self.task_started_at = None
+        self.plan_round = None
+        self.full_tools = False
+        self.prefetch = False
 
 @dataclass
 class AssistantInputState(InputState):
@@ -62,23 +94,30 @@ class AssistantState(AssistantInputState):
     # 用户意图
     intent_type: None |str = None
 
+    # 滚动摘要：较早的对话压缩后的摘要，原始消息仍保留在messages中
+    history_summary: str = ""
+    # 已并入摘要的最后一条消息id
+    history_summary_until: str | None = None
+
     # 查询任务相关
     task_names: list[str] = field(default_factory=list)
-    task_details: list[QueryDataTaskDetail] = field(default_factory=list)
-    task_content: str = ""
+    task_details: EphemeralList = field(default_factory=list)
+    task_content: EphemeralStr = ""
+    # 只列出部分任务时的说明
+    task_catalog_note: EphemeralStr = ""
 
     # 推理内容
     reasoning_context : str = ""
 
     # rag内容
-    rag_docs: list = field(default_factory=list)
-    rag_content: str = ""
+    rag_docs: EphemeralList = field(default_factory=list)
+    rag_content: EphemeralStr = ""
 
     # 查询的记忆内容
-    memories:list = field(default_factory=list)
-    memory_content: str = ""
+    memories: EphemeralList = field(default_factory=list)
+    memory_content: EphemeralStr = ""
     # 生成的记忆内容
-    saved_memories:list = field(default_factory=list)
+    saved_memories: EphemeralList = field(default_factory=list)
     saved_memory_content: str = ""
     msg_id_saved_memories: str = ""
 
@@ -90,4 +90,23 @@ def get_assistant_executor_system_prompt():
     return ASSISTANT_EXECUTOR_PROMPT.format(current_date=datetime_util.get_current_date())
 
 def get_assistant_reasoner_system_prompt():
-    return ASSISTANT_REASONER_PROMPT.format(current_date=datetime_util.get_current_date())
\ No newline at end of file
+    return ASSISTANT_REASONER_PROMPT.format(current_date=datetime_util.get_current_date())
+
+HISTORY_SUMMARY_PROMPT = """
+你负责压缩一段较长的对话历史，生成供后续对话使用的滚动摘要。
+
+已有的摘要（可能为空）：
+{summary}
+
+需要并入摘要的新对话：
+{conversation}
+
+要求：
+1. 在已有摘要的基础上合并新对话，输出一份完整的新摘要，不要丢失已有摘要中仍然有效的信息
+2. 保留用户的目标、已确认的任务名称/任务id/查询条件、用户的偏好与约束、已得到的关键数据结论
+3. 工具调用只保留调用目的和结论性的数据，不要保留原始的大段返回内容
+4. 使用简洁的条目列表，只输出摘要本身，不要添加任何额外说明
+"""
+
+def get_history_summary_prompt(summary: str, conversation: str):
+    return HISTORY_SUMMARY_PROMPT.format(summary=summary if summary else "无", conversation=conversation)
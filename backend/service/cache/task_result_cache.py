@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import Config
+from util import metrics_util
+
+# 结果来源
+SOURCE_PREFETCH = "prefetch"
+
+# redis中每条结果一个hash，使用统计保存在一个hash中
+REDIS_RESULT_KEY_PREFIX = "wagner:task_result:"
+REDIS_USAGE_KEY = "wagner:task_result_usage"
+
+# 原子地读取结果并累加命中次数，结果已过期时不会重新创建没有过期时间的键
+_REDIS_GET_SCRIPT = """
+local values = redis.call('HMGET', KEYS[1], 'content', 'source')
+if not values[1] then
+    redis.call('HINCRBY', KEYS[2], 'misses', 1)
+    return nil
+end
+local hits = redis.call('HINCRBY', KEYS[1], 'hits', 1)
+redis.call('HINCRBY', KEYS[2], 'hits:' .. values[2], 1)
+if hits == 1 then
+    redis.call('HINCRBY', KEYS[2], 'used:' .. values[2], 1)
+end
+return {values[1], values[2], hits}
+"""
+
+
+@dataclass
+class _Entry:
+    content: str
+    source: str
+    created_at: float
+    # 被使用的次数
+    hits: int = 0
+
+
+class TaskResultCache:
+    """
+    任务执行结果缓存：按(business_key, 任务id, 查询日期范围)缓存任务的最终结果，
+    同一天内查询同一日期的任务可以直接返回，不再调用llm和工具。
+    local模式只在本进程内有效，redis模式多worker共享同一份结果和使用统计
+    """
+
+    def __init__(self, use: str = "local", redis_url: str | None = None, ttl_seconds: float = 43200,
+                 max_entries: int = 1000):
+        """
+        :param use: local/redis
+        :param redis_url: redis地址
+        :param ttl_seconds: 缓存有效期(秒)
+        :param max_entries: local模式下的缓存条数上限，超过后淘汰最早写入的结果
+        """
+        self.__use = use
+        self.__redis_url = redis_url
+        self.__ttl_seconds = ttl_seconds
+        self.__max_entries = max_entries
+        self.__entries: OrderedDict[tuple[str, int, str], _Entry] = OrderedDict()
+        self.__lock = threading.Lock()
+        # 各来源写入/被使用的结果数，用于统计预取结果的使用率
+        self.__stored: dict[str, int] = {}
+        self.__used: dict[str, int] = {}
+        self.__hits: dict[str, int] = {}
+        self.__misses = 0
+        self.__redis = None
+
+    def get(self, business_key: str, task_id: int, date_key: str) -> str | None:
+        """
+        获取缓存的任务结果
+        :param business_key: 业务键
+        :param task_id: 任务id
+        :param date_key: 查询日期范围的键
+        :return: 任务结果，不存在或已过期时返回None
+        """
+        if self.__use == "redis":
+            content, source, hits = self.__get_from_redis(business_key, task_id, date_key)
+        else:
+            content, source, hits = self.__get_from_local(business_key, task_id, date_key)
+        if content is None:
+            metrics_util.inc_counter("task_result_cache_total", {"result": "miss"})
+            return None
+        metrics_util.inc_counter("task_result_cache_total", {"result": "hit", "source": source})
+        if hits == 1:
+            metrics_util.inc_counter("task_result_cache_used_total", {"source": source})
+        return content
+
+    def put(self, business_key: str, task_id: int, date_key: str, content: str, source: str):
+        """
+        写入任务结果
+        :param business_key: 业务键
+        :param task_id: 任务id
+        :param date_key: 查询日期范围的键
+        :param content: 任务结果
+        :param source: 结果来源
+        """
+        if self.__use == "redis":
+            key = self.__redis_key(business_key, task_id, date_key)
+            pipeline = self.__get_redis().pipeline()
+            pipeline.delete(key)
+            pipeline.hset(key, mapping={"content": content, "source": source, "hits": 0})
+            pipeline.expire(key, int(self.__ttl_seconds))
+            pipeline.hincrby(REDIS_USAGE_KEY, f"stored:{source}", 1)
+            pipeline.execute()
+        else:
+            key = (business_key, task_id, date_key)
+            with self.__lock:
+                self.__remove_locked(key)
+                self.__entries[key] = _Entry(content=content, source=source, created_at=time.time())
+                self.__stored[source] = self.__stored.get(source, 0) + 1
+                while len(self.__entries) > self.__max_entries:
+                    self.__remove_locked(next(iter(self.__entries)))
+        metrics_util.inc_counter("task_result_cache_stored_total", {"source": source})
+
+    def invalidate(self, business_key: str, task_id: int | None = None):
+        """
+        任务修改/删除后失效
+        :param business_key: 业务键
+        :param task_id: 任务id，为空时失效该业务键下的所有结果
+        """
+        if self.__use == "redis":
+            client = self.__get_redis()
+            pattern = f"{REDIS_RESULT_KEY_PREFIX}{business_key}:{'*' if task_id is None else f'{task_id}:*'}"
+            keys = list(client.scan_iter(match=pattern))
+            if len(keys) > 0:
+                client.delete(*keys)
+            return
+        with self.__lock:
+            for key in [k for k in self.__entries if k[0] == business_key and (task_id is None or k[1] == task_id)]:
+                self.__remove_locked(key)
+
+    def usage(self) -> dict:
+        """
+        各来源写入的结果数、被使用的结果数、命中次数和使用率
+        """
+        if self.__use == "redis":
+            raw = {k.decode(): int(v) for k, v in self.__get_redis().hgetall(REDIS_USAGE_KEY).items()}
+            stored = {k.split(":", 1)[1]: v for k, v in raw.items() if k.startswith("stored:")}
+            used = {k.split(":", 1)[1]: v for k, v in raw.items() if k.startswith("used:")}
+            hits = {k.split(":", 1)[1]: v for k, v in raw.items() if k.startswith("hits:")}
+            misses = raw.get("misses", 0)
+            entries = sum(1 for _ in self.__get_redis().scan_iter(match=f"{REDIS_RESULT_KEY_PREFIX}*"))
+        else:
+            with self.__lock:
+                stored, used, hits = dict(self.__stored), dict(self.__used), dict(self.__hits)
+                misses, entries = self.__misses, len(self.__entries)
+        sources = {}
+        for source, stored_count in stored.items():
+            used_count = used.get(source, 0)
+            sources[source] = {"stored": stored_count, "used": used_count, "hits": hits.get(source, 0),
+                               "usedRate": round(used_count / stored_count, 4) if stored_count > 0 else None}
+        return {"entries": entries, "misses": misses, "sources": sources}
+
+    def __get_from_local(self, business_key: str, task_id: int, date_key: str):
+        key = (business_key, task_id, date_key)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and time.time() - entry.created_at > self.__ttl_seconds:
+                self.__remove_locked(key)
+                entry = None
+            if entry is None:
+                self.__misses += 1
+                return None, None, 0
+            entry.hits += 1
+            self.__hits[entry.source] = self.__hits.get(entry.source, 0) + 1
+            if entry.hits == 1:
+                self.__used[entry.source] = self.__used.get(entry.source, 0) + 1
+            return entry.content, entry.source, entry.hits
+
+    def __get_from_redis(self, business_key: str, task_id: int, date_key: str):
+        key = self.__redis_key(business_key, task_id, date_key)
+        values = self.__get_redis().eval(_REDIS_GET_SCRIPT, 2, key, REDIS_USAGE_KEY)
+        if not values:
+            return None, None, 0
+        return values[0].decode(), values[1].decode(), int(values[2])
+
+    def __remove_locked(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None and entry.hits == 0:
+            # 写入后直到过期/淘汰/覆盖都没有被使用
+            metrics_util.inc_counter("task_result_cache_unused_total", {"source": entry.source})
+
+    @staticmethod
+    def __redis_key(business_key: str, task_id: int, date_key: str) -> str:
+        return f"{REDIS_RESULT_KEY_PREFIX}{business_key}:{task_id}:{date_key}"
+
+    def __get_redis(self):
+        if self.__redis is None:
+            import redis
+            self.__redis = redis.Redis.from_url(self.__redis_url)
+        return self.__redis
+
+
+task_result_cache = TaskResultCache(Config.TASK_RESULT_CACHE_USE, Config.REDIS_URL,
+                                    Config.TASK_RESULT_CACHE_TTL_SECONDS, Config.TASK_RESULT_CACHE_MAX_ENTRIES)
+
+
+def get_task_result_cache() -> TaskResultCache:
+    return task_result_cache
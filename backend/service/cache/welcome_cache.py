@@ -0,0 +1,100 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+from typing import Awaitable, Callable
+
+from util import metrics_util
+
+
+def version_of(*parts) -> str:
+    """
+    根据生成欢迎语所依赖的内容计算版本号，内容不变版本号不变
+    :param parts: 依赖的内容(系统提示词、模型等)
+    :return: 版本号
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class WelcomeCache:
+    """
+    欢迎语/自我介绍缓存：只依赖智能体定义，每个版本只调用一次LLM生成，
+    同一版本同时未命中时只有第一个请求生成，其他请求等待它的结果
+    """
+
+    def __init__(self):
+        self.__entries: dict[str, tuple[str, str]] = {}
+        # 正在生成的欢迎语：key -> (版本, 结果)，请求可能来自不同的事件循环，所以用线程安全的Future
+        self.__generating: dict[str, tuple[str, concurrent.futures.Future]] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key: str, version: str) -> str | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    async def get_or_generate(self, key: str, version: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """
+        获取缓存的欢迎语，版本变化或不存在时重新生成
+        :param key: 缓存键(business_key)
+        :param version: 当前智能体定义的版本
+        :param generate: 生成欢迎语的方法
+        :return: 欢迎语
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] == version:
+                metrics_util.inc_counter("welcome_cache_total", {"result": "hit"})
+                return entry[1]
+            generating = self.__generating.get(key)
+            if generating is not None and generating[0] == version:
+                future = generating[1]
+            else:
+                future = None
+                generating = (version, concurrent.futures.Future())
+                self.__generating[key] = generating
+
+        if future is not None:
+            metrics_util.inc_counter("welcome_cache_total", {"result": "wait"})
+            return await asyncio.wrap_future(future)
+
+        metrics_util.inc_counter("welcome_cache_total", {"result": "miss"})
+        future = generating[1]
+        start = time.perf_counter()
+        try:
+            content = await generate()
+            metrics_util.observe("welcome_cache_generate_seconds", time.perf_counter() - start)
+            with self.__lock:
+                self.__entries[key] = (version, content)
+            future.set_result(content)
+            logging.info("欢迎语已生成并缓存，key:%s, version:%s", key, version)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                # 生成被取消，等待的请求也失败，下次请求重新生成
+                future.set_exception(RuntimeError("欢迎语生成被取消"))
+            with self.__lock:
+                if self.__generating.get(key) is generating:
+                    del self.__generating[key]
+
+    def invalidate(self, key: str):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+
+welcome_cache = WelcomeCache()
+
+
+def get_welcome_cache() -> WelcomeCache:
+    return welcome_cache
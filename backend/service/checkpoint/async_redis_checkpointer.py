@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, \
+    CheckpointTuple
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+from redis.asyncio import ConnectionPool, Redis as AsyncRedis
+
+from config import Config
+from util import metrics_util
+
+
+class _CheckpointIOLoop:
+    """
+    checkpoint读写专用的事件循环线程。
+    redis异步连接绑定在创建它的事件循环上，而graph既会在Quart的事件循环中astream，
+    也会在同步路由的线程中invoke，所以所有redis读写统一放到这个循环上执行
+    """
+
+    def __init__(self):
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self.__loop is None:
+            with self.__lock:
+                if self.__loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="checkpoint-io", daemon=True).start()
+                    self.__loop = loop
+        return self.__loop
+
+    def run_sync(self, coro):
+        """
+        在同步代码中执行协程并等待结果
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def run(self, coro):
+        """
+        在任意事件循环中执行协程并等待结果，不阻塞调用方的事件循环
+        """
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+
+checkpoint_io_loop = _CheckpointIOLoop()
+
+
+class AsyncRedisCheckpointer(BaseCheckpointSaver):
+    """
+    基于AsyncRedisSaver的checkpointer：共享连接池，redis读写在checkpoint专用事件循环上执行，
+    astream时不阻塞请求所在的事件循环，同步invoke/get_state时在调用线程中等待结果
+    """
+
+    def __init__(self, saver: AsyncRedisSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await self.__timed("get_tuple", checkpoint_io_loop.run(self.saver.aget_tuple(config)))
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in await checkpoint_io_loop.run(self.__collect(config, filter, before, limit)):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self.__timed("put", checkpoint_io_loop.run(self.saver.aput(config, checkpoint, metadata, new_versions)))
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self.__timed("put_writes", checkpoint_io_loop.run(self.saver.aput_writes(config, writes, task_id, task_path)))
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await checkpoint_io_loop.run(self.saver.adelete_thread(thread_id))
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return checkpoint_io_loop.run_sync(self.__timed("get_tuple", self.saver.aget_tuple(config)))
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        yield from checkpoint_io_loop.run_sync(self.__collect(config, filter, before, limit))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return checkpoint_io_loop.run_sync(self.__timed("put", self.saver.aput(config, checkpoint, metadata, new_versions)))
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        checkpoint_io_loop.run_sync(self.__timed("put_writes", self.saver.aput_writes(config, writes, task_id, task_path)))
+
+    def delete_thread(self, thread_id: str) -> None:
+        checkpoint_io_loop.run_sync(self.saver.adelete_thread(thread_id))
+
+    def get_next_version(self, current, channel) -> str:
+        return self.saver.get_next_version(current, channel)
+
+    async def __collect(self, config, filter, before, limit):
+        return [item async for item in self.saver.alist(config, filter=filter, before=before, limit=limit)]
+
+    async def __timed(self, operation, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            metrics_util.observe("checkpoint_redis_seconds", time.perf_counter() - start, {"operation": operation})
+
+
+_connection_pool: ConnectionPool | None = None
+
+
+async def _create_saver(redis_url: str) -> AsyncRedisSaver:
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = ConnectionPool.from_url(redis_url, max_connections=Config.MESSAGE_MEMORY_REDIS_MAX_CONNECTIONS)
+    saver = AsyncRedisSaver(redis_client=AsyncRedis(connection_pool=_connection_pool))
+    # 创建索引(已存在时跳过)并检测集群模式，每个saver创建时自动执行一次
+    await saver.asetup()
+    logging.info("redis checkpointer初始化完成:%s", redis_url)
+    return saver
+
+
+def create_async_redis_checkpointer(redis_url: str) -> AsyncRedisCheckpointer:
+    """
+    创建异步redis checkpointer，可以在同步或异步代码中调用
+    :param redis_url: redis地址
+    :return: checkpointer
+    """
+    saver = checkpoint_io_loop.run_sync(_create_saver(redis_url))
+    return AsyncRedisCheckpointer(saver)
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+from config import Config
+from util import metrics_util
+
+
+class CheckpointMemoryBudget:
+    """
+    进程内所有BoundedMemorySaver共享的内存预算：
+    按最近访问时间维护LRU，淘汰空闲超过ttl的会话，总字节数超过上限时淘汰最久未访问的会话
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        # (saver, thread_id) -> [字节数, 最近访问时间]，按访问时间从旧到新排列
+        self.__entries: OrderedDict[tuple["BoundedMemorySaver", str], list] = OrderedDict()
+        self.__resident_bytes = 0
+        self.__lock = threading.Lock()
+
+    def touch(self, saver: "BoundedMemorySaver", thread_id: str, resident_bytes: int | None = None):
+        """
+        记录一次会话访问
+        :param saver: 会话所在的saver
+        :param thread_id: 会话id
+        :param resident_bytes: 会话当前占用的字节数，为空时只更新访问时间
+        """
+        key = (saver, thread_id)
+        now = time.monotonic()
+        victims = []
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                if resident_bytes is None:
+                    return
+                entry = [0, now]
+                self.__entries[key] = entry
+            if resident_bytes is not None:
+                self.__resident_bytes += resident_bytes - entry[0]
+                entry[0] = resident_bytes
+            entry[1] = now
+            self.__entries.move_to_end(key)
+
+            # 最前面的是最久未访问的，依次淘汰过期的和超出内存上限的(不淘汰当前会话)
+            while len(self.__entries) > 1:
+                oldest_key, (oldest_bytes, last_access) = next(iter(self.__entries.items()))
+                if now - last_access > self.__ttl:
+                    reason = "ttl"
+                elif self.__resident_bytes > self.__max_bytes:
+                    reason = "lru"
+                else:
+                    break
+                del self.__entries[oldest_key]
+                self.__resident_bytes -= oldest_bytes
+                victims.append((oldest_key, reason))
+            self.__update_gauges_locked()
+
+        for (victim_saver, victim_thread_id), reason in victims:
+            victim_saver.evict_thread(victim_thread_id, reason)
+
+    def forget(self, saver: "BoundedMemorySaver", thread_id: str):
+        with self.__lock:
+            entry = self.__entries.pop((saver, thread_id), None)
+            if entry is not None:
+                self.__resident_bytes -= entry[0]
+            self.__update_gauges_locked()
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.__resident_bytes
+
+    @property
+    def threads(self) -> int:
+        return len(self.__entries)
+
+    def __update_gauges_locked(self):
+        metrics_util.set_gauge("checkpoint_memory_resident_bytes", self.__resident_bytes)
+        metrics_util.set_gauge("checkpoint_memory_threads", len(self.__entries))
+
+
+class _ThreadIndex:
+    def __init__(self):
+        # 该会话的所有blob键
+        self.blob_keys: set[tuple] = set()
+        # (checkpoint_ns, checkpoint_id) -> 该checkpoint引用的channel版本
+        self.checkpoint_versions: dict[tuple[str, str], dict] = {}
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    有界的内存checkpointer：每个会话只保留最近N个checkpoint，
+    空闲超时和超出全局内存上限的会话由CheckpointMemoryBudget淘汰
+    """
+
+    def __init__(self, max_checkpoints_per_thread: int, budget: CheckpointMemoryBudget | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.__max_checkpoints = max(1, max_checkpoints_per_thread)
+        self.__budget = budget if budget is not None else get_checkpoint_memory_budget()
+        self.__threads: dict[str, _ThreadIndex] = {}
+        self.__lock = threading.RLock()
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        with self.__lock:
+            # storage是defaultdict，不存在的会话直接返回，避免查询时创建空会话
+            if thread_id not in self.storage:
+                return None
+            result = super().get_tuple(config)
+        self.__budget.touch(self, thread_id)
+        return result
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None and config["configurable"]["thread_id"] not in self.storage:
+            return
+        with self.__lock:
+            result = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from result
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self.__lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            index = self.__threads.get(thread_id)
+            if index is None:
+                index = _ThreadIndex()
+                self.__threads[thread_id] = index
+            for channel, version in new_versions.items():
+                index.blob_keys.add((thread_id, checkpoint_ns, channel, version))
+            index.checkpoint_versions[(checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+            self.__prune_locked(thread_id, checkpoint_ns, index)
+            resident_bytes = self.__measure_locked(thread_id, index)
+        self.__budget.touch(self, thread_id, resident_bytes)
+        return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self.__lock:
+            super().put_writes(config, writes, task_id, task_path)
+            index = self.__threads.get(thread_id)
+            resident_bytes = None if index is None else self.__measure_locked(thread_id, index)
+        self.__budget.touch(self, thread_id, resident_bytes)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.__lock:
+            self.__remove_thread_locked(thread_id)
+        self.__budget.forget(self, thread_id)
+
+    def evict_thread(self, thread_id: str, reason: str):
+        """
+        由内存预算淘汰会话
+        :param thread_id: 会话id
+        :param reason: 淘汰原因(ttl/lru)
+        """
+        with self.__lock:
+            self.__remove_thread_locked(thread_id)
+        metrics_util.inc_counter("checkpoint_memory_evicted_threads_total", {"reason": reason})
+        logging.info("会话checkpoint已从内存淘汰，thread_id:%s, reason:%s", thread_id, reason)
+
+    def __prune_locked(self, thread_id, checkpoint_ns, index: _ThreadIndex):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.__max_checkpoints:
+            return
+
+        # checkpoint id按时间递增，只保留最新的N个
+        expired_ids = sorted(checkpoints.keys())[:-self.__max_checkpoints]
+        for checkpoint_id in expired_ids:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            index.checkpoint_versions.pop((checkpoint_ns, checkpoint_id), None)
+
+        # 清理不再被剩余checkpoint引用的channel值
+        referenced = {(thread_id, ns, channel, version)
+                      for (ns, _), versions in index.checkpoint_versions.items() if ns == checkpoint_ns
+                      for channel, version in versions.items()}
+        for key in [k for k in index.blob_keys if k[1] == checkpoint_ns and k not in referenced]:
+            self.blobs.pop(key, None)
+            index.blob_keys.discard(key)
+        metrics_util.inc_counter("checkpoint_memory_pruned_checkpoints_total", value=len(expired_ids))
+
+    def __measure_locked(self, thread_id, index: _ThreadIndex) -> int:
+        resident_bytes = 0
+        for checkpoint_ns, checkpoints in self.storage[thread_id].items():
+            for checkpoint_id, (checkpoint, metadata, _) in checkpoints.items():
+                resident_bytes += len(checkpoint[1]) + len(metadata[1])
+                for _, _, value, _ in self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {}).values():
+                    resident_bytes += len(value[1])
+        for key in index.blob_keys:
+            blob = self.blobs.get(key)
+            if blob is not None:
+                resident_bytes += len(blob[1])
+        return resident_bytes
+
+    def __remove_thread_locked(self, thread_id):
+        namespaces = self.storage.pop(thread_id, None)
+        if namespaces is not None:
+            for checkpoint_ns, checkpoints in namespaces.items():
+                for checkpoint_id in checkpoints.keys():
+                    self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        index = self.__threads.pop(thread_id, None)
+        if index is not None:
+            for key in index.blob_keys:
+                self.blobs.pop(key, None)
+
+
+checkpoint_memory_budget = CheckpointMemoryBudget(max_bytes=Config.MESSAGE_MEMORY_MAX_BYTES,
+                                                  ttl=Config.MESSAGE_MEMORY_THREAD_TTL)
+
+
+def get_checkpoint_memory_budget() -> CheckpointMemoryBudget:
+    return checkpoint_memory_budget
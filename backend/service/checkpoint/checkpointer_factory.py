@@ -0,0 +1,32 @@
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from config import Config
+from service.agent.model.state import ephemeral_fields
+from service.checkpoint.async_redis_checkpointer import create_async_redis_checkpointer
+from service.checkpoint.bounded_memory_saver import BoundedMemorySaver
+from service.checkpoint.compact_serializer import CompactCheckpointSerializer
+from service.checkpoint.durability_checkpointer import CheckpointDurability, DurabilityCheckpointer
+from service.checkpoint.instrumented_checkpointer import InstrumentedCheckpointer
+
+
+def create_checkpointer(state_schema: type | None = None, graph_name: str | None = None) -> BaseCheckpointSaver:
+    """
+    根据配置创建graph使用的checkpointer，统一统计写入字节数和耗时
+    :param state_schema: graph的state类型，其中的临时字段不会写入checkpoint
+    :param graph_name: graph名称，用于读取checkpoint写入时机的配置
+    :return: checkpointer
+    """
+    if Config.MESSAGE_MEMORY_USE == "local":
+        serde = CompactCheckpointSerializer(Config.CHECKPOINT_COMPRESS_THRESHOLD_BYTES, Config.CHECKPOINT_COMPRESS_LEVEL)
+        saver = BoundedMemorySaver(Config.MESSAGE_MEMORY_MAX_CHECKPOINTS_PER_THREAD, serde=serde)
+    else:
+        # 异步redis checkpointer，创建时自动初始化索引
+        # redis checkpointer以RedisJSON文档存储并建立索引，必须使用其自带的json序列化
+        saver = create_async_redis_checkpointer(Config.REDIS_URL)
+    ephemeral_channels = frozenset() if state_schema is None else ephemeral_fields(state_schema)
+    checkpointer = InstrumentedCheckpointer(saver, ephemeral_channels)
+    if graph_name is None:
+        return checkpointer
+    return DurabilityCheckpointer(checkpointer, graph_name,
+                                  Config.CHECKPOINT_DURABILITY.get(graph_name, CheckpointDurability.STEP),
+                                  Config.CHECKPOINT_NODE_DURABILITY.get(graph_name))
@@ -0,0 +1,100 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from util import metrics_util
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    logging.warning("未安装zstandard，checkpoint不压缩")
+
+# 压缩后类型的后缀，例如 msgpack+zstd
+ZSTD_SUFFIX = "+zstd"
+
+
+class SerializedBytesCounter:
+    """
+    统计范围内序列化写出的字节数(压缩后)
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+
+current_serialized_bytes_counter: ContextVar[SerializedBytesCounter | None] = ContextVar(
+    "current_serialized_bytes_counter", default=None)
+
+
+@contextmanager
+def count_serialized_bytes():
+    """
+    在with范围内统计CompactCheckpointSerializer写出的字节数，写入统计直接使用序列化的结果，不需要再序列化一次
+    """
+    counter = SerializedBytesCounter()
+    token = current_serialized_bytes_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        current_serialized_bytes_counter.reset(token)
+
+
+class CompactCheckpointSerializer(JsonPlusSerializer):
+    """
+    紧凑的checkpoint序列化：使用ormsgpack编码，超过阈值的大对象(消息历史、工具返回等)再用zstd压缩，
+    小对象不压缩，避免压缩开销大于收益
+    """
+
+    def __init__(self, compress_threshold: int, compress_level: int = 3, **kwargs):
+        super().__init__(**kwargs)
+        self.__compress_threshold = compress_threshold
+        self.__compress_level = compress_level
+        # zstd的压缩/解压对象不是线程安全的，每个线程各自持有
+        self.__local = threading.local()
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        metrics_util.inc_counter("checkpoint_serde_raw_bytes_total", value=len(data))
+        if zstandard is not None and type_ in ("msgpack", "json") and len(data) >= self.__compress_threshold:
+            compressed = self.__compressor().compress(data)
+            if len(compressed) < len(data):
+                metrics_util.inc_counter("checkpoint_serde_compressed_total")
+                metrics_util.inc_counter("checkpoint_serde_stored_bytes_total", value=len(compressed))
+                _count_bytes(len(compressed))
+                return type_ + ZSTD_SUFFIX, compressed
+        metrics_util.inc_counter("checkpoint_serde_stored_bytes_total", value=len(data))
+        _count_bytes(len(data))
+        return type_, data
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_.endswith(ZSTD_SUFFIX):
+            if zstandard is None:
+                raise RuntimeError(f"未安装zstandard，无法解压checkpoint:{type_}")
+            return super().loads_typed((type_[:-len(ZSTD_SUFFIX)], self.__decompressor().decompress(data_)))
+        return super().loads_typed(data)
+
+    def __compressor(self):
+        compressor = getattr(self.__local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.__compress_level)
+            self.__local.compressor = compressor
+        return compressor
+
+    def __decompressor(self):
+        decompressor = getattr(self.__local, "decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self.__local.decompressor = decompressor
+        return decompressor
+
+
+def _count_bytes(size: int):
+    counter = current_serialized_bytes_counter.get()
+    if counter is not None:
+        counter.bytes += size
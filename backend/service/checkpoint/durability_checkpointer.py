@@ -0,0 +1,277 @@
+import threading
+from enum import StrEnum
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, \
+    CheckpointTuple
+from langgraph.constants import ERROR, INTERRUPT
+
+from service.checkpoint.instrumented_checkpointer import current_checkpoint_turn_stats
+from util import metrics_util
+
+# put_writes的task_path中普通节点的前缀，例如 "~__pregel_pull, find_task_in_db"
+PULL_TASK_PATH_PREFIX = "~__pregel_pull, "
+
+
+class CheckpointDurability(StrEnum):
+    # 每个super-step结束都写入checkpoint
+    STEP = "step"
+    # 只在中断、出错和运行结束时写入
+    EXIT = "exit"
+
+
+class _PendingCheckpoint:
+    """
+    尚未落盘的checkpoint，被后续checkpoint覆盖时合并channel版本，保证落盘时不缺少channel值
+    """
+
+    def __init__(self, config, checkpoint, metadata, new_versions):
+        # 第一次缓存时的config，其checkpoint_id是最后一次落盘的checkpoint，作为落盘时的父节点
+        self.config = config
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.new_versions = dict(new_versions)
+        # 该checkpoint上已完成节点的写入，中断时需要和checkpoint一起落盘，恢复时不用重跑这些节点
+        self.writes: list[tuple] = []
+
+    def supersede(self, checkpoint, metadata, new_versions):
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.new_versions.update(new_versions)
+        self.writes = []
+
+
+class DurabilityCheckpointer(BaseCheckpointSaver):
+    """
+    按graph和节点配置checkpoint写入时机的代理：
+    step模式下每个super-step都写入；exit模式下中间步骤只缓存最新的checkpoint，
+    在中断/出错时、执行了step模式的节点后、以及运行结束时(checkpoint_turn_stats范围结束)才写入。
+    不在checkpoint_turn_stats范围内的调用不缓存，直接写入
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver, graph_name: str, durability: str,
+                 node_durability: dict[str, str] | None = None):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.graph_name = graph_name
+        self.durability = CheckpointDurability(durability)
+        self.node_durability = {k: CheckpointDurability(v) for k, v in (node_durability or {}).items()}
+        # (thread_id, checkpoint_ns) -> 缓存的checkpoint
+        self.__pending: dict[tuple[str, str], _PendingCheckpoint] = {}
+        # (thread_id, checkpoint_ns) -> 上次put之后执行过的节点
+        self.__ran_nodes: dict[tuple[str, str], set[str]] = {}
+        # 被覆盖且没有落盘的checkpoint id，迟到的写入直接丢弃
+        self.__superseded: dict[tuple[str, str], set[str]] = {}
+        self.__lock = threading.Lock()
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self.inner.get_tuple(config)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await self.inner.aget_tuple(config)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.inner.list(config, filter=filter, before=before, limit=limit)
+
+    def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        return self.inner.alist(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        pending = self.__on_put(config, checkpoint, metadata, new_versions)
+        if pending is None:
+            return self.__next_config(config, checkpoint)
+        self.__persist(pending)
+        return self.__next_config(config, checkpoint)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        pending = self.__on_put(config, checkpoint, metadata, new_versions)
+        if pending is None:
+            return self.__next_config(config, checkpoint)
+        await self.__apersist(pending)
+        return self.__next_config(config, checkpoint)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        action, pending = self.__on_put_writes(config, writes, task_id, task_path)
+        if action == "persist":
+            if pending is not None:
+                self.__persist(pending)
+            self.inner.put_writes(config, writes, task_id, task_path)
+            self.__count("put_writes", "persisted")
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        action, pending = self.__on_put_writes(config, writes, task_id, task_path)
+        if action == "persist":
+            if pending is not None:
+                await self.__apersist(pending)
+            await self.inner.aput_writes(config, writes, task_id, task_path)
+            self.__count("put_writes", "persisted")
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.__discard_thread(thread_id)
+        self.inner.delete_thread(thread_id)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.__discard_thread(thread_id)
+        await self.inner.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel) -> str:
+        return self.inner.get_next_version(current, channel)
+
+    def flush(self, key: tuple[str, str]):
+        """
+        运行结束时写入缓存的checkpoint
+        :param key: (thread_id, checkpoint_ns)
+        """
+        pending = self.__pop(key)
+        if pending is not None:
+            self.__persist(pending)
+
+    async def aflush(self, key: tuple[str, str]):
+        pending = self.__pop(key)
+        if pending is not None:
+            await self.__apersist(pending)
+
+    def __on_put(self, config, checkpoint, metadata, new_versions) -> _PendingCheckpoint | None:
+        """
+        :return: 需要立即落盘的checkpoint，为空时表示已缓存
+        """
+        key = self.__key(config)
+        stats = current_checkpoint_turn_stats.get()
+        with self.__lock:
+            ran_nodes = self.__ran_nodes.pop(key, set())
+            pending = self.__pending.get(key)
+            if pending is None:
+                pending = _PendingCheckpoint(config, checkpoint, metadata, new_versions)
+            else:
+                self.__superseded.setdefault(key, set()).add(pending.checkpoint["id"])
+                for _ in pending.writes:
+                    self.__count("put_writes", "skipped")
+                pending.supersede(checkpoint, metadata, new_versions)
+
+            if stats is None or self.__is_step_durable(ran_nodes):
+                self.__pending.pop(key, None)
+                return pending
+
+            self.__pending[key] = pending
+        stats.flush_on_exit(self, key)
+        stats.record_skipped()
+        self.__count("put", "skipped")
+        return None
+
+    def __on_put_writes(self, config, writes, task_id, task_path) -> tuple[str, _PendingCheckpoint | None]:
+        """
+        :return: (persist/buffered/dropped, 需要先落盘的checkpoint)
+        """
+        key = self.__key(config)
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.__lock:
+            if task_path.startswith(PULL_TASK_PATH_PREFIX):
+                self.__ran_nodes.setdefault(key, set()).add(task_path[len(PULL_TASK_PATH_PREFIX):])
+
+            pending = self.__pending.get(key)
+            if pending is not None and pending.checkpoint["id"] == checkpoint_id:
+                if any(channel in (INTERRUPT, ERROR) for channel, _ in writes):
+                    # 中断/出错时需要能从这里恢复，先落盘checkpoint和其上已完成的写入
+                    del self.__pending[key]
+                    return "persist", pending
+                pending.writes.append((config, writes, task_id, task_path))
+                return "buffered", None
+            if checkpoint_id in self.__superseded.get(key, ()):
+                self.__count("put_writes", "skipped")
+                return "dropped", None
+        return "persist", None
+
+    def __persist(self, pending: _PendingCheckpoint):
+        self.inner.put(pending.config, pending.checkpoint, pending.metadata, pending.new_versions)
+        self.__count("put", "persisted")
+        for config, writes, task_id, task_path in pending.writes:
+            self.inner.put_writes(config, writes, task_id, task_path)
+            self.__count("put_writes", "persisted")
+        self.__clear_superseded(pending)
+
+    async def __apersist(self, pending: _PendingCheckpoint):
+        await self.inner.aput(pending.config, pending.checkpoint, pending.metadata, pending.new_versions)
+        self.__count("put", "persisted")
+        for config, writes, task_id, task_path in pending.writes:
+            await self.inner.aput_writes(config, writes, task_id, task_path)
+            self.__count("put_writes", "persisted")
+        self.__clear_superseded(pending)
+
+    def __is_step_durable(self, ran_nodes: set[str]) -> bool:
+        if len(ran_nodes) == 0:
+            return self.durability == CheckpointDurability.STEP
+        return any(self.node_durability.get(node, self.durability) == CheckpointDurability.STEP for node in ran_nodes)
+
+    def __pop(self, key) -> _PendingCheckpoint | None:
+        with self.__lock:
+            self.__ran_nodes.pop(key, None)
+            return self.__pending.pop(key, None)
+
+    def __clear_superseded(self, pending: _PendingCheckpoint):
+        key = self.__key(pending.config)
+        with self.__lock:
+            if key not in self.__pending:
+                self.__superseded.pop(key, None)
+
+    def __discard_thread(self, thread_id):
+        with self.__lock:
+            for mapping in (self.__pending, self.__ran_nodes, self.__superseded):
+                for key in [k for k in mapping if k[0] == thread_id]:
+                    del mapping[key]
+
+    def __count(self, operation, result):
+        metrics_util.inc_counter("checkpoint_writes_total",
+                                 {"graph": self.graph_name, "operation": operation, "result": result})
+
+    @staticmethod
+    def __key(config) -> tuple[str, str]:
+        return config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", "")
+
+    @staticmethod
+    def __next_config(config, checkpoint) -> RunnableConfig:
+        return {
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
@@ -0,0 +1,238 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, \
+    CheckpointTuple
+from langgraph.constants import NO_WRITES
+
+from service.checkpoint.compact_serializer import CompactCheckpointSerializer, count_serialized_bytes
+from util import metrics_util, token_util
+
+
+class CheckpointTurnStats:
+    """
+    一轮运行(一次graph调用)中的checkpoint写入统计，同时支持with和async with。
+    运行结束时会先让延迟写入的checkpointer把缓存的checkpoint落盘
+    """
+
+    def __init__(self, graph_name: str):
+        self.graph_name = graph_name
+        self.puts = 0
+        self.writes = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        # 运行结束时需要落盘的 (checkpointer, thread_id, checkpoint_ns)
+        self.__pending_flushes: dict[tuple, Any] = {}
+        self.__token = None
+
+    def record(self, operation: str, size: int, seconds: float):
+        if operation == "put":
+            self.puts += 1
+        else:
+            self.writes += 1
+        self.bytes += size
+        self.seconds += seconds
+
+    def record_skipped(self):
+        self.skipped += 1
+
+    def flush_on_exit(self, checkpointer, key: tuple):
+        """
+        登记运行结束时需要落盘的checkpoint
+        :param checkpointer: 实现了flush/aflush的checkpointer
+        :param key: (thread_id, checkpoint_ns)
+        """
+        self.__pending_flushes[(id(checkpointer), *key)] = (checkpointer, key)
+
+    def __enter__(self) -> "CheckpointTurnStats":
+        self.__token = current_checkpoint_turn_stats.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            for checkpointer, key in self.__pending_flushes.values():
+                checkpointer.flush(key)
+        finally:
+            self.__finish()
+
+    async def __aenter__(self) -> "CheckpointTurnStats":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            for checkpointer, key in self.__pending_flushes.values():
+                await checkpointer.aflush(key)
+        finally:
+            self.__finish()
+
+    def __finish(self):
+        current_checkpoint_turn_stats.reset(self.__token)
+        labels = {"graph": self.graph_name}
+        metrics_util.observe("checkpoint_turn_bytes", self.bytes, labels)
+        metrics_util.observe("checkpoint_turn_write_seconds", self.seconds, labels)
+        metrics_util.observe("checkpoint_turn_puts", self.puts, labels)
+        logging.info("本轮checkpoint写入，graph:%s, put:%s, put_writes:%s, 跳过:%s, 字节:%s, 耗时:%.2fms",
+                     self.graph_name, self.puts, self.writes, self.skipped, self.bytes, self.seconds * 1000)
+
+
+# 当前运行的统计，checkpointer在graph的后台任务中写入时随上下文传递
+current_checkpoint_turn_stats: ContextVar[CheckpointTurnStats | None] = ContextVar("current_checkpoint_turn_stats", default=None)
+
+
+def checkpoint_turn_stats(graph_name: str) -> CheckpointTurnStats:
+    """
+    统计with范围内一轮运行的checkpoint写入字节数和耗时
+    :param graph_name: graph名称，用于指标统计
+    """
+    return CheckpointTurnStats(graph_name)
+
+
+class InstrumentedCheckpointer(BaseCheckpointSaver):
+    """
+    统计checkpoint写入字节数和耗时的代理，读写都委托给真实的checkpointer。
+    临时字段(UntrackedValue)本身不会进入checkpoint，但langgraph仍会把节点对它们的写入作为pending writes保存，
+    这里一并过滤掉
+    """
+
+    def __init__(self, inner: BaseCheckpointSaver, ephemeral_channels: frozenset[str] = frozenset()):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.ephemeral_channels = ephemeral_channels
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self.inner.get_tuple(config)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await self.inner.aget_tuple(config)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.inner.list(config, filter=filter, before=before, limit=limit)
+
+    def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        return self.inner.alist(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        start = time.perf_counter()
+        with count_serialized_bytes() as counter:
+            result = self.inner.put(config, checkpoint, metadata, new_versions)
+        self._record("put", self._checkpoint_size(counter.bytes, checkpoint, new_versions), time.perf_counter() - start)
+        return result
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        start = time.perf_counter()
+        with count_serialized_bytes() as counter:
+            result = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        self._record("put", self._checkpoint_size(counter.bytes, checkpoint, new_versions), time.perf_counter() - start)
+        return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        writes = self._persistent_writes(writes)
+        if len(writes) == 0:
+            # 只写了临时channel，仍然记录任务已完成，否则恢复/中断重放时会重新执行该任务，不计入写入统计
+            self.inner.put_writes(config, [(NO_WRITES, None)], task_id, task_path)
+            return
+        start = time.perf_counter()
+        with count_serialized_bytes() as counter:
+            self.inner.put_writes(config, writes, task_id, task_path)
+        self._record("put_writes", self._writes_size(counter.bytes, writes), time.perf_counter() - start)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        writes = self._persistent_writes(writes)
+        if len(writes) == 0:
+            # 只写了临时channel，仍然记录任务已完成，否则恢复/中断重放时会重新执行该任务，不计入写入统计
+            await self.inner.aput_writes(config, [(NO_WRITES, None)], task_id, task_path)
+            return
+        start = time.perf_counter()
+        with count_serialized_bytes() as counter:
+            await self.inner.aput_writes(config, writes, task_id, task_path)
+        self._record("put_writes", self._writes_size(counter.bytes, writes), time.perf_counter() - start)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.inner.delete_thread(thread_id)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.inner.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel) -> str:
+        return self.inner.get_next_version(current, channel)
+
+    def _persistent_writes(self, writes: Sequence[tuple[str, Any]]) -> Sequence[tuple[str, Any]]:
+        if len(self.ephemeral_channels) == 0:
+            return writes
+        return [(c, v) for c, v in writes if c not in self.ephemeral_channels]
+
+    def _checkpoint_size(self, serialized_bytes: int, checkpoint: Checkpoint, new_versions: ChannelVersions) -> int:
+        if isinstance(self.serde, CompactCheckpointSerializer):
+            # 直接使用写入时序列化的字节数，不再重复序列化
+            return serialized_bytes
+        # 其他序列化器(例如redis自带的json序列化)按内容长度估算，只统计本次实际写入的channel值
+        values = checkpoint["channel_values"]
+        return sum(_estimate_size(values[k]) for k in new_versions if k in values)
+
+    def _writes_size(self, serialized_bytes: int, writes: Sequence[tuple[str, Any]]) -> int:
+        if isinstance(self.serde, CompactCheckpointSerializer):
+            return serialized_bytes
+        return sum(_estimate_size(v) for _, v in writes)
+
+    def _record(self, operation: str, size: int, seconds: float):
+        metrics_util.observe("checkpoint_write_bytes", size, {"operation": operation})
+        metrics_util.observe("checkpoint_write_seconds", seconds, {"operation": operation})
+        stats = current_checkpoint_turn_stats.get()
+        if stats is not None:
+            stats.record(operation, size, seconds)
+
+
+def _estimate_size(value) -> int:
+    # 粗略估算序列化后的字节数，只用于统计
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, BaseMessage):
+        return len(token_util.message_text(value))
+    if isinstance(value, dict):
+        return sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(_estimate_size(v) for v in value)
+    return 8
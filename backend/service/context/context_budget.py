@@ -0,0 +1,140 @@
+import logging
+from dataclasses import dataclass, field
+
+from config import Config
+from util import metrics_util, token_util
+
+# 截断单条内容时至少保留的token数，剩余预算不足时直接丢弃该条
+MIN_TRUNCATED_ITEM_TOKENS = 64
+# 截断后追加的标记
+TRUNCATED_MARK = "...(内容过长已截断)"
+
+
+@dataclass
+class ContextItem:
+    # 单条内容(一条知识库片段/一条记忆/一个任务)
+    text: str
+    # 相关度，越大越优先保留
+    score: float = 0.0
+
+
+@dataclass
+class ContextBlock:
+    """
+    放入系统提示词的一块内容(知识库/记忆/任务)
+    """
+    name: str
+    # 块标题
+    header: str
+    items: list[ContextItem] = field(default_factory=list)
+    # 没有任何内容时的提示
+    empty_text: str = ""
+
+
+class ContextBudgetAllocator:
+    """
+    系统提示词中知识库、记忆、任务等内容块的token预算分配：
+    按各块的权重分配节点+模型的总预算，某块用不完的预算分给其他块，块内按相关度保留内容，超出的截断或丢弃
+    """
+
+    def __init__(self, graph_name: str):
+        self.__graph_name = graph_name
+
+    def budget_of(self, node: str, model: str) -> int:
+        return Config.CONTEXT_BLOCK_TOKEN_BUDGETS.get(model, {}).get(node, Config.CONTEXT_BLOCK_DEFAULT_TOKEN_BUDGET)
+
+    def allocate(self, node: str, model: str, blocks: list[ContextBlock]) -> dict[str, str]:
+        """
+        在预算内拼装各内容块
+        :param node: 节点名称
+        :param model: 节点使用的模型
+        :param blocks: 内容块
+        :return: 块名称 -> 拼装后的文本
+        """
+        budget = self.budget_of(node, model)
+        item_tokens = {block.name: [token_util.count_tokens(item.text) for item in block.items] for block in blocks}
+        header_tokens = {block.name: token_util.count_tokens(block.header) for block in blocks}
+        allocations = self.__split_budget(budget - sum(header_tokens.values()), blocks, item_tokens)
+
+        contents = {}
+        accounting = []
+        for block in blocks:
+            text, used, dropped = self.__fill(block, item_tokens[block.name], allocations[block.name])
+            contents[block.name] = text
+            labels = {"graph": self.__graph_name, "node": node, "block": block.name}
+            metrics_util.observe("context_block_tokens", used + header_tokens[block.name], labels)
+            metrics_util.observe("context_block_dropped_tokens", dropped, labels)
+            accounting.append(f"{block.name}:{used + header_tokens[block.name]}(丢弃{dropped})")
+
+        logging.info("提示词内容块token分配，graph:%s, node:%s, model:%s, 预算:%s, %s",
+                     self.__graph_name, node, model, budget, ", ".join(accounting))
+        return contents
+
+    @staticmethod
+    def __split_budget(budget: int, blocks: list[ContextBlock], item_tokens: dict[str, list[int]]) -> dict[str, int]:
+        """
+        按权重分配预算，需求小于份额的块只分配需求量，剩余预算按权重继续分给其他块
+        """
+        demands = {block.name: sum(item_tokens[block.name]) for block in blocks}
+        allocations = {block.name: 0 for block in blocks}
+        remaining = max(0, budget)
+        pending = [block.name for block in blocks if demands[block.name] > 0]
+        while remaining > 0 and len(pending) > 0:
+            weights = {name: Config.CONTEXT_BLOCK_WEIGHTS.get(name, 1.0) for name in pending}
+            total_weight = sum(weights.values())
+            satisfied = [name for name in pending
+                         if demands[name] - allocations[name] <= remaining * weights[name] / total_weight]
+            if len(satisfied) == 0:
+                for name in pending:
+                    allocations[name] += int(remaining * weights[name] / total_weight)
+                break
+            for name in satisfied:
+                remaining -= demands[name] - allocations[name]
+                allocations[name] = demands[name]
+                pending.remove(name)
+        return allocations
+
+    @staticmethod
+    def __fill(block: ContextBlock, item_tokens: list[int], allocation: int) -> tuple[str, int, int]:
+        """
+        按相关度从高到低放入内容
+        :return: 文本，使用的token数，丢弃的token数
+        """
+        if len(block.items) == 0:
+            return block.header + block.empty_text, 0, 0
+
+        ranked = sorted(range(len(block.items)), key=lambda i: block.items[i].score, reverse=True)
+        texts = []
+        used = 0
+        for index in ranked:
+            remaining = allocation - used
+            if item_tokens[index] <= remaining:
+                texts.append(block.items[index].text)
+                used += item_tokens[index]
+            elif remaining >= MIN_TRUNCATED_ITEM_TOKENS:
+                truncated = token_util.truncate_to_tokens(block.items[index].text, remaining - token_util.count_tokens(TRUNCATED_MARK))
+                texts.append(truncated + TRUNCATED_MARK)
+                used += token_util.count_tokens(texts[-1])
+
+        dropped = max(0, sum(item_tokens) - used)
+        if len(texts) == 0:
+            return block.header + block.empty_text, 0, dropped
+        return block.header + "".join(texts), used, dropped
+
+
+def lexical_relevance(query: str, text: str) -> float:
+    """
+    按字符二元组的重合度估算文本与问题的相关度，用于没有检索分数的内容排序
+    :param query: 用户问题
+    :param text: 内容
+    :return: 0~1之间的相关度
+    """
+    query_grams = _bigrams(query)
+    if len(query_grams) == 0:
+        return 0.0
+    return len(query_grams & _bigrams(text)) / len(query_grams)
+
+
+def _bigrams(text: str) -> set[str]:
+    text = "".join(text.split())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
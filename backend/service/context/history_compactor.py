@@ -0,0 +1,138 @@
+import logging
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from service.agent.prompt import prompts
+from util import metrics_util, token_util
+
+# 摘要中单条消息最多保留的字符数，避免把大段工具返回原样交给LLM压缩
+SUMMARY_MESSAGE_MAX_CHARS = 2000
+
+HISTORY_SUMMARY_PREFIX = "以下是之前对话的摘要（更早的原始对话已省略）：\n"
+
+
+def compacted_messages(state) -> list[AnyMessage]:
+    """
+    获取压缩后的对话历史：滚动摘要 + 摘要之后的原始消息，用于拼装提示词。
+    state.messages中仍保留完整的原始历史
+    :param state: 包含messages/history_summary/history_summary_until的state
+    :return: 消息列表
+    """
+    messages = list(state.messages)
+    if not state.history_summary:
+        return messages
+    tail = _messages_after(messages, state.history_summary_until)
+    return [SystemMessage(content=HISTORY_SUMMARY_PREFIX + state.history_summary), *tail]
+
+
+def _messages_after(messages: list[AnyMessage], msg_id: str | None) -> list[AnyMessage]:
+    if msg_id is None:
+        return messages
+    for index, message in enumerate(messages):
+        if message.id == msg_id:
+            return messages[index + 1:]
+    # 找不到摘要截止的消息(例如历史被清理)，退化为使用全部历史
+    return messages
+
+
+class HistoryCompactor:
+    """
+    对话历史压缩：未摘要的历史超过token阈值后，把较早的轮次合并进滚动摘要，
+    只保留最近的若干轮原始消息参与后续提示词
+    """
+
+    def __init__(self, llm: BaseChatModel, graph_name: str, threshold_tokens: int, keep_recent_tokens: int):
+        """
+        :param llm: 生成摘要用的llm
+        :param graph_name: graph名称，用于指标统计
+        :param threshold_tokens: 压缩后的历史超过该token数时触发压缩
+        :param keep_recent_tokens: 压缩时保留的最近原始消息的token数
+        """
+        # 摘要不需要流式输出给前端
+        self.__llm = llm.with_config(tags=[TAG_NOSTREAM])
+        self.__graph_name = graph_name
+        self.__threshold_tokens = threshold_tokens
+        self.__keep_recent_tokens = keep_recent_tokens
+
+    async def compact(self, state):
+        """
+        压缩节点：每轮运行开始时检查是否需要压缩，并统计本轮节省的token数
+        :param state:
+        :return: 更新后的摘要
+        """
+        labels = {"graph": self.__graph_name}
+        raw_tokens = token_util.count_message_tokens(state.messages)
+        summary = state.history_summary
+        summary_until = state.history_summary_until
+        tail = _messages_after(list(state.messages), summary_until) if summary else list(state.messages)
+
+        update = {}
+        if self.__summary_tokens(summary) + token_util.count_message_tokens(tail) > self.__threshold_tokens:
+            cut = self.__find_cut(tail)
+            if cut > 0:
+                start = time.perf_counter()
+                summary = await self.__summarize(summary, tail[:cut])
+                summary_until = tail[cut - 1].id
+                tail = tail[cut:]
+                update = {"history_summary": summary, "history_summary_until": summary_until}
+                metrics_util.inc_counter("history_compactions_total", labels)
+                metrics_util.observe("history_compaction_seconds", time.perf_counter() - start, labels)
+
+        compacted_tokens = self.__summary_tokens(summary) + token_util.count_message_tokens(tail)
+        saved_tokens = max(0, raw_tokens - compacted_tokens)
+        metrics_util.observe("history_tokens_saved", saved_tokens, labels)
+        metrics_util.observe("history_prompt_tokens", compacted_tokens, labels)
+        if saved_tokens > 0:
+            logging.info("对话历史压缩，graph:%s, session:%s, 原始token:%s, 压缩后token:%s, 节省:%s",
+                         self.__graph_name, state.session_id, raw_tokens, compacted_tokens, saved_tokens)
+        return update
+
+    def __find_cut(self, tail: list[AnyMessage]) -> int:
+        """
+        从后往前保留不超过keep_recent_tokens的消息，切分点对齐到用户消息，
+        保证工具调用和工具返回不会被拆开，且当前这一轮一定完整保留
+        :return: 需要并入摘要的消息数量
+        """
+        human_indexes = [i for i, m in enumerate(tail) if isinstance(m, HumanMessage)]
+        if len(human_indexes) == 0:
+            return 0
+
+        cut = len(tail)
+        kept_tokens = 0
+        while cut > 0:
+            kept_tokens += token_util.count_message_tokens([tail[cut - 1]])
+            if kept_tokens > self.__keep_recent_tokens:
+                break
+            cut -= 1
+
+        later = [i for i in human_indexes if i >= cut]
+        return later[0] if len(later) > 0 else human_indexes[-1]
+
+    async def __summarize(self, summary: str, messages: list[AnyMessage]) -> str:
+        conversation = "\n".join(_format_message(m) for m in messages)
+        response = await self.__llm.ainvoke([HumanMessage(content=prompts.get_history_summary_prompt(summary, conversation))])
+        return response.content
+
+    @staticmethod
+    def __summary_tokens(summary: str) -> int:
+        if not summary:
+            return 0
+        return token_util.count_message_tokens([SystemMessage(content=HISTORY_SUMMARY_PREFIX + summary)])
+
+
+def _format_message(message: AnyMessage) -> str:
+    if isinstance(message, HumanMessage):
+        role = "用户"
+    elif isinstance(message, ToolMessage):
+        role = "工具返回"
+    elif isinstance(message, AIMessage):
+        role = "助手"
+    else:
+        role = message.type
+    text = token_util.message_text(message)
+    if len(text) > SUMMARY_MESSAGE_MAX_CHARS:
+        text = text[:SUMMARY_MESSAGE_MAX_CHARS] + "..."
+    return f"{role}: {text}"
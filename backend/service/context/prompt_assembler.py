@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+
+from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from config import Config
+from service.context.history_compactor import compacted_messages
+from service.context.tool_digest import tool_digest
+from util import metrics_util, token_util
+
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """
+    节点的上下文窗口策略，各项可以组合使用
+    """
+    # 是否使用滚动摘要+摘要之后的消息，否则使用完整的原始历史
+    summary: bool = True
+    # 只保留最近K轮对话(一轮从用户消息开始)，1表示只保留当前这一轮
+    last_turns: int | None = None
+    # 历史消息的token预算，超过时从最早的轮次开始丢弃，当前这一轮始终保留
+    max_tokens: int | None = None
+    # 已被后续llm调用使用过的工具返回替换为摘要，保留工具消息本身，保证与工具调用配对：
+    # 之前轮次的工具返回，以及当前这一轮中最近一次工具调用之前的工具返回；最近一次工具调用的返回始终保留原文
+    elide_tool_messages: bool = False
+
+    @staticmethod
+    def from_dict(policy: dict | None) -> "ContextPolicy":
+        return ContextPolicy(**policy) if policy else ContextPolicy()
+
+
+class PromptAssembler:
+    """
+    按节点的上下文策略拼装提示词消息，策略统一在Config.CONTEXT_POLICIES中配置
+    """
+
+    def __init__(self, graph_name: str):
+        self.__graph_name = graph_name
+        self.__default_policy = ContextPolicy.from_dict(Config.CONTEXT_DEFAULT_POLICY)
+        self.__policies = {node: ContextPolicy.from_dict(policy)
+                           for node, policy in Config.CONTEXT_POLICIES.get(graph_name, {}).items()}
+
+    def policy_of(self, node: str) -> ContextPolicy:
+        return self.__policies.get(node, self.__default_policy)
+
+    def history(self, node: str, state) -> list[AnyMessage]:
+        """
+        按节点策略裁剪后的对话历史
+        :param node: 节点名称
+        :param state: 包含messages和滚动摘要的state
+        :return: 消息列表
+        """
+        return self.history_with_policy(self.policy_of(node), state, node)
+
+    def history_with_policy(self, policy: ContextPolicy, state, node: str | None = None) -> list[AnyMessage]:
+        """
+        按指定策略裁剪对话历史
+        :param policy: 上下文策略
+        :param state: 包含messages和滚动摘要的state
+        :param node: 节点名称，用于指标统计
+        :return: 消息列表
+        """
+        messages = compacted_messages(state) if policy.summary else list(state.messages)
+        # 摘要消息固定放在最前面，不参与按轮裁剪
+        head = messages[:1] if len(messages) > 0 and isinstance(messages[0], SystemMessage) else []
+        turns = _split_turns(messages[len(head):])
+
+        if policy.last_turns is not None:
+            turns = turns[-policy.last_turns:] if policy.last_turns > 0 else []
+        if policy.elide_tool_messages:
+            turns, elided_tokens = _elide_consumed_tool_messages(turns)
+            if elided_tokens > 0 and node is not None:
+                metrics_util.observe("context_tool_elided_tokens", elided_tokens, {"graph": self.__graph_name, "node": node})
+        if policy.max_tokens is not None:
+            budget = policy.max_tokens - token_util.count_message_tokens(head)
+            while len(turns) > 1 and sum(token_util.count_message_tokens(turn) for turn in turns) > budget:
+                turns = turns[1:]
+
+        return [*head, *(message for turn in turns for message in turn)]
+
+    def assemble(self, node: str, state, prefix: list) -> list:
+        """
+        拼装完整的提示词消息：前缀(系统提示词、示例占位等) + 按策略裁剪后的历史，并统计节点的提示词token数
+        :param node: 节点名称
+        :param state: state
+        :param prefix: 放在历史消息之前的消息
+        :return: 可直接传给ChatPromptTemplate.from_messages的消息列表
+        """
+        history = self.history(node, state)
+        # 示例占位(MessagesPlaceholder)等模板对象不计入
+        counted = [m for m in prefix if isinstance(m, (BaseMessage, tuple))]
+        history_tokens = token_util.count_message_tokens(history)
+        labels = {"graph": self.__graph_name, "node": node}
+        metrics_util.observe("context_prompt_tokens", token_util.count_message_tokens(counted) + history_tokens, labels)
+        metrics_util.observe("context_history_tokens", history_tokens, labels)
+        metrics_util.observe("context_history_dropped_tokens",
+                             max(0, token_util.count_message_tokens(state.messages) - history_tokens), labels)
+        return [*prefix, *history]
+
+
+def _split_turns(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or len(turns) == 0:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _elide_consumed_tool_messages(turns: list[list[AnyMessage]]) -> tuple[list[list[AnyMessage]], int]:
+    """
+    把已被使用过的较大的工具返回替换为摘要：之前轮次的全部工具返回，以及当前这一轮中
+    最近一次工具调用(带tool_calls的AIMessage)之前的工具返回，最近一次工具调用的返回保留原文
+    :return: 替换后的各轮消息，节省的token数
+    """
+    current = turns[-1] if len(turns) > 0 else []
+    # 当前这一轮最近一次工具调用的位置，之前的工具返回已经被这次调用的llm看到过
+    latest_call = max((i for i, m in enumerate(current) if isinstance(m, AIMessage) and m.tool_calls), default=0)
+    candidates = [m for turn in turns[:-1] for m in turn] + current[:latest_call]
+    consumed = {id(m) for m in candidates
+                if isinstance(m, ToolMessage) and len(token_util.message_text(m)) >= Config.TOOL_MESSAGE_ELIDE_MIN_CHARS}
+    if len(consumed) == 0:
+        return turns, 0
+
+    saved_tokens = 0
+    elided_turns = []
+    for turn in turns:
+        elided_turn = []
+        for message in turn:
+            if id(message) in consumed:
+                digest = message.model_copy(update={"content": tool_digest(message)})
+                saved_tokens += token_util.count_message_tokens([message]) - token_util.count_message_tokens([digest])
+                message = digest
+            elided_turn.append(message)
+        elided_turns.append(elided_turn)
+    return elided_turns, max(0, saved_tokens)
@@ -0,0 +1,80 @@
+import logging
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from entity.query_data_task_entity import QueryDataTaskEntity
+from service.cache.welcome_cache import version_of
+from service.context.context_budget import lexical_relevance
+from util import metrics_util
+
+
+class TaskSelector:
+    """
+    从任务目录中挑选与当前问题相关的任务：按向量相似度取top-N，再加上固定展示的常用任务，
+    任务向量按任务内容的版本缓存，任务变化后才重新计算
+    """
+
+    def __init__(self, embeddings: Embeddings | None, top_n: int):
+        """
+        :param embeddings: 向量模型，为空时退化为按字面重合度排序
+        :param top_n: 按相关度挑选的任务数
+        """
+        self.__embeddings = embeddings
+        self.__top_n = top_n
+        # business_key -> {任务id: (版本, 向量)}
+        self.__vectors: dict[str, dict[int, tuple[str, list[float]]]] = {}
+        self.__lock = threading.Lock()
+
+    def select(self, business_key: str, question: str, tasks: list[QueryDataTaskEntity],
+               pinned_names: set[str]) -> list[QueryDataTaskEntity]:
+        """
+        挑选任务
+        :param business_key: 业务键
+        :param question: 用户当前的问题
+        :param tasks: 全部任务
+        :param pinned_names: 固定展示的任务名称(最常/最近执行)
+        :return: 挑选出的任务，保持任务目录中的顺序
+        """
+        labels = {"business_key": business_key}
+        metrics_util.set_gauge("task_catalog_size", len(tasks), labels)
+        pinned = [task for task in tasks if task.name in pinned_names]
+        candidates = [task for task in tasks if task.name not in pinned_names]
+        if len(candidates) <= self.__top_n:
+            selected = tasks
+        else:
+            scores = self.__scores(business_key, question, candidates)
+            ranked = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:self.__top_n]
+            chosen = {candidates[i].id for i in ranked} | {task.id for task in pinned}
+            selected = [task for task in tasks if task.id in chosen]
+
+        metrics_util.observe("task_selector_selected", len(selected), labels)
+        return selected
+
+    def __scores(self, business_key: str, question: str, tasks: list[QueryDataTaskEntity]) -> list[float]:
+        if self.__embeddings is not None:
+            try:
+                question_vector = self.__embeddings.embed_query(question)
+                return [_dot(question_vector, vector) for vector in self.__task_vectors(business_key, tasks)]
+            except Exception as e:
+                logging.warning("计算任务向量失败，按字面重合度挑选任务:%s", e)
+        return [lexical_relevance(question, f"{task.name}{task.task_detail}") for task in tasks]
+
+    def __task_vectors(self, business_key: str, tasks: list[QueryDataTaskEntity]) -> list[list[float]]:
+        with self.__lock:
+            cached = dict(self.__vectors.get(business_key, {}))
+        versions = {task.id: version_of(task.name, task.task_detail) for task in tasks}
+        stale = [task for task in tasks if task.id not in cached or cached[task.id][0] != versions[task.id]]
+        if len(stale) > 0:
+            vectors = self.__embeddings.embed_documents([f"任务名称：{task.name}\n{task.task_detail}" for task in stale])
+            for task, vector in zip(stale, vectors):
+                cached[task.id] = (versions[task.id], vector)
+            metrics_util.inc_counter("task_selector_embedded_total", {"business_key": business_key}, len(stale))
+            with self.__lock:
+                self.__vectors[business_key] = cached
+        return [cached[task.id][1] for task in tasks]
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    # 向量已归一化，点积即余弦相似度
+    return sum(x * y for x, y in zip(a, b))
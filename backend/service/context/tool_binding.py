@@ -0,0 +1,74 @@
+import json
+import threading
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from util import metrics_util, token_util
+
+# (工具名称, 工具描述) -> 工具定义(schema)的token数
+_schema_tokens: dict[tuple[str, str], int] = {}
+_schema_tokens_lock = threading.Lock()
+
+
+def tools_for_task(tools: list[BaseTool], tool_names: list[str] | None) -> tuple[list[BaseTool], bool]:
+    """
+    获取任务需要绑定的工具：任务记录了所需工具且这些工具都还存在时只绑定这些工具，否则绑定全部工具
+    :param tools: 智能体的全部业务工具
+    :param tool_names: 任务记录的工具名称
+    :return: 工具列表，是否为子集
+    """
+    if not tool_names:
+        return tools, False
+    by_name = {t.name: t for t in tools}
+    if any(name not in by_name for name in tool_names):
+        return tools, False
+    return [by_name[name] for name in tool_names], True
+
+
+def used_tool_names(messages: list[AnyMessage]) -> list[str]:
+    """
+    本轮(最后一条用户消息之后)成功调用过的工具名称
+    :param messages: 消息列表
+    :return: 工具名称，按首次调用的顺序
+    """
+    start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1) + 1
+    turn = messages[start:]
+    failed_call_ids = {m.tool_call_id for m in turn if isinstance(m, ToolMessage) and m.status == "error"}
+    names = []
+    for message in turn:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                if call["id"] not in failed_call_ids and call["name"] not in names:
+                    names.append(call["name"])
+    return names
+
+
+def observe_tool_schema_tokens(graph_name: str, node: str, tools: list[BaseTool], subset: bool) -> int:
+    """
+    统计一次llm调用绑定的工具定义token数
+    :return: token数
+    """
+    tokens = tool_schema_tokens(tools)
+    metrics_util.observe("tool_schema_tokens", tokens,
+                         {"graph": graph_name, "node": node, "binding": "subset" if subset else "full"})
+    return tokens
+
+
+def tool_schema_tokens(tools: list[BaseTool]) -> int:
+    """
+    工具定义的token数
+    """
+    return sum(_tool_schema_tokens(t) for t in tools)
+
+
+def _tool_schema_tokens(tool: BaseTool) -> int:
+    key = (tool.name, tool.description)
+    with _schema_tokens_lock:
+        tokens = _schema_tokens.get(key)
+    if tokens is None:
+        tokens = token_util.count_tokens(json.dumps(convert_to_openai_tool(tool), ensure_ascii=False))
+        with _schema_tokens_lock:
+            _schema_tokens[key] = tokens
+    return tokens
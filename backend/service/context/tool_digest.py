@@ -0,0 +1,47 @@
+import json
+
+from langchain_core.messages import ToolMessage
+
+# 摘要中保留的原始内容预览字符数
+DIGEST_PREVIEW_CHARS = 200
+# 结构描述中最多列出的字段数
+DIGEST_MAX_KEYS = 12
+
+
+def tool_digest(message: ToolMessage) -> str:
+    """
+    生成已被使用过的工具返回的摘要，替代原始内容放入后续提示词，原始内容仍保存在checkpoint中
+    :param message: 工具消息
+    :return: 摘要文本，包含工具名称、句柄(tool_call_id)、原始长度、数据结构和内容预览
+    """
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    parts = [f"[工具{message.name or ''}的返回已使用过，原始内容已省略，句柄:{message.tool_call_id}，原始长度:{len(content)}字符]"]
+    try:
+        value = json.loads(content)
+    except ValueError:
+        value = None
+    if isinstance(value, (dict, list)):
+        parts.append(f"结构:{_describe(value)}")
+        preview = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    else:
+        preview = " ".join(content.split())
+    if len(preview) > DIGEST_PREVIEW_CHARS:
+        preview = preview[:DIGEST_PREVIEW_CHARS] + "..."
+    parts.append(f"预览:{preview}")
+    return "\n".join(parts)
+
+
+def _describe(value, depth: int = 0) -> str:
+    if isinstance(value, dict):
+        if depth >= 2:
+            return "{...}"
+        keys = list(value.keys())
+        items = [f"{k}:{_describe(value[k], depth + 1)}" for k in keys[:DIGEST_MAX_KEYS]]
+        if len(keys) > DIGEST_MAX_KEYS:
+            items.append(f"...共{len(keys)}个字段")
+        return "{" + ",".join(items) + "}"
+    if isinstance(value, list):
+        if len(value) == 0:
+            return "[]"
+        return f"[{len(value)}条 {_describe(value[0], depth + 1)}]"
+    return type(value).__name__
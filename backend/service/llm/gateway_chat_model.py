@@ -0,0 +1,159 @@
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from service.llm.llm_gateway import LLMPriority, current_llm_priority, get_llm_gateway
+from util import token_util
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    经过LLMGateway准入控制的ChatModel，内部委托给真实的模型(ChatDeepSeek)
+    流式/非流式、bind_tools都保持与原模型一致，只在真正请求模型前排队
+    """
+    # 真实调用的模型
+    inner: BaseChatModel
+    # 用来按业务限流
+    business_key: str
+    # 固定优先级，为空时使用调用上下文中的优先级(current_llm_priority)
+    priority: Optional[LLMPriority] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params
+
+    def with_priority(self, priority: LLMPriority) -> "GatewayChatModel":
+        """
+        复制一个固定优先级的模型（例如后台记忆提取）
+        :param priority: 优先级
+        :return: 新模型
+        """
+        return self.model_copy(update={"priority": priority})
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # 复用原模型的工具格式转换，再绑定到当前模型上，保证调用仍然经过网关
+        binding = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**binding.kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        priority = self.__get_priority()
+        gateway = get_llm_gateway()
+        gateway.acquire_sync(self.business_key, priority, token_util.count_message_tokens(messages))
+        output_tokens = 0
+        try:
+            result = self.inner._generate(messages, stop=stop, **kwargs)
+            output_tokens = _output_tokens(result.generations[0].message if result.generations else None)
+            return result
+        finally:
+            gateway.release(self.business_key, priority, output_tokens)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        priority = self.__get_priority()
+        gateway = get_llm_gateway()
+        await gateway.acquire(self.business_key, priority, token_util.count_message_tokens(messages))
+        output_tokens = 0
+        try:
+            result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+            output_tokens = _output_tokens(result.generations[0].message if result.generations else None)
+            return result
+        finally:
+            gateway.release(self.business_key, priority, output_tokens)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        priority = self.__get_priority()
+        gateway = get_llm_gateway()
+        gateway.acquire_sync(self.business_key, priority, token_util.count_message_tokens(messages))
+        usage = _StreamUsage()
+        try:
+            for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                usage.add(chunk.message)
+                yield chunk
+        finally:
+            gateway.release(self.business_key, priority, usage.output_tokens)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        priority = self.__get_priority()
+        gateway = get_llm_gateway()
+        await gateway.acquire(self.business_key, priority, token_util.count_message_tokens(messages))
+        usage = _StreamUsage()
+        try:
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                usage.add(chunk.message)
+                yield chunk
+        finally:
+            gateway.release(self.business_key, priority, usage.output_tokens)
+
+    def __get_priority(self) -> LLMPriority:
+        return self.priority if self.priority is not None else current_llm_priority.get()
+
+
+def _output_tokens(message) -> int:
+    if message is None:
+        return 0
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return int(usage.get("output_tokens", 0))
+    return token_util.count_tokens(token_util.message_text(message))
+
+
+class _StreamUsage:
+    """
+    流式输出时累计输出token：有usage_metadata(stream_usage=True)时以其为准，否则按文本估算
+    """
+
+    def __init__(self):
+        self.__text_tokens = 0
+        self.__usage_tokens = None
+
+    def add(self, message):
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.__usage_tokens = (self.__usage_tokens or 0) + int(usage.get("output_tokens", 0))
+        else:
+            self.__text_tokens += token_util.count_tokens(token_util.message_text(message))
+
+    @property
+    def output_tokens(self) -> int:
+        return self.__usage_tokens if self.__usage_tokens is not None else self.__text_tokens
+
+
+def wrap_with_gateway(llm: BaseChatModel, business_key: str, priority: LLMPriority | None = None) -> GatewayChatModel:
+    """
+    把模型包装成经过LLMGateway准入控制的模型
+    :param llm: 原始模型
+    :param business_key: 业务键
+    :param priority: 固定优先级，为空时使用调用上下文中的优先级
+    :return: 包装后的模型
+    """
+    return GatewayChatModel(inner=llm, business_key=business_key, priority=priority)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import StrEnum
+
+from config import Config
+from util import metrics_util
+from util.concurrency_util import PrioritySemaphore
+
+
+class LLMPriority(StrEnum):
+    # 用户直接发起的提问，需要尽快返回首个token
+    INTERACTIVE = "interactive"
+    # 工具内嵌套调用（例如助理通过ask_data_clerk调用数据员）
+    NESTED_TOOL = "nested_tool"
+    # 后台任务（例如记忆提取），可以等待
+    BACKGROUND = "background"
+
+
+# 优先级排序，数字越小越优先
+PRIORITY_ORDER = {
+    LLMPriority.INTERACTIVE: 0,
+    LLMPriority.NESTED_TOOL: 1,
+    LLMPriority.BACKGROUND: 2,
+}
+
+# 当前调用链的优先级，在入口处设置，随协程/节点上下文传递
+current_llm_priority: ContextVar[LLMPriority] = ContextVar("current_llm_priority", default=LLMPriority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: LLMPriority):
+    """
+    在with范围内发起的LLM调用使用指定优先级
+    :param priority: 优先级
+    """
+    token = current_llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_llm_priority.reset(token)
+
+
+class LLMGatewayTimeoutError(Exception):
+    """
+    LLM调用排队超过最长等待时间
+    """
+    pass
+
+
+class TokenBucket:
+    """
+    令牌桶：按每分钟token数匀速补充，允许短时欠账，保证长期速率不超过限制
+    """
+
+    def __init__(self, tokens_per_minute: float, capacity: float):
+        self.__rate = tokens_per_minute / 60.0
+        self.__capacity = capacity
+        self.__tokens = capacity
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill_locked(self):
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated_at) * self.__rate)
+        self.__updated_at = now
+
+    def reserve(self, cost: float, max_wait: float) -> float | None:
+        """
+        预占token
+        :param cost: 本次预计消耗的token数
+        :param max_wait: 最多可以等待的时间(秒)
+        :return: 需要等待的时间(秒)，超过max_wait时返回None且不扣减
+        """
+        cost = min(cost, self.__capacity)
+        with self.__lock:
+            self.__refill_locked()
+            if self.__tokens >= cost:
+                self.__tokens -= cost
+                return 0.0
+            wait = (cost - self.__tokens) / self.__rate
+            if wait > max_wait:
+                return None
+            self.__tokens -= cost
+            return wait
+
+    def charge(self, cost: float):
+        """
+        调用结束后补扣实际产生的token（输出token等）
+        :param cost: token数
+        """
+        with self.__lock:
+            self.__refill_locked()
+            self.__tokens -= cost
+
+    @property
+    def available(self) -> float:
+        with self.__lock:
+            self.__refill_locked()
+            return self.__tokens
+
+
+class LLMGateway:
+    """
+    LLM调用的统一入口：全局并发上限 + 按business_key的token限流 + 按优先级排队
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: float, burst_tokens: float, max_wait: dict):
+        self.__semaphore = PrioritySemaphore(max_concurrency)
+        self.__tokens_per_minute = tokens_per_minute
+        self.__burst_tokens = burst_tokens
+        self.__max_wait = max_wait
+        self.__buckets: dict[str, TokenBucket] = {}
+        self.__buckets_lock = threading.Lock()
+
+    def get_bucket(self, business_key: str) -> TokenBucket:
+        with self.__buckets_lock:
+            bucket = self.__buckets.get(business_key)
+            if bucket is None:
+                bucket = TokenBucket(self.__tokens_per_minute, self.__burst_tokens)
+                self.__buckets[business_key] = bucket
+            return bucket
+
+    def max_wait_of(self, priority: LLMPriority) -> float:
+        return float(self.__max_wait.get(str(priority), Config.LLM_GATEWAY_DEFAULT_MAX_WAIT))
+
+    def queued(self, priority: LLMPriority | None = None) -> int:
+        """
+        排队等待中的调用数量
+        :param priority: 为空时返回全部
+        """
+        if priority is None:
+            return self.__semaphore.waiting
+        return self.__semaphore.waiting_of(PRIORITY_ORDER[priority])
+
+    async def acquire(self, business_key: str, priority: LLMPriority, cost: float) -> float:
+        """
+        协程中申请一次LLM调用
+        :param business_key: 业务键
+        :param priority: 优先级
+        :param cost: 预计消耗的token数
+        :return: 排队总耗时(秒)
+        """
+        start = time.perf_counter()
+        max_wait = self.max_wait_of(priority)
+        rate_wait = self.__reserve(business_key, priority, cost, max_wait)
+        if rate_wait > 0:
+            await asyncio.sleep(rate_wait)
+
+        self.__update_queue_gauge(priority, 1)
+        try:
+            acquired = await self.__semaphore.acquire(PRIORITY_ORDER[priority],
+                                                      timeout=max(0.0, max_wait - (time.perf_counter() - start)))
+        finally:
+            self.__update_queue_gauge(priority, -1)
+        return self.__after_acquire(business_key, priority, acquired, start)
+
+    def acquire_sync(self, business_key: str, priority: LLMPriority, cost: float) -> float:
+        """
+        同步申请一次LLM调用
+        :param business_key: 业务键
+        :param priority: 优先级
+        :param cost: 预计消耗的token数
+        :return: 排队总耗时(秒)
+        """
+        start = time.perf_counter()
+        max_wait = self.max_wait_of(priority)
+        rate_wait = self.__reserve(business_key, priority, cost, max_wait)
+        if rate_wait > 0:
+            time.sleep(rate_wait)
+
+        self.__update_queue_gauge(priority, 1)
+        try:
+            acquired = self.__semaphore.acquire_sync(PRIORITY_ORDER[priority],
+                                                     timeout=max(0.0, max_wait - (time.perf_counter() - start)))
+        finally:
+            self.__update_queue_gauge(priority, -1)
+        return self.__after_acquire(business_key, priority, acquired, start)
+
+    def release(self, business_key: str, priority: LLMPriority, output_tokens: int):
+        """
+        LLM调用结束，归还并发许可并补扣输出token
+        :param business_key: 业务键
+        :param priority: 优先级
+        :param output_tokens: 实际输出的token数
+        """
+        self.__semaphore.release()
+        metrics_util.add_gauge("llm_gateway_in_flight", -1)
+        if output_tokens > 0:
+            self.get_bucket(business_key).charge(output_tokens)
+        metrics_util.inc_counter("llm_gateway_output_tokens_total", {"priority": priority}, output_tokens)
+
+    def __reserve(self, business_key, priority, cost, max_wait) -> float:
+        rate_wait = self.get_bucket(business_key).reserve(cost, max_wait)
+        if rate_wait is None:
+            metrics_util.inc_counter("llm_gateway_rejected_total", {"priority": priority, "reason": "rate_limit"})
+            raise LLMGatewayTimeoutError(f"业务{business_key}的LLM调用超出token限额，请稍后重试")
+        if rate_wait > 0:
+            metrics_util.observe("llm_gateway_rate_limit_wait_seconds", rate_wait, {"priority": priority})
+        metrics_util.inc_counter("llm_gateway_input_tokens_total", {"priority": priority}, cost)
+        return rate_wait
+
+    def __after_acquire(self, business_key, priority, acquired, start) -> float:
+        wait_seconds = time.perf_counter() - start
+        if not acquired:
+            metrics_util.inc_counter("llm_gateway_rejected_total", {"priority": priority, "reason": "queue_timeout"})
+            logging.warning("LLM调用排队超时，business_key:%s, priority:%s, 等待:%.2fs", business_key, priority, wait_seconds)
+            raise LLMGatewayTimeoutError(f"LLM调用排队超过{self.max_wait_of(priority)}秒，请稍后重试")
+        metrics_util.observe("llm_gateway_queue_wait_seconds", wait_seconds, {"priority": priority})
+        metrics_util.add_gauge("llm_gateway_in_flight", 1)
+        return wait_seconds
+
+    def __update_queue_gauge(self, priority, delta):
+        metrics_util.add_gauge("llm_gateway_queued", delta, {"priority": priority})
+
+
+llm_gateway = LLMGateway(max_concurrency=Config.LLM_GATEWAY_MAX_CONCURRENCY,
+                         tokens_per_minute=Config.LLM_GATEWAY_TOKENS_PER_MINUTE,
+                         burst_tokens=Config.LLM_GATEWAY_BURST_TOKENS,
+                         max_wait=Config.LLM_GATEWAY_MAX_WAIT)
+
+
+def get_llm_gateway() -> LLMGateway:
+    return llm_gateway
@@ -0,0 +1,135 @@
+import math
+import threading
+import time
+from collections import deque
+
+from config import Config
+from service.llm.llm_gateway import get_llm_gateway
+from service.runtime.session_run_queue import get_session_run_queue
+from util import metrics_util
+
+# 计算最近延迟时至少需要的样本数，样本太少时不据此拒绝请求
+MIN_LATENCY_SAMPLES = 5
+
+
+class AdmissionTicket:
+    """
+    已接纳的一次运行，运行结束时必须release
+    """
+
+    def __init__(self, controller: "AdmissionController", endpoint: str):
+        self.__controller = controller
+        self.__endpoint = endpoint
+        self.__start = time.perf_counter()
+        self.__first_event_marked = False
+        self.__released = False
+
+    def mark_first_event(self):
+        """
+        记录首个事件(首token)的延迟
+        """
+        if not self.__first_event_marked:
+            self.__first_event_marked = True
+            self.__controller.record_first_event(self.__endpoint, time.perf_counter() - self.__start)
+
+    def release(self):
+        if not self.__released:
+            self.__released = True
+            self.__controller.finish(self.__endpoint, time.perf_counter() - self.__start)
+
+
+class AdmissionDecision:
+    def __init__(self, ticket: AdmissionTicket | None = None, reason: str | None = None, retry_after: int = 0):
+        self.ticket = ticket
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def admitted(self) -> bool:
+        return self.ticket is not None
+
+
+class AdmissionController:
+    """
+    入口准入控制：根据进行中的运行数、排队深度、最近的首token延迟判断是否过载，
+    过载时直接拒绝，避免接下无法在超时时间内完成的请求
+    """
+
+    def __init__(self, max_in_flight: int, max_queue_depth: int, max_recent_latency: float, latency_window: float):
+        self.__max_in_flight = max_in_flight
+        self.__max_queue_depth = max_queue_depth
+        self.__max_recent_latency = max_recent_latency
+        self.__latency_window = latency_window
+        self.__in_flight = 0
+        self.__latencies = deque()
+        self.__lock = threading.Lock()
+
+    def try_admit(self, endpoint: str) -> AdmissionDecision:
+        """
+        尝试接纳一次运行
+        :param endpoint: 入口名称，用于指标统计
+        :return: 接纳结果，被拒绝时包含原因和建议的重试间隔
+        """
+        queue_depth = get_llm_gateway().queued() + get_session_run_queue().queued()
+        with self.__lock:
+            recent_latency = self.__recent_latency_locked()
+            reason = None
+            if self.__in_flight >= self.__max_in_flight:
+                reason = "in_flight"
+            elif queue_depth >= self.__max_queue_depth:
+                reason = "queue_depth"
+            elif recent_latency is not None and recent_latency > self.__max_recent_latency and self.__in_flight > 0:
+                reason = "latency"
+
+            if reason is None:
+                self.__in_flight += 1
+                in_flight = self.__in_flight
+
+        if reason is not None:
+            retry_after = self.__retry_after(reason, queue_depth, recent_latency)
+            metrics_util.inc_counter("admission_decisions_total", {"endpoint": endpoint, "decision": "shed", "reason": reason})
+            return AdmissionDecision(reason=reason, retry_after=retry_after)
+
+        metrics_util.inc_counter("admission_decisions_total", {"endpoint": endpoint, "decision": "admitted"})
+        metrics_util.set_gauge("admission_in_flight", in_flight)
+        return AdmissionDecision(ticket=AdmissionTicket(self, endpoint))
+
+    def record_first_event(self, endpoint: str, latency: float):
+        with self.__lock:
+            self.__latencies.append((time.monotonic(), latency))
+        metrics_util.observe("admission_first_event_seconds", latency, {"endpoint": endpoint})
+
+    def finish(self, endpoint: str, duration: float):
+        with self.__lock:
+            self.__in_flight -= 1
+            in_flight = self.__in_flight
+        metrics_util.set_gauge("admission_in_flight", in_flight)
+        metrics_util.observe("admission_run_seconds", duration, {"endpoint": endpoint})
+
+    def __recent_latency_locked(self) -> float | None:
+        # 只看窗口内的样本，过载消退后自然恢复接纳
+        expire_before = time.monotonic() - self.__latency_window
+        while len(self.__latencies) > 0 and self.__latencies[0][0] < expire_before:
+            self.__latencies.popleft()
+        if len(self.__latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(latency for _, latency in self.__latencies)
+        return ordered[len(ordered) // 2]
+
+    def __retry_after(self, reason, queue_depth, recent_latency) -> int:
+        base = Config.OVERLOAD_RETRY_AFTER_SECONDS
+        if reason == "queue_depth":
+            return int(math.ceil(base * max(1.0, queue_depth / max(1, self.__max_queue_depth))))
+        if reason == "latency" and recent_latency is not None:
+            return int(math.ceil(max(base, recent_latency)))
+        return base
+
+
+admission_controller = AdmissionController(max_in_flight=Config.OVERLOAD_MAX_IN_FLIGHT_RUNS,
+                                           max_queue_depth=Config.OVERLOAD_MAX_QUEUE_DEPTH,
+                                           max_recent_latency=Config.OVERLOAD_MAX_RECENT_LATENCY,
+                                           latency_window=Config.OVERLOAD_LATENCY_WINDOW)
+
+
+def get_admission_controller() -> AdmissionController:
+    return admission_controller
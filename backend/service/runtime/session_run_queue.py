@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from config import Config
+from util import metrics_util
+from util.concurrency_util import PrioritySemaphore
+
+# 保留统计信息的会话数量上限，超过后淘汰最久未运行的会话
+MAX_TRACKED_SESSIONS = 10000
+
+
+class SessionBusyError(Exception):
+    """
+    同一会话排队等待超时
+    """
+    pass
+
+
+class _SessionEntry:
+    def __init__(self):
+        self.semaphore = PrioritySemaphore(1)
+        # 正在运行+排队的数量，为0时回收
+        self.ref_count = 0
+
+
+class SessionRunQueue:
+    """
+    会话级串行执行队列：同一thread_id的多轮运行串行执行，不同会话之间完全并行。
+    local模式只在单个worker进程内串行，redis模式额外使用redis锁保证多worker之间也串行。
+    """
+
+    def __init__(self, use: str = "local", redis_url: str | None = None):
+        self.__use = use
+        self.__redis_url = redis_url
+        self.__entries: dict[str, _SessionEntry] = {}
+        self.__entries_lock = threading.Lock()
+        self.__stats: OrderedDict[str, dict] = OrderedDict()
+        self.__async_redis = None
+        self.__sync_redis = None
+
+    @asynccontextmanager
+    async def run(self, session_key: str, timeout: float | None = None):
+        """
+        协程中按会话串行执行
+        :param session_key: 会话键(graph名称+thread_id)
+        :param timeout: 最长排队时间(秒)，默认Config.SESSION_RUN_WAIT_TIMEOUT
+        :return: 排队等待时间(秒)
+        """
+        timeout = Config.SESSION_RUN_WAIT_TIMEOUT if timeout is None else timeout
+        start = time.perf_counter()
+        entry = self.__retain(session_key)
+        try:
+            if not await entry.semaphore.acquire(timeout=timeout):
+                self.__record_timeout(session_key)
+                raise SessionBusyError(f"会话{session_key}正在处理上一轮请求，请稍后重试")
+            try:
+                redis_lock = None
+                if self.__use == "redis":
+                    redis_lock = self.__get_async_redis().lock(self.__lock_name(session_key),
+                                                                timeout=Config.SESSION_RUN_LOCK_TIMEOUT,
+                                                                blocking_timeout=max(0.0, timeout - (time.perf_counter() - start)))
+                    if not await redis_lock.acquire():
+                        self.__record_timeout(session_key)
+                        raise SessionBusyError(f"会话{session_key}正在其他节点处理上一轮请求，请稍后重试")
+                try:
+                    wait_seconds = time.perf_counter() - start
+                    self.__record_wait(session_key, wait_seconds)
+                    yield wait_seconds
+                finally:
+                    if redis_lock is not None:
+                        await self.__release_redis_lock(redis_lock)
+            finally:
+                entry.semaphore.release()
+        finally:
+            self.__release(session_key)
+
+    @contextmanager
+    def run_sync(self, session_key: str, timeout: float | None = None):
+        """
+        同步调用(graph.invoke)时按会话串行执行
+        :param session_key: 会话键(graph名称+thread_id)
+        :param timeout: 最长排队时间(秒)，默认Config.SESSION_RUN_WAIT_TIMEOUT
+        :return: 排队等待时间(秒)
+        """
+        timeout = Config.SESSION_RUN_WAIT_TIMEOUT if timeout is None else timeout
+        start = time.perf_counter()
+        entry = self.__retain(session_key)
+        try:
+            if not entry.semaphore.acquire_sync(timeout=timeout):
+                self.__record_timeout(session_key)
+                raise SessionBusyError(f"会话{session_key}正在处理上一轮请求，请稍后重试")
+            try:
+                redis_lock = None
+                if self.__use == "redis":
+                    redis_lock = self.__get_sync_redis().lock(self.__lock_name(session_key),
+                                                              timeout=Config.SESSION_RUN_LOCK_TIMEOUT,
+                                                              blocking_timeout=max(0.0, timeout - (time.perf_counter() - start)))
+                    if not redis_lock.acquire():
+                        self.__record_timeout(session_key)
+                        raise SessionBusyError(f"会话{session_key}正在其他节点处理上一轮请求，请稍后重试")
+                try:
+                    wait_seconds = time.perf_counter() - start
+                    self.__record_wait(session_key, wait_seconds)
+                    yield wait_seconds
+                finally:
+                    if redis_lock is not None:
+                        try:
+                            redis_lock.release()
+                        except Exception as e:
+                            logging.warning("释放会话锁失败(可能已过期):%s, %s", session_key, e)
+            finally:
+                entry.semaphore.release()
+        finally:
+            self.__release(session_key)
+
+    def queued(self) -> int:
+        """
+        当前所有会话中排队等待的运行数量
+        """
+        with self.__entries_lock:
+            return sum(entry.ref_count - 1 for entry in self.__entries.values())
+
+    def get_session_stats(self, session_key_part: str | None = None) -> dict:
+        """
+        查询会话的排队统计
+        :param session_key_part: 会话键中包含的内容(例如sessionId)，为空时返回全部
+        :return: {session_key: {runs, queued, last_wait, max_wait, total_wait, timeouts}}
+        """
+        with self.__entries_lock:
+            result = {}
+            for key, stats in self.__stats.items():
+                if session_key_part is None or session_key_part in key:
+                    entry = self.__entries.get(key)
+                    result[key] = {**stats, "queued": 0 if entry is None else entry.ref_count - 1}
+            return result
+
+    def __retain(self, session_key) -> _SessionEntry:
+        with self.__entries_lock:
+            entry = self.__entries.get(session_key)
+            if entry is None:
+                entry = _SessionEntry()
+                self.__entries[session_key] = entry
+            entry.ref_count += 1
+            queued = entry.ref_count - 1
+        metrics_util.set_gauge("session_run_queued", self.queued())
+        if queued > 0:
+            logging.info("会话%s有%s个运行在排队", session_key, queued)
+        return entry
+
+    def __release(self, session_key):
+        with self.__entries_lock:
+            entry = self.__entries.get(session_key)
+            if entry is not None:
+                entry.ref_count -= 1
+                if entry.ref_count <= 0:
+                    del self.__entries[session_key]
+        metrics_util.set_gauge("session_run_queued", self.queued())
+
+    def __session_stats_locked(self, session_key) -> dict:
+        stats = self.__stats.get(session_key)
+        if stats is None:
+            stats = {"runs": 0, "last_wait": 0.0, "max_wait": 0.0, "total_wait": 0.0, "timeouts": 0}
+            self.__stats[session_key] = stats
+            if len(self.__stats) > MAX_TRACKED_SESSIONS:
+                self.__stats.popitem(last=False)
+        else:
+            self.__stats.move_to_end(session_key)
+        return stats
+
+    def __record_wait(self, session_key, wait_seconds):
+        with self.__entries_lock:
+            stats = self.__session_stats_locked(session_key)
+            stats["runs"] += 1
+            stats["last_wait"] = round(wait_seconds, 6)
+            stats["max_wait"] = round(max(stats["max_wait"], wait_seconds), 6)
+            stats["total_wait"] = round(stats["total_wait"] + wait_seconds, 6)
+        metrics_util.observe("session_run_wait_seconds", wait_seconds)
+
+    def __record_timeout(self, session_key):
+        with self.__entries_lock:
+            self.__session_stats_locked(session_key)["timeouts"] += 1
+        metrics_util.inc_counter("session_run_wait_timeout_total")
+        logging.warning("会话%s排队超时", session_key)
+
+    def __lock_name(self, session_key):
+        return f"wagner:session_run_lock:{session_key}"
+
+    def __get_async_redis(self):
+        if self.__async_redis is None:
+            import redis.asyncio as async_redis
+            self.__async_redis = async_redis.Redis.from_url(self.__redis_url)
+        return self.__async_redis
+
+    def __get_sync_redis(self):
+        if self.__sync_redis is None:
+            import redis
+            self.__sync_redis = redis.Redis.from_url(self.__redis_url)
+        return self.__sync_redis
+
+    async def __release_redis_lock(self, redis_lock):
+        try:
+            await redis_lock.release()
+        except Exception as e:
+            logging.warning("释放会话锁失败(可能已过期):%s", e)
+
+
+session_run_queue = SessionRunQueue(Config.SESSION_RUN_QUEUE_USE, Config.REDIS_URL)
+
+
+def get_session_run_queue() -> SessionRunQueue:
+    return session_run_queue
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from config import Config
+from model.batch_execution import BatchExecution, BatchJob
+from service.llm.llm_gateway import LLMPriority, llm_priority
+from service.task.execution_stats import TASK_OUTCOME_FAILED, TASK_OUTCOME_SUCCESS
+from util import datetime_util, metrics_util
+from util.concurrency_util import PrioritySemaphore
+
+BATCH_STATUS_PENDING = "pending"
+BATCH_STATUS_RUNNING = "running"
+BATCH_STATUS_FINISHED = "finished"
+
+
+class BatchExecutionManager:
+    """
+    批量执行任务：任务列表和查询条件列表组合成作业，临时运行(不写checkpoint)，
+    所有批次共用同一个并发上限，作业状态和结果保存在本进程内存中，供查询批次时返回
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_jobs: int = 500, max_batches: int = 100):
+        """
+        :param max_concurrency: 所有批次合计同时执行的作业数上限
+        :param max_jobs: 单个批次的作业数上限
+        :param max_batches: 保留的批次数上限，超过后淘汰最早提交的已完成批次
+        """
+        self.__max_concurrency = max_concurrency
+        # 所有批次共用，同时提交多个批次也不会超过上限
+        self.__semaphore = PrioritySemaphore(max_concurrency)
+        self.__max_jobs = max_jobs
+        self.__max_batches = max_batches
+        self.__batches: OrderedDict[str, BatchExecution] = OrderedDict()
+        # 正在运行的批次，持有引用避免后台协程被回收
+        self.__running: dict[str, asyncio.Task] = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, data_clerk_service, task_ids: list[int] | None = None, task_names: list[str] | None = None,
+               params_list: list[str] | None = None, concurrency: int | None = None) -> BatchExecution:
+        """
+        提交批次，立即返回，作业在后台执行。需要在事件循环中调用
+        :param data_clerk_service: 执行任务的数据员服务
+        :param task_ids: 任务id列表
+        :param task_names: 任务名称列表，与任务id列表合并
+        :param params_list: 查询条件列表，每个任务按每个查询条件各执行一次，为空时按默认条件执行一次
+        :param concurrency: 本批次最多同时执行的作业数，不超过max_concurrency
+        :return: 批次
+        """
+        tasks = [(task_id, None) for task_id in task_ids or []] + [(None, name) for name in task_names or []]
+        if len(tasks) == 0:
+            raise ValueError("任务列表不能为空")
+        params_list = params_list or [""]
+        total = len(tasks) * len(params_list)
+        if total > self.__max_jobs:
+            raise ValueError(f"作业数{total}超过上限{self.__max_jobs}")
+        if concurrency is not None and concurrency < 1:
+            raise ValueError("并发数必须大于0")
+        concurrency = min(concurrency or self.__max_concurrency, self.__max_concurrency, total)
+
+        jobs = [BatchJob(index=i, task_id=task_id, task_name=task_name, params=params or None,
+                         status=BATCH_STATUS_PENDING)
+                for i, ((task_id, task_name), params) in enumerate((task, params) for task in tasks
+                                                                    for params in params_list)]
+        batch = BatchExecution(batch_id=uuid.uuid4().hex, business_key=data_clerk_service.business_key, status=BATCH_STATUS_PENDING,
+                               concurrency=concurrency, total=total,
+                               created_at=datetime_util.format_datatime(datetime.now()), jobs=jobs)
+        with self.__lock:
+            self.__batches[batch.batch_id] = batch
+            self.__evict_locked()
+            self.__running[batch.batch_id] = asyncio.create_task(self.__run(data_clerk_service, batch))
+        metrics_util.inc_counter("batch_execution_jobs_submitted_total", value=total)
+        logging.info("提交批量执行，batch_id:%s, 作业数:%s, 并发数:%s", batch.batch_id, total, concurrency)
+        return batch
+
+    def get(self, batch_id: str) -> BatchExecution | None:
+        with self.__lock:
+            return self.__batches.get(batch_id)
+
+    async def __run(self, data_clerk_service, batch: BatchExecution):
+        start = time.perf_counter()
+        batch.status = BATCH_STATUS_RUNNING
+        queue = asyncio.Queue()
+        for job in batch.jobs:
+            queue.put_nowait(job)
+
+        async def worker():
+            while not queue.empty():
+                job = queue.get_nowait()
+                # 等待全局的执行许可，其他批次正在执行时在这里排队
+                await self.__semaphore.acquire()
+                job_start = time.perf_counter()
+                job.wait_seconds = round(job_start - start, 3)
+                job.status = BATCH_STATUS_RUNNING
+                try:
+                    result = await data_clerk_service.execute_task_directly(None, task_id=job.task_id,
+                                                                            task_name=job.task_name,
+                                                                            params=job.params, ephemeral=True)
+                    job.task_id, job.task_name = result.task_id, result.task_name
+                    job.outcome, job.content = result.outcome, result.content
+                except Exception as e:
+                    logging.exception("批量执行作业失败，batch_id:%s, 作业:%s", batch.batch_id, job.index)
+                    job.outcome, job.content = TASK_OUTCOME_FAILED, f"执行任务失败:{e}"
+                finally:
+                    self.__semaphore.release()
+                job.latency_seconds = round(time.perf_counter() - job_start, 3)
+                job.status = BATCH_STATUS_FINISHED
+                batch.finished += 1
+                if job.outcome == TASK_OUTCOME_SUCCESS:
+                    batch.succeeded += 1
+                metrics_util.inc_counter("batch_execution_jobs_total", {"outcome": job.outcome})
+                metrics_util.observe("batch_execution_job_seconds", job.latency_seconds)
+                metrics_util.observe("batch_execution_job_wait_seconds", job.wait_seconds)
+
+        try:
+            # 批量作业不应挤占用户直接发起的提问
+            with llm_priority(LLMPriority.BACKGROUND):
+                await asyncio.gather(*(worker() for _ in range(batch.concurrency)))
+        finally:
+            seconds = time.perf_counter() - start
+            batch.duration_seconds = round(seconds, 3)
+            batch.throughput_per_minute = round(batch.finished / seconds * 60, 2) if seconds > 0 else None
+            batch.status = BATCH_STATUS_FINISHED
+            with self.__lock:
+                self.__running.pop(batch.batch_id, None)
+            metrics_util.observe("batch_execution_seconds", seconds)
+            if batch.throughput_per_minute is not None:
+                metrics_util.set_gauge("batch_execution_throughput_per_minute", batch.throughput_per_minute)
+            logging.info("批量执行完成，batch_id:%s, 作业数:%s, 成功:%s, 耗时:%.3fs, 吞吐量:%s个/分钟",
+                         batch.batch_id, batch.total, batch.succeeded, seconds, batch.throughput_per_minute)
+
+    def __evict_locked(self):
+        for batch_id in list(self.__batches):
+            if len(self.__batches) <= self.__max_batches:
+                return
+            if batch_id not in self.__running:
+                del self.__batches[batch_id]
+
+
+batch_execution_manager = BatchExecutionManager(Config.BATCH_EXECUTION_MAX_CONCURRENCY,
+                                                Config.BATCH_EXECUTION_MAX_JOBS, Config.BATCH_EXECUTION_MAX_BATCHES)
+
+
+def get_batch_execution_manager() -> BatchExecutionManager:
+    return batch_execution_manager
@@ -0,0 +1,123 @@
+import uuid
+from datetime import date, timedelta
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+
+# 参数化的日期：占位符名称 -> 相对执行当天的偏移天数
+RELATIVE_DATES = {"yesterday": -1, "today": 0}
+# 工具参数中可能出现的日期格式
+DATE_FORMATS = ["%Y-%m-%d", "%Y%m%d", "%Y/%m/%d"]
+
+
+def compile_plan(messages: list[AnyMessage], today: date) -> list[list[dict]] | None:
+    """
+    把本轮(最后一条用户消息之后)成功的工具调用编译成执行计划：按llm调用的轮次排列，参数中的日期替换成相对日期占位符。
+    只有日期会被参数化，后面轮次的参数如果取自前面轮次的工具返回(例如员工编号)，回放时会是过期的值，这种情况不编译
+    :param messages: 消息列表
+    :param today: 执行当天
+    :return: 执行计划，每轮是[{"name": 工具名称, "args": 参数}]，没有工具调用或参数依赖前面的工具返回时返回None
+    """
+    start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1) + 1
+    turn = messages[start:]
+    failed_call_ids = {m.tool_call_id for m in turn if isinstance(m, ToolMessage) and m.status == "error"}
+    replacements = _date_replacements(today)
+    plan = []
+    # 之前轮次的工具返回内容
+    tool_outputs = []
+    for message in turn:
+        if isinstance(message, ToolMessage):
+            tool_outputs.append(message.content if isinstance(message.content, str) else str(message.content))
+            continue
+        if not isinstance(message, AIMessage) or not message.tool_calls:
+            continue
+        calls = [{"name": call["name"], "args": _parameterize(call["args"], replacements)}
+                 for call in message.tool_calls if call["id"] not in failed_call_ids]
+        if any(_derived_from(call["args"], tool_outputs, replacements) for call in message.tool_calls
+               if call["id"] not in failed_call_ids):
+            return None
+        if len(calls) > 0:
+            plan.append(calls)
+    return plan if len(plan) > 0 else None
+
+
+def plan_round_message(plan: list[list[dict]], round_index: int, today: date) -> AIMessage:
+    """
+    绑定执行当天的日期，生成某一轮的工具调用消息，直接交给工具节点执行
+    :param plan: 执行计划
+    :param round_index: 轮次
+    :param today: 执行当天
+    :return: 带工具调用的AI消息
+    """
+    replacements = {placeholder: value for value, placeholder in _date_replacements(today).items()}
+    return AIMessage(content="", id=str(uuid.uuid4()), tool_calls=[
+        {"name": call["name"], "args": _bind(call["args"], replacements), "id": f"plan_{uuid.uuid4().hex}"}
+        for call in plan[round_index]
+    ])
+
+
+def plan_tool_names(plan: list[list[dict]]) -> set[str]:
+    return {call["name"] for calls in plan for call in calls}
+
+
+def round_failed(messages: list[AnyMessage]) -> bool:
+    """
+    最近一轮工具调用是否有失败
+    """
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            return False
+        if message.status == "error":
+            return True
+    return False
+
+
+def _date_replacements(today: date) -> dict[str, str]:
+    # 日期字符串 -> 占位符，例如 2025-12-10 -> ${yesterday:%Y-%m-%d}
+    replacements = {}
+    for name, offset in RELATIVE_DATES.items():
+        day = today + timedelta(days=offset)
+        for fmt in DATE_FORMATS:
+            replacements[day.strftime(fmt)] = "${" + name + ":" + fmt + "}"
+    return replacements
+
+
+def _derived_from(value, tool_outputs: list[str], replacements: dict[str, str]) -> bool:
+    """
+    参数中是否有(日期以外的)值出现在之前的工具返回中
+    """
+    if len(tool_outputs) == 0:
+        return False
+    if isinstance(value, dict):
+        return any(_derived_from(v, tool_outputs, replacements) for v in value.values())
+    if isinstance(value, list):
+        return any(_derived_from(v, tool_outputs, replacements) for v in value)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+    text = str(value)
+    if text == "" or _parameterize(text, replacements) != text:
+        # 日期按执行当天重新绑定，不会过期
+        return False
+    return any(text in output for output in tool_outputs)
+
+
+def _parameterize(value, replacements: dict[str, str]):
+    if isinstance(value, dict):
+        return {k: _parameterize(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_parameterize(v, replacements) for v in value]
+    if isinstance(value, str):
+        # 先替换较长的格式，避免20251210被当成其他日期的一部分
+        for text in sorted(replacements, key=len, reverse=True):
+            value = value.replace(text, replacements[text])
+    return value
+
+
+def _bind(value, replacements: dict[str, str]):
+    if isinstance(value, dict):
+        return {k: _bind(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_bind(v, replacements) for v in value]
+    if isinstance(value, str):
+        for placeholder, text in replacements.items():
+            value = value.replace(placeholder, text)
+    return value
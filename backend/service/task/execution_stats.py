@@ -0,0 +1,21 @@
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+
+# 任务执行结果
+TASK_OUTCOME_SUCCESS = "success"  # 执行完成，工具调用全部成功
+TASK_OUTCOME_TOOL_ERROR = "tool_error"  # 执行完成，但有工具调用失败
+TASK_OUTCOME_FAILED = "failed"  # 执行过程中出现异常
+TASK_OUTCOME_NOT_FOUND = "not_found"  # 任务不存在
+TASK_OUTCOME_CACHED = "cached"  # 直接返回了缓存的结果，没有实际执行
+TASK_OUTCOME_SKIPPED = "skipped"  # 没有执行，例如预取时查询日期包含今天，结果不能缓存
+
+
+def task_outcome(messages: list[AnyMessage]) -> str:
+    """
+    根据本轮(最后一条用户消息之后)的工具调用结果判断任务执行结果
+    :param messages: 消息列表
+    :return: 执行结果
+    """
+    start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1) + 1
+    if any(isinstance(m, ToolMessage) and m.status == "error" for m in messages[start:]):
+        return TASK_OUTCOME_TOOL_ERROR
+    return TASK_OUTCOME_SUCCESS
@@ -0,0 +1,203 @@
+import atexit
+import logging
+import threading
+import time
+
+from config import Config
+from util import metrics_util
+
+# redis中待刷新的任务统计：集合保存待刷新的键，每个任务一个hash
+REDIS_PENDING_KEY = "wagner:task_stats:pending"
+REDIS_STATS_KEY_PREFIX = "wagner:task_stats:"
+
+# 原子地取出并删除一个任务的统计
+_REDIS_DRAIN_SCRIPT = """
+local values = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], KEYS[1])
+return values
+"""
+
+
+class ExecutionStatsWriter:
+    """
+    任务执行统计的缓冲写入：执行结束时只在内存/redis中累加次数、记录最近一次执行，
+    后台线程定期把累积的统计批量UPDATE到query_data_task。
+    local模式下进程崩溃最多丢失一个刷新周期(或max_pending条)的统计，redis模式下统计保存在redis中，
+    只有取出后写库前崩溃才会丢失这一批。
+    """
+
+    def __init__(self, use: str = "local", redis_url: str | None = None,
+                 flush_interval: float = 10, max_pending: int = 200):
+        """
+        :param use: local/redis
+        :param redis_url: redis地址
+        :param flush_interval: 刷新周期(秒)
+        :param max_pending: local模式下累积的记录数达到该值时提前刷新
+        """
+        self.__use = use
+        self.__redis_url = redis_url
+        self.__flush_interval = flush_interval
+        self.__max_pending = max_pending
+        # (business_key, task_id) -> 累积的统计
+        self.__pending: dict[tuple[str, int], dict] = {}
+        self.__pending_records = 0
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__thread = None
+        self.__redis = None
+        self.__dao = None
+
+    def record(self, task_id: int, business_key: str, execute_time: str, duration_ms: int | None,
+               outcome: str | None):
+        """
+        记录一次任务执行
+        :param task_id: 任务id
+        :param business_key: 业务键
+        :param execute_time: 执行开始时间，格式为%Y-%m-%d %H:%M:%S
+        :param duration_ms: 执行耗时(毫秒)，为None时只累加次数，保留最近一次的耗时和结果(例如命中缓存)
+        :param outcome: 执行结果，与duration_ms同时为None
+        """
+        self.__ensure_started()
+        if self.__use == "redis":
+            key = f"{REDIS_STATS_KEY_PREFIX}{business_key}:{task_id}"
+            mapping = {"id": task_id, "business_key": business_key, "execute_time": execute_time}
+            if duration_ms is not None:
+                mapping.update(duration_ms=duration_ms, outcome=outcome)
+            pipeline = self.__get_redis().pipeline()
+            pipeline.hincrby(key, "count", 1)
+            pipeline.hset(key, mapping=mapping)
+            pipeline.sadd(REDIS_PENDING_KEY, key)
+            pipeline.execute()
+            return
+
+        with self.__lock:
+            self.__merge_locked({"id": task_id, "business_key": business_key, "count": 1,
+                                 "execute_time": execute_time, "duration_ms": duration_ms, "outcome": outcome})
+            self.__pending_records += 1
+            pending_records = self.__pending_records
+        metrics_util.set_gauge("task_stats_pending", pending_records)
+        if pending_records >= self.__max_pending:
+            self.__wakeup.set()
+
+    def flush(self) -> int:
+        """
+        把累积的统计批量写入数据库，写入失败时放回缓冲区等待下次刷新
+        :return: 写入的任务数
+        """
+        with self.__flush_lock:
+            rows = self.__drain()
+            if len(rows) == 0:
+                return 0
+            start = time.perf_counter()
+            try:
+                self.__get_dao().record_executions(rows)
+            except Exception as e:
+                metrics_util.inc_counter("task_stats_flush_failures_total")
+                logging.warning("批量写入任务执行统计失败，%s个任务等待下次刷新:%s", len(rows), e)
+                self.__restore(rows)
+                return 0
+            seconds = time.perf_counter() - start
+            metrics_util.observe("task_stats_flush_seconds", seconds)
+            metrics_util.inc_counter("task_stats_flushed_rows_total", value=len(rows))
+            logging.info("批量写入任务执行统计，任务数:%s, 耗时:%.3fs", len(rows), seconds)
+            return len(rows)
+
+    def __merge_locked(self, row: dict):
+        key = (row["business_key"], row["id"])
+        current = self.__pending.get(key)
+        if current is None:
+            self.__pending[key] = dict(row)
+            return
+        current["count"] += row["count"]
+        # 时间格式固定，可以直接按字符串比较先后
+        newer = row["execute_time"] >= current["execute_time"]
+        if newer:
+            current["execute_time"] = row["execute_time"]
+        if row["duration_ms"] is not None and (newer or current["duration_ms"] is None):
+            current.update(duration_ms=row["duration_ms"], outcome=row["outcome"])
+
+    def __drain(self) -> list[dict]:
+        if self.__use == "redis":
+            client = self.__get_redis()
+            rows = []
+            for key in client.smembers(REDIS_PENDING_KEY):
+                values = client.eval(_REDIS_DRAIN_SCRIPT, 2, key, REDIS_PENDING_KEY)
+                if not values:
+                    continue
+                raw = {values[i].decode(): values[i + 1].decode() for i in range(0, len(values), 2)}
+                rows.append({"id": int(raw["id"]), "business_key": raw["business_key"], "count": int(raw["count"]),
+                             "execute_time": raw["execute_time"],
+                             "duration_ms": int(raw["duration_ms"]) if "duration_ms" in raw else None,
+                             "outcome": raw.get("outcome")})
+            return rows
+
+        with self.__lock:
+            rows = list(self.__pending.values())
+            self.__pending = {}
+            self.__pending_records = 0
+        metrics_util.set_gauge("task_stats_pending", 0)
+        return rows
+
+    def __restore(self, rows: list[dict]):
+        if self.__use == "redis":
+            for row in rows:
+                key = f"{REDIS_STATS_KEY_PREFIX}{row['business_key']}:{row['id']}"
+                pipeline = self.__get_redis().pipeline()
+                pipeline.hincrby(key, "count", row["count"])
+                # 放回期间如果有新的执行，保留较新的一次
+                pipeline.hsetnx(key, "id", row["id"])
+                pipeline.hsetnx(key, "business_key", row["business_key"])
+                pipeline.hsetnx(key, "execute_time", row["execute_time"])
+                if row["duration_ms"] is not None:
+                    pipeline.hsetnx(key, "duration_ms", row["duration_ms"])
+                    pipeline.hsetnx(key, "outcome", row["outcome"])
+                pipeline.sadd(REDIS_PENDING_KEY, key)
+                pipeline.execute()
+            return
+
+        with self.__lock:
+            for row in rows:
+                self.__merge_locked(row)
+            self.__pending_records += len(rows)
+
+    def __ensure_started(self):
+        if self.__thread is not None:
+            return
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__run, name="task-stats-writer", daemon=True)
+            self.__thread.start()
+        # 进程正常退出时写入剩余的统计
+        atexit.register(self.flush)
+
+    def __run(self):
+        while True:
+            self.__wakeup.wait(self.__flush_interval)
+            self.__wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning("刷新任务执行统计异常:%s", e)
+
+    def __get_redis(self):
+        if self.__redis is None:
+            import redis
+            self.__redis = redis.Redis.from_url(self.__redis_url)
+        return self.__redis
+
+    def __get_dao(self):
+        if self.__dao is None:
+            import container
+            self.__dao = container.dao_container.query_data_task_dao()
+        return self.__dao
+
+
+execution_stats_writer = ExecutionStatsWriter(Config.TASK_STATS_USE, Config.REDIS_URL,
+                                              Config.TASK_STATS_FLUSH_INTERVAL, Config.TASK_STATS_FLUSH_MAX_PENDING)
+
+
+def get_execution_stats_writer() -> ExecutionStatsWriter:
+    return execution_stats_writer
@@ -0,0 +1,95 @@
+import re
+from dataclasses import dataclass
+
+from util.date_expression_util import resolve_date_expression
+
+# 推理输出中每个步骤的开头，例如 "步骤1:"、"1."、"2、"
+_STEP_PATTERN = re.compile(r"^\s*(?:[-*•]\s*)?(?:步骤\s*\d+|第[\d一二三四五六七八九十]+步|\d+\s*[.、:：)）])\s*[:：]?\s*")
+# 引用前面步骤结果的表述，出现时该步骤依赖前面的步骤，不能提前并行执行
+_DEPENDENCY_PATTERN = re.compile(r"上一步|上步|前一步|上述|前述|以上|前面|之前|步骤\s*\d+|第[\d一二三四五六七八九十]+步")
+_PARAMS_PATTERN = re.compile(r"关键参数\s*[\]】]?\s*[:：]?\s*")
+# 参数两端需要去掉的符号
+_PARAMS_STRIP = " \t:：,，。;；[]【】()（）\"'“”"
+_EXECUTE_TASK = "执行任务"
+# 表示没有查询条件的参数
+_EMPTY_PARAMS = {"无", "无参数", "不需要", "不需要参数", "默认", "-"}
+
+
+@dataclass(frozen=True)
+class TaskStep:
+    # 步骤在推理结果中的序号，从0开始
+    index: int
+    task_name: str
+    params: str
+    # 是否引用了前面步骤的结果
+    depends_on_previous: bool
+
+
+def parse_task_steps(reasoning: str | None, task_names: list[str]) -> list[TaskStep]:
+    """
+    从推理节点输出的线性步骤中解析出"执行任务"的步骤
+    :param reasoning: 推理结果，每个步骤的格式为 [操作指令] [数据源] [关键参数]
+    :param task_names: 所有任务名称，步骤中必须出现其中一个任务名称才会被解析
+    :return: 按步骤顺序排列的执行任务步骤
+    """
+    if not reasoning:
+        return []
+    # 较长的任务名称优先匹配，避免"效率日报"命中"效率日报明细"
+    names = sorted(set(task_names), key=len, reverse=True)
+    task_steps = []
+    for index, step in enumerate(_split_steps(reasoning)):
+        if _EXECUTE_TASK not in step:
+            continue
+        task_name = next((name for name in names if name in step), None)
+        if task_name is None:
+            continue
+        task_steps.append(TaskStep(index=index, task_name=task_name, params=_params(step, task_name),
+                                   depends_on_previous=_DEPENDENCY_PATTERN.search(step) is not None))
+    return task_steps
+
+
+def independent_task_steps(task_steps: list[TaskStep]) -> list[TaskStep]:
+    """
+    可以一起提前执行的步骤：不引用前面步骤的结果，参数为空或只有日期，且同一任务同一参数只执行一次。
+    推理结果中的依赖不一定有明确的表述(例如"效率最低的员工编号")，参数中有日期以外的条件时都交给llm按顺序调用
+    """
+    seen = set()
+    result = []
+    for step in task_steps:
+        if step.depends_on_previous or not _self_contained(step.params) or (step.task_name, step.params) in seen:
+            continue
+        seen.add((step.task_name, step.params))
+        result.append(step)
+    return result
+
+
+def _self_contained(params: str) -> bool:
+    """
+    参数不可能来自其他步骤的结果：没有参数，或者只有能直接解析的日期
+    """
+    if params == "":
+        return True
+    resolved = resolve_date_expression(params)
+    return resolved is not None and not resolved.has_other_conditions()
+
+
+def _split_steps(reasoning: str) -> list[str]:
+    steps = []
+    for line in reasoning.splitlines():
+        match = _STEP_PATTERN.match(line)
+        if match is not None:
+            steps.append(line[match.end():].strip())
+        elif len(steps) > 0 and line.strip() != "":
+            # 步骤的续行
+            steps[-1] += " " + line.strip()
+    return steps
+
+
+def _params(step: str, task_name: str) -> str:
+    match = _PARAMS_PATTERN.search(step)
+    params = step[match.end():] if match is not None else step
+    # 任务名称之后的内容作为参数
+    if task_name in params:
+        params = params[params.index(task_name) + len(task_name):]
+    params = params.strip(_PARAMS_STRIP)
+    return "" if params in _EMPTY_PARAMS else params
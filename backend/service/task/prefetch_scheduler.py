@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+from service.llm.llm_gateway import LLMPriority, llm_priority
+from service.task.execution_stats import TASK_OUTCOME_SUCCESS
+from service.task.task_ranking import get_task_ranking
+from util import metrics_util
+
+# redis模式下每个预取时间点的锁，只有抢到锁的worker执行预取
+REDIS_PREFETCH_LOCK_PREFIX = "wagner:task_prefetch:"
+# 预取锁的过期时间(秒)，覆盖一次预取的耗时，避免同一时间点被其他worker重复执行
+PREFETCH_LOCK_SECONDS = 3600
+
+
+class PrefetchScheduler:
+    """
+    进程内的预取调度：每天在配置的时间按任务默认的查询条件(没有日期时为前一天)执行热门任务，
+    成功的结果写入任务结果缓存，用户查询时直接返回。查询日期包含今天的任务数据还会变化，不预取也不缓存。
+    redis模式下每个worker都启动调度，但每个时间点只有抢到redis锁的worker执行，结果写入共享的缓存；
+    local模式下结果只在本进程内有效，适合单worker部署
+    """
+
+    def __init__(self, times: list[str], tasks: dict[str, list[str] | None], max_concurrency: int = 2,
+                 use: str = "local", redis_url: str | None = None):
+        """
+        :param times: 每天预取的时间，格式为HH:MM
+        :param tasks: 业务键 -> 任务名称列表，为None时自动选取最常执行/最近执行的任务
+        :param max_concurrency: 同时执行的任务数
+        :param use: local/redis，与任务结果缓存一致
+        :param redis_url: redis地址
+        """
+        self.__times = sorted(datetime.strptime(t, "%H:%M").time() for t in times)
+        self.__tasks = tasks
+        self.__max_concurrency = max_concurrency
+        self.__use = use
+        self.__redis_url = redis_url
+        self.__redis = None
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def start(self):
+        """
+        启动后台调度线程，没有配置预取时间或业务键时不启动
+        """
+        if len(self.__times) == 0 or len(self.__tasks) == 0:
+            return
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__run, name="task-prefetch", daemon=True)
+            self.__thread.start()
+        logging.info("任务预取已启动，预取时间:%s", [t.strftime("%H:%M") for t in self.__times])
+
+    async def prefetch(self) -> dict[str, int]:
+        """
+        立即预取一次所有配置的业务键
+        :return: 业务键 -> 成功写入缓存的任务数
+        """
+        result = {}
+        for business_key, task_names in self.__tasks.items():
+            try:
+                result[business_key] = await self.__prefetch_business(business_key, task_names)
+            except Exception:
+                logging.exception("预取任务失败，business_key:%s", business_key)
+                result[business_key] = 0
+        return result
+
+    async def __prefetch_business(self, business_key: str, task_names: list[str] | None) -> int:
+        from service.agent.data_clerk_service import get_or_create_data_clerk_service
+        if task_names is None:
+            task_names = sorted(get_task_ranking().get_frequently_and_usually_execute_tasks(business_key))
+        if len(task_names) == 0:
+            return 0
+        data_clerk_service = get_or_create_data_clerk_service(business_key)
+        semaphore = asyncio.Semaphore(self.__max_concurrency)
+
+        async def run(task_name: str) -> bool:
+            async with semaphore:
+                # 不带查询条件，按任务默认的日期执行，日期包含今天时跳过
+                result = await data_clerk_service.execute_task_directly(None, task_name=task_name, ephemeral=True,
+                                                                        prefetch=True)
+            metrics_util.inc_counter("task_prefetch_total", {"business_key": business_key, "outcome": result.outcome})
+            return result.outcome == TASK_OUTCOME_SUCCESS
+
+        start = time.perf_counter()
+        # 预取不应挤占用户直接发起的提问
+        with llm_priority(LLMPriority.BACKGROUND):
+            results = await asyncio.gather(*(run(task_name) for task_name in task_names))
+        seconds = time.perf_counter() - start
+        metrics_util.observe("task_prefetch_seconds", seconds, {"business_key": business_key})
+        logging.info("预取任务完成，business_key:%s, 任务:%s, 成功:%s, 耗时:%.3fs",
+                     business_key, task_names, sum(results), seconds)
+        return sum(results)
+
+    def __run(self):
+        while True:
+            run_at = self.__next_run_at(datetime.now())
+            time.sleep(max(0.0, (run_at - datetime.now()).total_seconds()))
+            try:
+                if not self.__claim(run_at):
+                    metrics_util.inc_counter("task_prefetch_skipped_total", {"reason": "claimed"})
+                    logging.info("预取时间点%s已由其他worker执行", run_at)
+                    continue
+                asyncio.run(self.prefetch())
+            except Exception as e:
+                logging.warning("任务预取异常:%s", e)
+
+    def __claim(self, run_at: datetime) -> bool:
+        """
+        抢占预取时间点，local模式下总是由本进程执行
+        """
+        if self.__use != "redis":
+            return True
+        if self.__redis is None:
+            import redis
+            self.__redis = redis.Redis.from_url(self.__redis_url)
+        key = f"{REDIS_PREFETCH_LOCK_PREFIX}{run_at.strftime('%Y-%m-%d %H:%M')}"
+        return bool(self.__redis.set(key, f"{socket.gethostname()}:{os.getpid()}", nx=True, ex=PREFETCH_LOCK_SECONDS))
+
+    def __next_run_at(self, now: datetime) -> datetime:
+        for t in self.__times:
+            run_at = datetime.combine(now.date(), t)
+            if run_at > now:
+                return run_at
+        return datetime.combine(now.date() + timedelta(days=1), self.__times[0])
+
+
+prefetch_scheduler = PrefetchScheduler(Config.TASK_PREFETCH_TIMES, Config.TASK_PREFETCH_TASKS,
+                                       Config.TASK_PREFETCH_MAX_CONCURRENCY, Config.TASK_RESULT_CACHE_USE,
+                                       Config.REDIS_URL)
+
+
+def get_prefetch_scheduler() -> PrefetchScheduler:
+    return prefetch_scheduler
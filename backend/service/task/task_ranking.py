@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from config import Config
+from util import metrics_util
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@dataclass
+class _TaskRank:
+    id: int
+    name: str
+    # 累计执行次数(数据库中的invoke_times加上本进程尚未写库的执行)
+    total: int = 0
+    # 最近一次执行时间(时间戳)
+    last_executed_at: float | None = None
+    # 本进程观察到的时间窗口内的执行时间，用于统计窗口内的执行次数
+    executions: deque = field(default_factory=deque)
+
+
+class _Ranking:
+    def __init__(self, tasks: dict[int, _TaskRank]):
+        self.tasks = tasks
+        self.loaded_at = time.time()
+
+
+class TaskRanking:
+    """
+    按business_key维护最常执行/最近执行的任务排行：首次访问时从数据库加载一次，
+    之后由任务执行事件增量更新，定期从数据库重新加载以合并其他worker的执行
+    """
+
+    def __init__(self, frequent_n: int = 3, recent_n: int = 3, frequent_window_days: float | None = None,
+                 recent_window_days: float | None = None, reload_seconds: float = 300):
+        """
+        :param frequent_n: 最常执行的任务数
+        :param recent_n: 最近执行的任务数
+        :param frequent_window_days: 统计执行次数的时间窗口(天)，为空时按累计次数排序
+        :param recent_window_days: 最近执行的时间窗口(天)，超出窗口的任务不算最近执行，为空时不限制
+        :param reload_seconds: 从数据库重新加载的周期(秒)
+        """
+        self.__frequent_n = frequent_n
+        self.__recent_n = recent_n
+        self.__frequent_window = None if frequent_window_days is None else frequent_window_days * 86400
+        self.__recent_window = None if recent_window_days is None else recent_window_days * 86400
+        self.__reload_seconds = reload_seconds
+        self.__rankings: dict[str, _Ranking] = {}
+        self.__lock = threading.Lock()
+        self.__dao = None
+
+    def get_frequently_and_usually_execute_tasks(self, business_key: str) -> set[str]:
+        """
+        获取最近执行/最常执行的任务名称，两者去重
+        :param business_key: 业务键
+        :return: 任务名称
+        """
+        ranking = self.__get_ranking(business_key)
+        now = time.time()
+        with self.__lock:
+            tasks = list(ranking.tasks.values())
+            recent = [t for t in tasks if t.last_executed_at is not None
+                      and (self.__recent_window is None or now - t.last_executed_at <= self.__recent_window)]
+            recent.sort(key=lambda t: t.last_executed_at, reverse=True)
+            recent_ids = {t.id for t in recent[:self.__recent_n]}
+            frequent = [t for t in tasks if t.id not in recent_ids]
+            frequent.sort(key=lambda t: (self.__window_count(t, now), t.total), reverse=True)
+
+        names = {t.name for t in recent[:self.__recent_n]}
+        names.update(t.name for t in frequent[:self.__frequent_n])
+        return names
+
+    def on_execution(self, business_key: str, task_id: int, task_name: str, executed_at: float):
+        """
+        任务执行事件，增量更新排行
+        :param business_key: 业务键
+        :param task_id: 任务id
+        :param task_name: 任务名称
+        :param executed_at: 执行时间(时间戳)
+        """
+        with self.__lock:
+            ranking = self.__rankings.get(business_key)
+            if ranking is None:
+                # 还没有加载过，首次访问时会从数据库加载
+                return
+            task = ranking.tasks.get(task_id)
+            if task is None:
+                task = ranking.tasks[task_id] = _TaskRank(id=task_id, name=task_name)
+            task.total += 1
+            task.last_executed_at = max(task.last_executed_at or executed_at, executed_at)
+            if self.__frequent_window is not None:
+                task.executions.append(executed_at)
+                self.__trim(task, executed_at)
+
+    def invalidate(self, business_key: str):
+        """
+        任务新增/修改/删除后失效，下次访问时重新加载，本进程观察到的执行仍然保留
+        """
+        with self.__lock:
+            ranking = self.__rankings.get(business_key)
+            if ranking is not None:
+                ranking.loaded_at = 0
+
+    def __get_ranking(self, business_key: str) -> _Ranking:
+        with self.__lock:
+            ranking = self.__rankings.get(business_key)
+        if ranking is not None and time.time() - ranking.loaded_at < self.__reload_seconds:
+            metrics_util.inc_counter("task_ranking_total", {"result": "hit"})
+            return ranking
+
+        metrics_util.inc_counter("task_ranking_total", {"result": "load"})
+        start = time.perf_counter()
+        tasks = {}
+        for entity in self.__get_dao().get_all_tasks(business_key):
+            tasks[entity.id] = _TaskRank(id=entity.id, name=entity.name, total=entity.invoke_times or 0,
+                                         last_executed_at=_parse_time(entity.execute_time))
+        with self.__lock:
+            previous = self.__rankings.get(business_key)
+            if previous is not None:
+                # 保留本进程观察到的执行，尚未写库的执行次数/时间不能因为重新加载而丢失
+                for task in tasks.values():
+                    old = previous.tasks.get(task.id)
+                    if old is None:
+                        continue
+                    task.total = max(task.total, old.total)
+                    if old.last_executed_at is not None:
+                        task.last_executed_at = max(task.last_executed_at or 0, old.last_executed_at)
+                    task.executions = old.executions
+            ranking = _Ranking(tasks)
+            self.__rankings[business_key] = ranking
+        metrics_util.observe("task_ranking_load_seconds", time.perf_counter() - start)
+        logging.info("加载任务排行，business_key:%s, 任务数:%s", business_key, len(tasks))
+        return ranking
+
+    def __window_count(self, task: _TaskRank, now: float) -> int:
+        if self.__frequent_window is None:
+            return task.total
+        self.__trim(task, now)
+        return len(task.executions)
+
+    def __trim(self, task: _TaskRank, now: float):
+        # 只保留统计窗口内的执行时间
+        while len(task.executions) > 0 and now - task.executions[0] > self.__frequent_window:
+            task.executions.popleft()
+
+    def __get_dao(self):
+        if self.__dao is None:
+            import container
+            self.__dao = container.dao_container.query_data_task_dao()
+        return self.__dao
+
+
+def _parse_time(value) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.strptime(str(value), DATETIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+task_ranking = TaskRanking(Config.TASK_RANKING_FREQUENT_N, Config.TASK_RANKING_RECENT_N,
+                           Config.TASK_RANKING_FREQUENT_WINDOW_DAYS, Config.TASK_RANKING_RECENT_WINDOW_DAYS,
+                           Config.TASK_RANKING_RELOAD_SECONDS)
+
+
+def get_task_ranking() -> TaskRanking:
+    return task_ranking
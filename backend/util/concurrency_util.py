@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import itertools
+import threading
+
+
+class _Waiter:
+    def __init__(self, priority: int, loop: asyncio.AbstractEventLoop | None = None):
+        self.priority = priority
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(_set_future_done, self.future)
+        else:
+            self.event.set()
+
+
+def _set_future_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class PrioritySemaphore:
+    """
+    可同时在协程和线程中使用的优先级信号量
+    Quart的同步路由运行在线程池里，部分调用(asyncio.run)还会新建事件循环，asyncio.Semaphore无法跨线程/事件循环使用，
+    所以这里用线程锁保护状态，按(优先级, 先来后到)唤醒等待者。priority越小越优先。
+    """
+
+    def __init__(self, permits: int):
+        self._permits = permits
+        self._lock = threading.Lock()
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._waiting_by_priority: dict[int, int] = {}
+
+    @property
+    def waiting(self) -> int:
+        """
+        当前排队等待的数量
+        """
+        with self._lock:
+            return sum(self._waiting_by_priority.values())
+
+    def waiting_of(self, priority: int) -> int:
+        with self._lock:
+            return self._waiting_by_priority.get(priority, 0)
+
+    def _enqueue_locked(self, waiter: _Waiter):
+        heapq.heappush(self._waiters, (waiter.priority, next(self._seq), waiter))
+        self._waiting_by_priority[waiter.priority] = self._waiting_by_priority.get(waiter.priority, 0) + 1
+
+    def _dequeue_locked(self, waiter: _Waiter):
+        self._waiting_by_priority[waiter.priority] -= 1
+
+    async def acquire(self, priority: int = 0, timeout: float | None = None) -> bool:
+        """
+        协程中获取许可
+        :param priority: 优先级，越小越优先
+        :param timeout: 最长等待时间(秒)，None表示一直等待
+        :return: 是否获取成功（超时返回False）
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._permits > 0:
+                self._permits -= 1
+                return True
+            waiter = _Waiter(priority, loop)
+            self._enqueue_locked(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    waiter.cancelled = True
+                    self._dequeue_locked(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                if granted:
+                    self.release()
+                raise
+            return granted
+
+    def acquire_sync(self, priority: int = 0, timeout: float | None = None) -> bool:
+        """
+        同步(线程)中获取许可
+        :param priority: 优先级，越小越优先
+        :param timeout: 最长等待时间(秒)，None表示一直等待
+        :return: 是否获取成功（超时返回False）
+        """
+        with self._lock:
+            if self._permits > 0:
+                self._permits -= 1
+                return True
+            waiter = _Waiter(priority)
+            self._enqueue_locked(waiter)
+
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._dequeue_locked(waiter)
+            return False
+
+    def release(self):
+        """
+        归还许可，优先唤醒优先级最高、等待最久的等待者
+        """
+        with self._lock:
+            while len(self._waiters) > 0:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._dequeue_locked(waiter)
+                waiter.wake()
+                return
+            self._permits += 1
@@ -0,0 +1,242 @@
+import calendar
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+# 只包含这些字的剩余文本视为没有其他查询条件
+FILLER_CHARS = set("从查询看下一的数据日期时间为是按照请帮我，,。.：: 　")
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUM = r"(\d+|[零一二两三四五六七八九十百]+)"
+_RANGE_SEPARATORS = {"到", "至", "~", "～", "-", "—", "–"}
+
+_ABSOLUTE_PATTERNS = [
+    re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})[日号]?"),
+    re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})"),
+    re.compile(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)"),
+    re.compile(r"(?<![\d年])()(\d{1,2})月(\d{1,2})[日号]"),
+]
+_MONTH_PATTERN = re.compile(r"(\d{4})年(\d{1,2})月份?")
+_RECENT_PATTERN = re.compile(r"(?:最近|近|过去|前)" + _NUM + r"(个)?(天|日|周|星期|月)")
+_DAYS_AGO_PATTERN = re.compile(_NUM + r"天(?:前|之前|以前)")
+# 日期表达之后紧跟这些内容时(上周三、上周末、今天12点)，说明只匹配到了日期表达的一部分
+_PARTIAL_SUFFIX_PATTERN = re.compile(r"^\s*(?:[\d一二两三四五六七八九十日天末]|第)")
+# 去掉日期表达后剩下的内容里还有日期相关的说法(今年第一季度、上个月和昨天)，解析出的范围与原意不符
+_LEFTOVER_DATE_PATTERN = re.compile(r"季度|上半年|下半年|星期|礼拜|周[一二三四五六日天末]|月初|月中|月底|月末|年初|年底|年末|"
+                                    r"工作日|节假日|[昨今明前后]天|[上下本这]个?[周月]|[去今明]年|\d+[日号月年]|"
+                                    r"[一二两三四五六七八九十]+[日号]")
+_RELATIVE_DAYS = [("大前天", -3), ("前天", -2), ("昨天", -1), ("昨日", -1), ("今天", 0), ("今日", 0)]
+
+
+@dataclass(frozen=True)
+class DateRange:
+    # 开始日期(包含)
+    start: date
+    # 结束日期(包含)
+    end: date
+    # 原文中的日期表达
+    expression: str
+    # 去掉日期表达后剩下的条件
+    rest: str = ""
+
+    def is_single_day(self) -> bool:
+        return self.start == self.end
+
+    def has_other_conditions(self) -> bool:
+        """
+        除了日期之外是否还有其他查询条件
+        """
+        return any(c not in FILLER_CHARS for c in self.rest)
+
+    def key(self) -> str:
+        """
+        稳定的缓存键，同一日期范围的不同说法得到同一个键
+        """
+        return f"{self.start.isoformat()}~{self.end.isoformat()}"
+
+    def describe(self) -> str:
+        if self.is_single_day():
+            return f"查询日期为{self.start.isoformat()}"
+        return f"查询日期范围为{self.start.isoformat()}至{self.end.isoformat()}(包含首尾两天)"
+
+
+def resolve_date_expression(text: str | None, today: date | None = None) -> DateRange | None:
+    """
+    把中文日期表达(昨天、2025年12月10日、上个月、最近7天等)解析成具体的日期范围，不调用llm
+    "最近N天"不包含今天，与默认查询前一天的口径一致；没有年份的日期取最近的过去日期
+    :param text: 查询条件
+    :param today: 当天，默认取系统日期
+    :return: 日期范围，没有日期表达或只能解析一部分(例如上周三、今年第一季度)时返回None，交给llm理解
+    """
+    if not text:
+        return None
+    today = today or date.today()
+    for resolver in (_resolve_absolute, _resolve_month, _resolve_recent, _resolve_days_ago, _resolve_relative_day,
+                     _resolve_relative_period):
+        resolved = resolver(text, today)
+        if resolved is not None:
+            start, end, span = resolved
+            if start > end:
+                start, end = end, start
+            rest = (text[:span[0]] + text[span[1]:]).strip()
+            if _PARTIAL_SUFFIX_PATTERN.match(text[span[1]:]) or _LEFTOVER_DATE_PATTERN.search(rest):
+                return None
+            return DateRange(start, end, text[span[0]:span[1]], rest)
+    return None
+
+
+def has_date_wording(text: str | None) -> bool:
+    """
+    是否包含日期相关的说法，用于区分"没有日期条件"和"有日期条件但无法完全解析"
+    """
+    return bool(text) and _LEFTOVER_DATE_PATTERN.search(text) is not None
+
+
+def default_date_range(today: date | None = None) -> DateRange:
+    """
+    没有日期条件时默认查询前一天
+    """
+    yesterday = (today or date.today()) - timedelta(days=1)
+    return DateRange(yesterday, yesterday, "")
+
+
+def _resolve_absolute(text: str, today: date):
+    # (开始位置, 结束位置, 年份(没有写年份时为None), 月, 日)
+    matches = []
+    for pattern in _ABSOLUTE_PATTERNS:
+        for m in pattern.finditer(text):
+            if any(m.start() < e and s < m.end() for s, e, *_ in matches):
+                continue
+            year = int(m.group(1)) if m.group(1) else None
+            if _to_date(year or 2000, int(m.group(2)), int(m.group(3))) is not None:
+                matches.append((m.start(), m.end(), year, int(m.group(2)), int(m.group(3))))
+    if len(matches) == 0:
+        return None
+    matches.sort(key=lambda item: item[0])
+    first = matches[0]
+    first_day = _to_date(first[2], first[3], first[4]) if first[2] is not None else _past_date(first[3], first[4], today)
+    if first_day is None:
+        return None
+    if len(matches) > 1:
+        second = matches[1]
+        if text[first[1]:second[0]].strip() in _RANGE_SEPARATORS:
+            if second[2] is not None:
+                second_day = _to_date(second[2], second[3], second[4])
+            else:
+                # 范围的结束日期没有写年份时沿用开始日期的年份，早于开始日期说明跨年
+                second_day = _to_date(first_day.year, second[3], second[4])
+                if second_day is not None and second_day < first_day:
+                    second_day = _to_date(first_day.year + 1, second[3], second[4])
+            if second_day is not None:
+                return first_day, second_day, (first[0], second[1])
+    return first_day, first_day, (first[0], first[1])
+
+
+def _resolve_month(text: str, today: date):
+    m = _MONTH_PATTERN.search(text)
+    if m is None:
+        return None
+    year, month = int(m.group(1)), int(m.group(2))
+    if not 1 <= month <= 12:
+        return None
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1]), m.span()
+
+
+def _resolve_recent(text: str, today: date):
+    m = _RECENT_PATTERN.search(text)
+    if m is None:
+        return None
+    n = _parse_number(m.group(1))
+    if n is None or n <= 0:
+        return None
+    unit = m.group(3)
+    end = today - timedelta(days=1)
+    if unit in ("天", "日"):
+        start = today - timedelta(days=n)
+    elif unit in ("周", "星期"):
+        start = today - timedelta(days=7 * n)
+    else:
+        start = _add_months(today, -n)
+    return start, end, m.span()
+
+
+def _resolve_days_ago(text: str, today: date):
+    m = _DAYS_AGO_PATTERN.search(text)
+    if m is None:
+        return None
+    n = _parse_number(m.group(1))
+    if n is None:
+        return None
+    day = today - timedelta(days=n)
+    return day, day, m.span()
+
+
+def _resolve_relative_day(text: str, today: date):
+    for word, offset in _RELATIVE_DAYS:
+        index = text.find(word)
+        if index >= 0:
+            day = today + timedelta(days=offset)
+            return day, day, (index, index + len(word))
+    return None
+
+
+def _resolve_relative_period(text: str, today: date):
+    monday = today - timedelta(days=today.weekday())
+    first_of_month = today.replace(day=1)
+    last_month_end = first_of_month - timedelta(days=1)
+    periods = [
+        (("上上周", "上上个星期"), monday - timedelta(days=14), monday - timedelta(days=8)),
+        (("上周", "上个星期", "上星期", "上个礼拜"), monday - timedelta(days=7), monday - timedelta(days=1)),
+        (("本周", "这周", "这个星期", "本星期"), monday, today),
+        (("上个月", "上月"), last_month_end.replace(day=1), last_month_end),
+        (("本月", "这个月", "当月"), first_of_month, today),
+        (("去年",), date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)),
+        (("今年", "本年"), date(today.year, 1, 1), today),
+    ]
+    for words, start, end in periods:
+        for word in words:
+            index = text.find(word)
+            if index >= 0:
+                return start, end, (index, index + len(word))
+    return None
+
+
+def _parse_number(text: str) -> int | None:
+    if text.isdigit():
+        return int(text)
+    if "百" in text:
+        hundreds, _, rest = text.partition("百")
+        base = _CN_DIGITS.get(hundreds, 1 if hundreds == "" else None)
+        tail = _parse_number(rest) if rest else 0
+        return None if base is None or tail is None else base * 100 + tail
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        tens_value = 1 if tens == "" else _CN_DIGITS.get(tens)
+        ones_value = 0 if ones == "" else _CN_DIGITS.get(ones)
+        return None if tens_value is None or ones_value is None else tens_value * 10 + ones_value
+    if len(text) == 1:
+        return _CN_DIGITS.get(text)
+    return None
+
+
+def _past_date(month: int, day: int, today: date) -> date | None:
+    # 没有写年份的日期取不晚于今天的最近一次，例如1月5日查询12月30日是去年的12月30日
+    for year in (today.year, today.year - 1):
+        result = _to_date(year, month, day)
+        if result is not None and result <= today:
+            return result
+    return None
+
+
+def _to_date(year: int, month: int, day: int) -> date | None:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
@@ -0,0 +1,134 @@
+import threading
+from collections import deque
+
+# 进程内指标注册表，按 名称+标签 聚合，通过 /admin/metrics 查看
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_gauges: dict[tuple, float] = {}
+_histograms: dict[tuple, "_Histogram"] = {}
+
+# 直方图保留最近的样本数量，用来计算分位数
+HISTOGRAM_RESERVOIR_SIZE = 1024
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.samples = deque(maxlen=HISTOGRAM_RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self.samples) == 0:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count > 0 else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+def _key(name: str, labels: dict | None) -> tuple:
+    if not labels:
+        return name, ()
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc_counter(name: str, labels: dict | None = None, value: float = 1):
+    """
+    计数器累加
+    :param name: 指标名
+    :param labels: 标签
+    :param value: 增量
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, labels: dict | None = None):
+    """
+    设置瞬时值
+    :param name: 指标名
+    :param value: 当前值
+    :param labels: 标签
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def add_gauge(name: str, delta: float, labels: dict | None = None):
+    """
+    瞬时值增减（例如进行中的请求数）
+    :param name: 指标名
+    :param delta: 变化量
+    :param labels: 标签
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def get_gauge(name: str, labels: dict | None = None) -> float:
+    with _lock:
+        return _gauges.get(_key(name, labels), 0)
+
+
+def observe(name: str, value: float, labels: dict | None = None):
+    """
+    记录一次观测值（耗时、字节数等）
+    :param name: 指标名
+    :param value: 观测值
+    :param labels: 标签
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _Histogram()
+            _histograms[key] = histogram
+        histogram.observe(value)
+
+
+def get_histogram(name: str, labels: dict | None = None) -> dict | None:
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        return None if histogram is None else histogram.to_dict()
+
+
+def _format_key(key: tuple) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def snapshot() -> dict:
+    """
+    导出当前所有指标
+    :return: {counters, gauges, histograms}
+    """
+    with _lock:
+        return {
+            "counters": {_format_key(k): v for k, v in _counters.items()},
+            "gauges": {_format_key(k): v for k, v in _gauges.items()},
+            "histograms": {_format_key(k): h.to_dict() for k, h in _histograms.items()},
+        }
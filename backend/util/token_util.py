@@ -0,0 +1,101 @@
+import logging
+import threading
+
+import tiktoken
+
+# 估算token用的编码（deepseek没有公开的tiktoken编码，cl100k_base与其分词规模接近）
+TOKEN_ENCODING_NAME = "cl100k_base"
+# 每条消息除内容以外的固定开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING_NAME)
+                except Exception as e:
+                    # 离线环境下无法下载编码文件，退化为按字符估算
+                    logging.warning("加载tiktoken编码失败，使用字符数估算token:%s", e)
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    ascii_count = sum(1 for c in text if ord(c) < 128)
+    # 英文约4个字符一个token，中文约1个字一个token
+    return (ascii_count + 3) // 4 + (len(text) - ascii_count)
+
+
+def count_tokens(text: str | None) -> int:
+    """
+    计算文本的token数
+    :param text: 文本
+    :return: token数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_text(message) -> str:
+    """
+    获取消息中参与计费的文本（内容+工具调用参数）
+    :param message: BaseMessage 或 (role, content) 元组
+    :return: 文本
+    """
+    if isinstance(message, tuple):
+        return str(message[1])
+    content = message.content
+    if isinstance(content, list):
+        text = "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+    else:
+        text = str(content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += "".join(f"{c['name']}{c['args']}" for c in tool_calls)
+    return text
+
+
+def count_message_tokens(messages) -> int:
+    """
+    计算消息列表的token数
+    :param messages: 消息列表
+    :return: token数
+    """
+    return sum(count_tokens(message_text(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    把文本截断到不超过指定token数
+    :param text: 文本
+    :param max_tokens: token上限
+    :return: 截断后的文本
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    # 按字符估算时二分查找最长的前缀
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
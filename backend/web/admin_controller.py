@@ -10,7 +10,7 @@ from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
-from quart import Quart, request, stream_with_context, Response, Blueprint
+from quart import Quart, request, stream_with_context, Response, Blueprint, jsonify
 
 import container
 
@@ -19,6 +19,10 @@ from dao import query_data_task_dao
 from model.query_data_task_detail import QueryDataTaskDetail
 from model.response import success
 from service.agent.model.state import DataClerkState, InputState
+from service.cache.task_result_cache import get_task_result_cache
+from service.runtime.session_run_queue import get_session_run_queue
+from service.task.prefetch_scheduler import get_prefetch_scheduler
+from util import metrics_util
 from util.config_util import read_private_config
 from web.data_clerk_controller import get_or_create_data_clerk_service
 from web.vo.result_vo import ResultVo
@@ -49,13 +53,41 @@ admin_api = Blueprint('admin', __name__)
 #     return jsonify(success(result).to_dict())
 
 
+@admin_api.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    查看进程内的运行指标
+    """
+    result = ResultVo(success=True, result=metrics_util.snapshot())
+    return jsonify(success(result).to_dict())
 
 
+@admin_api.route('/sessionRunStats', methods=['GET'])
+def session_run_stats():
+    """
+    查看会话串行执行队列的排队情况，可按sessionId过滤
+    """
+    session_id = request.args.get('sessionId')
 
+    stats = get_session_run_queue().get_session_stats(session_id)
 
+    result = ResultVo(success=True, result=stats)
+    return jsonify(success(result).to_dict())
 
 
+@admin_api.route('/taskResultCacheUsage', methods=['GET'])
+def task_result_cache_usage():
+    """
+    查看任务结果缓存的使用情况：预取的结果有多少被用户实际使用
+    """
+    result = ResultVo(success=True, result=get_task_result_cache().usage())
+    return jsonify(success(result).to_dict())
 
 
-
-
+@admin_api.route('/prefetchTasks', methods=['POST'])
+async def prefetch_tasks():
+    """
+    立即预取一次配置的热门任务
+    """
+    result = ResultVo(success=True, result=await get_prefetch_scheduler().prefetch())
+    return jsonify(success(result).to_dict())
@@ -3,6 +3,7 @@ from quart import Blueprint, request, jsonify, Response, g
 
 from model.response import success
 from service.agent.assistant_service import get_or_create_assistant_service
+from web.guard.admission_guard import admitted_event_stream
 from web.validate.validator import validate_query_params, validate_json_params
 from web.vo.answer_vo import AnswerVo
 from web.vo.result_vo import ResultVo
@@ -38,11 +39,9 @@ async def ask_assistant():
     business_key = g.validated_data['businessKey']
     use_thinking = g.validated_data.get('useThinking', True)
 
-    assistant_service = get_or_create_assistant_service(business_key)
-
-    event_stream = assistant_service.get_event_stream_function(question, session_id, use_thinking)
-
-    return Response(event_stream(), mimetype='text/event-stream')
+    return admitted_event_stream(
+        "askAssistant",
+        lambda: get_or_create_assistant_service(business_key).get_event_stream_function(question, session_id, use_thinking))
 
 @assistant_api.route('/addProceduralMemory', methods=['POST'])
 @validate_json_params(
@@ -3,9 +3,13 @@ import asyncio
 from marshmallow import fields
 from quart import Blueprint, jsonify, Response, g
 
-from model.response import success
+from model.response import success, failure_with_msg
 from service.agent.data_clerk_service import create_service, get_service, DataClerkService, \
     get_or_create_data_clerk_service
+from service.runtime.admission_controller import get_admission_controller
+from service.task.batch_execution import get_batch_execution_manager
+from service.task.task_ranking import get_task_ranking
+from web.guard.admission_guard import admitted_event_stream, overloaded_json
 from web.validate.validator import validate_query_params, validate_json_params
 from web.vo.answer_vo import AnswerVo
 from web.vo.result_vo import ResultVo
@@ -40,13 +44,96 @@ def handle_question():
     session_id = g.validated_data['sessionId']
     question = g.validated_data['question']
 
-    data_clerk_service = get_or_create_data_clerk_service(business_key)
+    decision = get_admission_controller().try_admit("question")
+    if not decision.admitted:
+        return overloaded_json(decision)
+
+    try:
+        data_clerk_service = get_or_create_data_clerk_service(business_key)
 
-    content = asyncio.run(data_clerk_service.question(question, session_id))
+        content = asyncio.run(data_clerk_service.question(question, session_id))
+    finally:
+        decision.ticket.release()
     answer = AnswerVo(content=content)
 
     return jsonify(success(answer).to_dict())
 
+@data_clerk_api.route('/executeTask', methods=['POST'])
+@validate_json_params(
+    businessKey=fields.Str(required=True),
+    sessionId=fields.Str(required=False),
+    taskId=fields.Int(required=False),
+    taskName=fields.Str(required=False),
+    params=fields.Str(required=False),
+    ephemeral=fields.Bool(required=False)
+)
+async def execute_task():
+    business_key = g.validated_data['businessKey']
+    session_id = g.validated_data.get('sessionId')
+    task_id = g.validated_data.get('taskId')
+    task_name = g.validated_data.get('taskName')
+    params = g.validated_data.get('params')
+    ephemeral = g.validated_data.get('ephemeral', False)
+    if task_id is None and task_name is None:
+        return jsonify(failure_with_msg("taskId和taskName不能同时为空").to_dict())
+    if session_id is None and not ephemeral:
+        return jsonify(failure_with_msg("非临时运行时sessionId不能为空").to_dict())
+
+    decision = get_admission_controller().try_admit("executeTask")
+    if not decision.admitted:
+        return overloaded_json(decision)
+
+    try:
+        data_clerk_service = get_or_create_data_clerk_service(business_key)
+        result = await data_clerk_service.execute_task_directly(session_id, task_id=task_id, task_name=task_name,
+                                                                params=params, ephemeral=ephemeral)
+    finally:
+        decision.ticket.release()
+
+    return jsonify(success(result).to_dict())
+
+@data_clerk_api.route('/batchExecuteTasks', methods=['POST'])
+@validate_json_params(
+    businessKey=fields.Str(required=True),
+    taskIds=fields.List(fields.Int(), required=False),
+    taskNames=fields.List(fields.Str(), required=False),
+    paramsList=fields.List(fields.Str(), required=False),
+    concurrency=fields.Int(required=False)
+)
+async def batch_execute_tasks():
+    business_key = g.validated_data['businessKey']
+    task_ids = g.validated_data.get('taskIds')
+    task_names = g.validated_data.get('taskNames')
+    params_list = g.validated_data.get('paramsList')
+    concurrency = g.validated_data.get('concurrency')
+
+    decision = get_admission_controller().try_admit("batchExecuteTasks")
+    if not decision.admitted:
+        return overloaded_json(decision)
+
+    try:
+        data_clerk_service = get_or_create_data_clerk_service(business_key)
+        batch = data_clerk_service.submit_batch_execution(task_ids, task_names, params_list, concurrency)
+    except ValueError as e:
+        return jsonify(failure_with_msg(str(e)).to_dict())
+    finally:
+        # 只在提交时检查负载，作业在后台以低优先级执行
+        decision.ticket.release()
+
+    return jsonify(success(batch).to_dict())
+
+@data_clerk_api.route('/getBatchExecution', methods=['GET'])
+@validate_query_params(
+    batchId=fields.Str(required=True)
+)
+def get_batch_execution():
+    batch_id = g.validated_data['batchId']
+
+    batch = get_batch_execution_manager().get(batch_id)
+    if batch is None:
+        return jsonify(failure_with_msg(f"未找到批次:{batch_id}").to_dict())
+    return jsonify(success(batch).to_dict())
+
 # 中断取消专用
 @data_clerk_api.route('/resumeInterrupt', methods=['POST'])
 @validate_json_params(
@@ -77,11 +164,9 @@ async def resume_interrupt_stream():
     session_id = g.validated_data['sessionId']
     resume_type = g.validated_data['resume_type']
 
-    data_clerk_service = get_or_create_data_clerk_service(business_key)
-
-    event_stream = data_clerk_service.get_event_stream_function(resume_type, session_id, "resume")
-
-    return Response(event_stream(), mimetype='text/event-stream')
+    return admitted_event_stream(
+        "resumeInterruptStream",
+        lambda: get_or_create_data_clerk_service(business_key).get_event_stream_function(resume_type, session_id, "resume"))
 
 @data_clerk_api.route('/getStateProperties', methods=['GET'])
 @validate_query_params(
@@ -108,9 +193,8 @@ def get_state_properties():
 def get_frequently_and_usually_execute_tasks():
     business_key = g.validated_data['businessKey']
 
-    data_clerk_service = get_or_create_data_clerk_service(business_key)
-
-    names = data_clerk_service.get_frequently_and_usually_execute_tasks()
+    # 直接读取任务排行，不需要创建数据员服务
+    names = get_task_ranking().get_frequently_and_usually_execute_tasks(business_key)
 
     result = ResultVo(success=True, result=list(names))
     return jsonify(success(result).to_dict())
@@ -127,9 +211,7 @@ async def question_stream():
     session_id = g.validated_data['sessionId']
     question = g.validated_data['question']
 
-    data_clerk_service = get_or_create_data_clerk_service(business_key)
-
-    event_stream = data_clerk_service.get_event_stream_function(question, session_id, "question")
-
-    return Response(event_stream(), mimetype='text/event-stream')
+    return admitted_event_stream(
+        "questionStream",
+        lambda: get_or_create_data_clerk_service(business_key).get_event_stream_function(question, session_id, "question"))
 
@@ -0,0 +1,64 @@
+import json
+import logging
+
+from quart import Response, jsonify
+
+from model.response import failure_with_msg
+from service.runtime.admission_controller import get_admission_controller, AdmissionDecision
+
+# 过载时返回给前端的提示
+OVERLOAD_MSG = "当前请求过多，请{retry_after}秒后重试"
+
+
+def admitted_event_stream(endpoint: str, create_event_stream) -> Response:
+    """
+    经过准入控制的流式响应，过载时快速返回503
+    :param endpoint: 入口名称
+    :param create_event_stream: 创建流式方法的函数(被接纳后才调用，避免过载时仍创建服务)
+    :return: Response
+    """
+    decision = get_admission_controller().try_admit(endpoint)
+    if not decision.admitted:
+        return overloaded_event_stream(decision)
+
+    ticket = decision.ticket
+    try:
+        # stream_with_context需要在请求上下文中调用
+        event_stream = create_event_stream()()
+    except BaseException:
+        ticket.release()
+        raise
+
+    async def guarded_event_stream():
+        try:
+            async for event in event_stream:
+                ticket.mark_first_event()
+                yield event
+        finally:
+            # 正常结束、异常或客户端断开时都归还
+            ticket.release()
+
+    return Response(guarded_event_stream(), mimetype='text/event-stream')
+
+
+def overloaded_event_stream(decision: AdmissionDecision) -> Response:
+    """
+    过载时的流式响应：503 + Retry-After，body中带有SSE的重连间隔和error事件
+    """
+    logging.warning("请求过载被拒绝，reason:%s, retry_after:%s", decision.reason, decision.retry_after)
+    error = {"code": "overloaded", "reason": decision.reason, "retryAfter": decision.retry_after,
+             "msg": OVERLOAD_MSG.format(retry_after=decision.retry_after)}
+    body = (f"retry: {decision.retry_after * 1000}\n\n"
+            f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+            "event: done\ndata: \n\n")
+    return Response(body, status=503, mimetype='text/event-stream',
+                    headers={"Retry-After": str(decision.retry_after)})
+
+
+def overloaded_json(decision: AdmissionDecision):
+    """
+    过载时的同步接口响应：503 + Retry-After
+    """
+    logging.warning("请求过载被拒绝，reason:%s, retry_after:%s", decision.reason, decision.retry_after)
+    res = failure_with_msg(OVERLOAD_MSG.format(retry_after=decision.retry_after))
+    return jsonify(res.to_dict()), 503, {"Retry-After": str(decision.retry_after)}
@@ -56,6 +56,8 @@ create table if not exists query_data_task
     invoke_times int      default 0                 not null comment '执行次数',
     is_deleted   tinyint  default 0                 not null comment '是否删除',
     execute_time datetime                           null comment '最近执行时间',
+    last_duration_ms int                            null comment '最近一次执行耗时(毫秒)',
+    last_outcome varchar(16)                        null comment '最近一次执行结果',
     constraint uk_bk_name
         unique (business_key, name)
 )
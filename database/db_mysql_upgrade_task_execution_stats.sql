@@ -0,0 +1,5 @@
+-- 已有数据库升级：query_data_task增加最近一次执行耗时和执行结果
+-- (新建的数据库直接使用db_mysql.sql，不需要执行本脚本)
+alter table query_data_task
+    add column last_duration_ms int         null comment '最近一次执行耗时(毫秒)' after execute_time,
+    add column last_outcome     varchar(16) null comment '最近一次执行结果' after last_duration_ms;